@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+import openai
+
+import metrics
+import tokens
+
+# --- KONFIGURATION ---
+# Gemeinsamer OpenAI-Zugang für alle Skripte: ein Async-Client, ein Rate-Limit
+# (Requests UND Tokens pro Minute), Retries mit Jitter bei 429/5xx, identische
+# gleichzeitige Anfragen werden nur einmal gesendet, Verbrauch/Kosten über metrics.
+# Synchrone Skripte nutzen die *_sync Funktionen (eigener Event-Loop im Hintergrund).
+REQUESTS_PER_MINUTE = int(os.getenv("EVKO_OPENAI_RPM", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("EVKO_OPENAI_TPM", "200000"))
+MAX_CONCURRENCY = int(os.getenv("EVKO_OPENAI_CONCURRENCY", "8"))
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5      # Sekunden, verdoppelt sich pro Versuch
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 60.0
+
+
+class TokenBucket:
+    """Klassischer Token-Bucket: `rate` Einheiten pro Sekunde, höchstens `capacity` angespart"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+                metrics.record_span("openai.throttle", wait)
+                await asyncio.sleep(wait)
+
+
+def _is_retryable(e):
+    if isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)): return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+
+def _retry_after(e):
+    """Wartezeit aus dem Retry-After Header (falls vorhanden)"""
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _estimate_tokens(kind, kwargs):
+    if kind == "embeddings":
+        inputs = kwargs.get("input") or []
+        if isinstance(inputs, str): inputs = [inputs]
+        return sum(tokens.count_tokens(t) for t in inputs)
+    prompt = 0
+    for msg in kwargs.get("messages", []):
+        content = msg.get("content")
+        if isinstance(content, str):
+            prompt += tokens.count_tokens(content)
+        else:
+            prompt += sum(tokens.count_tokens(p.get("text", "")) for p in content or [] if p.get("type") == "text")
+            prompt += 85 * sum(1 for p in content or [] if p.get("type") == "image_url")   # detail=low Bild
+    return prompt + (kwargs.get("max_tokens") or 0)
+
+
+class AIClient:
+    def __init__(self, client=None, rpm=REQUESTS_PER_MINUTE, tpm=TOKENS_PER_MINUTE, concurrency=MAX_CONCURRENCY):
+        # Eigene Retries -> die eingebauten des SDK abschalten
+        self.client = client or openai.AsyncOpenAI(max_retries=0, timeout=REQUEST_TIMEOUT)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.inflight = {}
+
+    async def _call(self, kind, kwargs, span):
+        create = self.client.embeddings.create if kind == "embeddings" else self.client.chat.completions.create
+        estimate = _estimate_tokens(kind, kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimate)
+            try:
+                async with self.semaphore:
+                    with metrics.span(span):
+                        response = await create(**kwargs)
+                metrics.record_usage(kwargs.get("model"), response.usage)
+                return response
+            except Exception as e:
+                if not _is_retryable(e) or attempt == MAX_RETRIES:
+                    metrics.inc("openai.errors")
+                    raise
+                # Exponentielles Backoff mit "full jitter", Retry-After hat Vorrang
+                delay = _retry_after(e) or random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                metrics.inc("openai.retries")
+                await asyncio.sleep(delay)
+
+    async def _coalesced(self, kind, kwargs, span):
+        """Identische gleichzeitige Anfragen teilen sich einen Request"""
+        key = hashlib.sha256(json.dumps([kind, kwargs], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        if key in self.inflight:
+            metrics.inc("openai.coalesced")
+            return await asyncio.shield(self.inflight[key])
+        task = asyncio.ensure_future(self._call(kind, kwargs, span))
+        self.inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done(): self.inflight.pop(key, None)
+            else: task.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+    async def chat(self, span="openai.chat", **kwargs):
+        return await self._coalesced("chat", kwargs, span)
+
+    async def embed(self, span="openai.embedding", **kwargs):
+        return await self._coalesced("embeddings", kwargs, span)
+
+
+# --- Gemeinsamer Hintergrund-Loop für synchrone Aufrufer ---
+_loop = None
+_client = None
+_lock = threading.Lock()
+
+
+def _ensure_loop():
+    global _loop, _client
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ai-client", daemon=True).start()
+        if _client is None:
+            # Client im Loop erzeugen (Locks/Semaphore gehören zu diesem Loop)
+            _client = asyncio.run_coroutine_threadsafe(_make_client(), _loop).result()
+    return _loop
+
+
+async def _make_client():
+    return AIClient()
+
+
+def run(coro_fn, *args, **kwargs):
+    """Führt coro_fn(client, ...) im gemeinsamen Loop aus und wartet auf das Ergebnis"""
+    loop = _ensure_loop()
+    return asyncio.run_coroutine_threadsafe(coro_fn(_client, *args, **kwargs), loop).result()
+
+
+def chat_sync(**kwargs):
+    return run(lambda c: c.chat(**kwargs))
+
+
+def embed_sync(**kwargs):
+    return run(lambda c: c.embed(**kwargs))
+
+
+def embed_many_sync(batches, model):
+    """Mehrere Embedding-Batches parallel (im Rahmen des Rate-Limits). Reihenfolge bleibt erhalten."""
+    async def _all(c):
+        return await asyncio.gather(*[c.embed(input=b, model=model) for b in batches])
+    return run(_all)
@@ -0,0 +1,262 @@
+import os
+import json
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+from types import SimpleNamespace
+from datetime import datetime
+
+import metrics
+import profiling
+import ai_client
+
+# --- KONFIGURATION ---
+# Warteschlange für verzögerte AI-Aufrufe: Scraper mit -defer schreiben Events sofort
+# (ohne Plakat-Analyse / Extraktion) und legen hier einen Job ab. Dieses Skript
+# arbeitet die Jobs gesammelt ab - parallel über ai_client oder (-batch) über die
+# OpenAI Batch API (günstiger, Ergebnis kommt beim nächsten Lauf) - und ergänzt die
+# Events in der DB.
+#
+#   pending -> (submitted) -> done | error
+DB_FILE = "evko.db"
+MAX_ATTEMPTS = 3
+DEFAULT_LIMIT = 200
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_WINDOW = "24h"
+BATCH_MAX_BYTES = 100 * 1024 * 1024    # Bewusst halb so groß wie das API-Limit (200 MB pro Eingabedatei)
+BATCH_OPEN = {"validating", "in_progress", "finalizing", "cancelling"}
+BATCH_PRICE_FACTOR = 0.5               # Batch API: halber Preis für Input und Output
+
+
+def init_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS ai_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, url TEXT, payload TEXT, payload_hash TEXT,
+        status TEXT, batch_id TEXT, attempts INTEGER DEFAULT 0, result TEXT, error TEXT,
+        created TIMESTAMP, updated TIMESTAMP, UNIQUE(kind, url)
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs(status)")
+    conn.commit()
+
+
+def enqueue(conn, kind, url, payload):
+    """
+    Legt einen Job an. Gibt es für (kind, url) schon einen Job mit gleichem Payload,
+    passiert nichts (kein zweiter API-Aufruf für unveränderte Inhalte).
+    Tabelle anlegen (init_table) und Commit übernimmt der Aufrufer.
+    """
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    now = datetime.now().isoformat()
+    cur = conn.execute('''INSERT INTO ai_jobs (kind, url, payload, payload_hash, status, attempts, created, updated)
+        VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)
+        ON CONFLICT(kind, url) DO UPDATE SET
+            payload=excluded.payload, payload_hash=excluded.payload_hash, status='pending', attempts=0,
+            batch_id=NULL, result=NULL, error=NULL, updated=excluded.updated
+        WHERE ai_jobs.payload_hash != excluded.payload_hash''',
+        (kind, url, data, hashlib.md5(data.encode('utf-8')).hexdigest(), now, now))
+    metrics.inc("ai_jobs.enqueued", cur.rowcount)
+    return cur.rowcount > 0
+
+
+def _handlers():
+    """kind -> (Request-Body bauen, Ergebnis anwenden). Spät importiert: die Scraper importieren ai_jobs."""
+    import scraper_evko
+    import scraper_kinderwelt
+    return {
+        "vision": (lambda conn, p: scraper_evko.vision_request(p["image_url"], conn), scraper_evko.apply_vision),
+        "extract": (lambda conn, p: scraper_kinderwelt.extract_request(p["text"], p["image_urls"], conn),
+                    scraper_kinderwelt.apply_extraction),
+    }
+
+
+def pending_jobs(conn, limit=DEFAULT_LIMIT):
+    return conn.execute("SELECT id, kind, url, payload, attempts FROM ai_jobs WHERE status = 'pending' ORDER BY id LIMIT ?",
+                        (limit,)).fetchall()
+
+
+def _finish(conn, handlers, job, content):
+    job_id, kind, url, payload, attempts = job
+    try:
+        handlers[kind][1](conn, url, json.loads(payload), content)
+    except Exception as e:
+        _fail(conn, job, f"Anwenden fehlgeschlagen: {e}")
+        return
+    conn.execute("UPDATE ai_jobs SET status = 'done', result = ?, error = NULL, updated = ? WHERE id = ?",
+                 (content, datetime.now().isoformat(), job_id))
+    conn.commit()
+    metrics.inc("ai_jobs.done")
+
+
+def _fail(conn, job, error):
+    """Fehlversuch zählen; nach MAX_ATTEMPTS bleibt der Job auf 'error' (-retry setzt ihn zurück)"""
+    job_id, kind, url, _, attempts = job
+    status = "pending" if attempts + 1 < MAX_ATTEMPTS else "error"
+    conn.execute("UPDATE ai_jobs SET status = ?, attempts = attempts + 1, batch_id = NULL, error = ?, updated = ? WHERE id = ?",
+                 (status, str(error)[:500], datetime.now().isoformat(), job_id))
+    conn.commit()
+    metrics.inc("ai_jobs.failed")
+    print(f"    ⚠️ Job {job_id} ({kind}) fehlgeschlagen: {str(error)[:120]}")
+
+
+def _bodies(conn, handlers, jobs):
+    """Request-Bodies bauen; Jobs, deren Eingaben nicht mehr passen, direkt als Fehler verbuchen"""
+    out = []
+    for job in jobs:
+        try:
+            out.append((job, handlers[job[1]][0](conn, json.loads(job[3]))))
+        except Exception as e:
+            _fail(conn, job, f"Request nicht baubar: {e}")
+    return out
+
+
+def run_concurrent(conn, jobs):
+    """Alle Jobs gleichzeitig über ai_client (Rate-Limit und Retries greifen dort)"""
+    handlers = _handlers()
+    work = _bodies(conn, handlers, jobs)
+
+    async def _one(c, kind, body):
+        try:
+            return await c.chat(span=f"openai.{kind}", **body)
+        except Exception as e:
+            return e
+
+    async def _all(c):
+        return await asyncio.gather(*[_one(c, job[1], body) for job, body in work])
+
+    with metrics.span("ai_jobs.requests"):
+        responses = ai_client.run(_all)
+    for (job, _), response in zip(work, responses):
+        if isinstance(response, Exception): _fail(conn, job, response)
+        else: _finish(conn, handlers, job, response.choices[0].message.content)
+
+
+def submit_batches(conn, jobs):
+    """Jobs als JSONL hochladen und als Batch einreichen (ggf. aufgeteilt nach Dateigröße)"""
+    handlers = _handlers()
+    chunks, lines, size = [], [], 0
+    for job, body in _bodies(conn, handlers, jobs):
+        line = json.dumps({"custom_id": f"job-{job[0]}", "method": "POST", "url": BATCH_ENDPOINT, "body": body},
+                          ensure_ascii=False).encode('utf-8') + b"\n"
+        if lines and size + len(line) > BATCH_MAX_BYTES:
+            chunks.append(lines)
+            lines, size = [], 0
+        lines.append((job, line))
+        size += len(line)
+    if lines: chunks.append(lines)
+
+    async def _submit(c, data):
+        upload = await c.client.files.create(file=("ai_jobs.jsonl", data), purpose="batch")
+        return await c.client.batches.create(input_file_id=upload.id, endpoint=BATCH_ENDPOINT,
+                                             completion_window=BATCH_WINDOW)
+
+    for chunk in chunks:
+        try:
+            batch = ai_client.run(_submit, b"".join(line for _, line in chunk))
+        except Exception as e:
+            print(f"❌ Batch konnte nicht eingereicht werden: {e}")
+            return
+        now = datetime.now().isoformat()
+        conn.executemany("UPDATE ai_jobs SET status = 'submitted', batch_id = ?, updated = ? WHERE id = ?",
+                         [(batch.id, now, job[0]) for job, _ in chunk])
+        conn.commit()
+        metrics.inc("ai_jobs.submitted", len(chunk))
+        print(f"   📤 Batch {batch.id}: {len(chunk)} Jobs eingereicht")
+
+
+def collect_batches(conn):
+    """Fertige Batches abholen und anwenden; noch laufende bleiben für den nächsten Lauf"""
+    handlers = None
+    batch_ids = [r[0] for r in conn.execute("SELECT DISTINCT batch_id FROM ai_jobs WHERE status = 'submitted'")]
+
+    async def _fetch(c, batch_id):
+        batch = await c.client.batches.retrieve(batch_id)
+        lines = []
+        if batch.status not in BATCH_OPEN:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    lines += (await c.client.files.content(file_id)).text.splitlines()
+        return batch, lines
+
+    for batch_id in batch_ids:
+        try:
+            batch, lines = ai_client.run(_fetch, batch_id)
+        except Exception as e:
+            print(f"   ⚠️ Batch {batch_id} nicht abrufbar: {e}")
+            continue
+        if batch.status in BATCH_OPEN:
+            print(f"   ⏳ Batch {batch_id}: {batch.status}")
+            continue
+
+        handlers = handlers or _handlers()
+        results = {}
+        for line in lines:
+            if line.strip():
+                item = json.loads(line)
+                results[item["custom_id"]] = item
+        jobs = conn.execute("SELECT id, kind, url, payload, attempts FROM ai_jobs WHERE status = 'submitted' AND batch_id = ?",
+                            (batch_id,)).fetchall()
+        for job in jobs:
+            item = results.get(f"job-{job[0]}") or {}
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                body = response["body"]
+                # Antwort nennt die Modellversion ("gpt-4o-mini-2024-07-18") -> Preis über den Präfix
+                model = max((m for m in metrics.MODEL_PRICES if (body.get("model") or "").startswith(m)),
+                            key=len, default=body.get("model"))
+                metrics.record_usage(model, SimpleNamespace(**(body.get("usage") or {})), BATCH_PRICE_FACTOR)
+                _finish(conn, handlers, job, body["choices"][0]["message"]["content"])
+            else:
+                _fail(conn, job, item.get("error") or response.get("body") or f"Batch {batch.status}")
+        print(f"   📥 Batch {batch_id}: {batch.status}, {len(jobs)} Jobs verarbeitet")
+
+
+def print_status(conn):
+    rows = conn.execute("SELECT kind, status, COUNT(*) FROM ai_jobs GROUP BY kind, status ORDER BY kind, status").fetchall()
+    if not rows:
+        print("Keine Jobs.")
+    for kind, status, count in rows:
+        print(f"   {kind:<10} {status:<10} {count:>5}")
+
+
+@profiling.profiled("ai_jobs")
+@metrics.track_run("ai_jobs")
+def main():
+    parser = argparse.ArgumentParser(description="Verzögerte AI-Jobs (Plakat-Analyse, Extraktion) abarbeiten")
+    parser.add_argument("-batch", action="store_true", help="Über die OpenAI Batch API einreichen (Ergebnis beim nächsten Lauf)")
+    parser.add_argument("-limit", type=int, default=DEFAULT_LIMIT, help="Maximal so viele Jobs pro Lauf")
+    parser.add_argument("-retry", action="store_true", help="Fehlgeschlagene Jobs erneut versuchen")
+    parser.add_argument("-status", action="store_true", help="Nur Übersicht der Warteschlange anzeigen")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    init_table(conn)
+    if args.status:
+        print_status(conn)
+        conn.close()
+        return
+
+    print(f"--- 🧾 AI-JOBS [{'BATCH' if args.batch else 'DIREKT'}] ---")
+    if not os.getenv("OPENAI_API_KEY"):
+        print("⚠️ Kein OPENAI_API_KEY - Jobs bleiben in der Warteschlange.")
+        conn.close()
+        return
+
+    if args.retry:
+        conn.execute("UPDATE ai_jobs SET status = 'pending', attempts = 0 WHERE status = 'error'")
+        conn.commit()
+
+    collect_batches(conn)
+    jobs = pending_jobs(conn, args.limit)
+    if not jobs:
+        print("✅ Keine offenen Jobs.")
+    elif args.batch:
+        submit_batches(conn, jobs)
+    else:
+        print(f"   {len(jobs)} Jobs...")
+        run_concurrent(conn, jobs)
+    print_status(conn)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import os
+import io
+import json
+import time
+import sqlite3
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import embeddings
+import vector_index
+import snapshot
+import vector_store
+from openai_stub import start_stub, stub_vector
+
+# --- KONFIGURATION ---
+BENCH_DIR = "bench_data"
+DEFAULT_SIZES = "1000,10000"   # Auch möglich: 1000,10000,100000,1000000 (braucht viel Platz!)
+DEFAULT_DIM = 1536
+DEFAULT_MODES = "exact,int8,binary,snapshot,mmap"   # siehe chat.SEARCH_MODE / snapshot.py / vector_store.py
+CORPUS_VERSION = 4             # Bei Schemaänderungen erhöhen (alte Caches werden ignoriert)
+PAST_RATIO = 0.1               # Anteil vergangener Events (werden von search_events gefiltert)
+TAG_POOL = ["Sport", "Handball", "Fussball", "Kinder", "Familie", "Kultur", "Konzert", "Lesung", "Flohmarkt", "Ausstellung"]
+LOC_POOL = ["Werft", "Rathaus", "Stadtsaal", "Franz Guggenberger Sporthalle", "Rattenfängerstadion Korneuburg", "Hauptplatz"]
+# Stub-Vektoren sind isotrop (keine Matryoshka-Struktur): Recall der gekürzten Codes ist
+# damit synthetisch und sagt nichts über echte text-embedding-3 Vektoren aus.
+RECALL_NOTE = "Recall auf synthetischen Stub-Vektoren (isotrop), nicht auf echten Embeddings gemessen"
+
+
+def corpus_path(size, dim, seed):
+    return os.path.join(BENCH_DIR, f"corpus_v{CORPUS_VERSION}_{size}_{dim}_{seed}")
+
+
+def build_corpus(size, dim, seed):
+    """Erzeugt (oder lädt aus dem Cache) eine synthetische events-DB mit Zufallsvektoren"""
+    base = corpus_path(size, dim, seed)
+    db_file, npy_file, meta_file = base + ".db", base + ".npy", base + ".json"
+
+    if os.path.exists(db_file) and os.path.exists(npy_file) and os.path.exists(meta_file):
+        with open(meta_file, "r", encoding="utf-8") as f: meta = json.load(f)
+        return db_file, np.load(npy_file, mmap_mode="r"), meta["urls"]
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    if os.path.exists(db_file): os.remove(db_file)
+    print(f"🏗️  Erzeuge Korpus: {size} Events, {dim} Dimensionen...")
+
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE events (
+        url TEXT PRIMARY KEY, title TEXT, tags TEXT, date_str TEXT, start_iso TEXT,
+        time_str TEXT, location TEXT, description TEXT, image_urls TEXT,
+        content_hash TEXT, last_scraped TIMESTAMP, embedding TEXT, embedding_hash TEXT, embedding_model TEXT,
+        embedding_q BLOB, canonical_url TEXT
+    )''')
+
+    today = datetime.now()
+    future_vectors = np.lib.format.open_memmap(npy_file + ".tmp.npy", mode="w+", dtype=np.float32,
+                                               shape=(size - int(size * PAST_RATIO), dim))
+    urls = []
+    n_future = 0
+    batch = []
+    chunk = 10000
+    for start in range(0, size, chunk):
+        n = min(chunk, size - start)
+        vecs = rng.standard_normal((n, dim)).astype(np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        for j in range(n):
+            i = start + j
+            is_past = i < int(size * PAST_RATIO)
+            day = today + timedelta(days=(-1 - i % 300) if is_past else (i % 365))
+            iso = day.strftime("%Y-%m-%d")
+            url = f"bench_{i}"
+            tags = ", ".join(sorted({TAG_POOL[i % len(TAG_POOL)], TAG_POOL[(i * 7) % len(TAG_POOL)]}))
+            batch.append((url, f"Event {i}", tags, iso, iso, f"{10 + i % 10}:00", LOC_POOL[i % len(LOC_POOL)],
+                          f"Beschreibung für Event {i}. " * 20, "", str(i), today.isoformat(),
+                          json.dumps(vecs[j].tolist()), str(i), embeddings.LEGACY_MODEL_ID,
+                          vector_index.encode(vecs[j], embeddings.LEGACY_MODEL_ID), None))
+            if not is_past:
+                future_vectors[n_future] = vecs[j]
+                urls.append(url)
+                n_future += 1
+        c.executemany("INSERT INTO events VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", batch)
+        conn.commit()
+        batch = []
+        print(f"   ... {start + n}/{size}")
+
+    conn.close()
+    future_vectors.flush()
+    del future_vectors
+    os.replace(npy_file + ".tmp.npy", npy_file)
+    with open(meta_file, "w", encoding="utf-8") as f: json.dump({"urls": urls}, f)
+    return db_file, np.load(npy_file, mmap_mode="r"), urls
+
+
+def brute_force_top_k(matrix, urls, query_vec, k):
+    """Exakte Referenz: Skalarprodukt über die komplette Matrix (blockweise)"""
+    scores = np.empty(matrix.shape[0], dtype=np.float32)
+    block = 50000
+    for s in range(0, matrix.shape[0], block):
+        scores[s:s + block] = np.asarray(matrix[s:s + block]) @ query_vec
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return {urls[i] for i in top}
+
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) * 1000 if values else 0.0
+
+
+def storage_per_event(db_file):
+    """Durchschnittliche Bytes pro Event: voller JSON-Vektor vs. quantisierter Code"""
+    conn = sqlite3.connect(db_file)
+    full, quant = conn.execute("SELECT AVG(length(embedding)), AVG(length(embedding_q)) FROM events").fetchone()
+    conn.close()
+    return full or 0.0, quant or 0.0
+
+
+def run_size(chat, size, mode, args):
+    db_file, matrix, urls = build_corpus(size, args.dim, args.seed)
+    chat.DB_FILE = db_file
+    chat.SNAPSHOT_FILE = None
+    chat.VECTOR_STORE = None
+    search_mode = mode
+    if mode == "snapshot":
+        chat.SNAPSHOT_FILE = db_file[:-len(".db")] + ".read.db"
+        snapshot.build(db_file, chat.SNAPSHOT_FILE)
+    elif mode == "mmap":
+        # Exakte Suche, Vektoren aber aus dem memmap-Store statt JSON
+        chat.VECTOR_STORE = db_file[:-len(".db")] + ".vec"
+        conn = sqlite3.connect(db_file)
+        model = conn.execute("SELECT embedding_model FROM events WHERE embedding_model IS NOT NULL LIMIT 1").fetchone()[0]
+        vector_store.sync(conn, model, chat.VECTOR_STORE)
+        conn.close()
+        search_mode = "exact"
+
+    queries = [f"Testfrage {i}: Was ist los am Wochenende?" for i in range(args.queries)]
+    totals = []
+    phases = {}
+    recalls = []
+
+    for i, q in enumerate(queries):
+        timings = {}
+        t0 = time.perf_counter()
+        result = chat.search_events(q, top_k=args.k, timings=timings, mode=search_mode)
+        total = time.perf_counter() - t0
+        if i < args.warmup: continue
+
+        totals.append(total)
+        for name, val in timings.items():
+            if name in ("rows", "candidates"): continue
+            phases.setdefault(name, []).append(val)
+
+        truth = brute_force_top_k(matrix, urls, stub_vector(q, args.dim), args.k)
+        found = {r['url'] for r in result}
+        recalls.append(len(found & truth) / max(1, len(truth)))
+
+    full_bytes, code_bytes = storage_per_event(db_file)
+    report = {
+        "size": size,
+        "mode": mode,
+        "candidates": len(urls),
+        "bytes_per_event": full_bytes if mode == "exact" else (args.dim * 4 if mode in ("snapshot", "mmap") else code_bytes),
+        "queries": len(totals),
+        "total_p50_ms": percentile(totals, 50),
+        "total_p95_ms": percentile(totals, 95),
+        "phases_p50_ms": {name: percentile(vals, 50) for name, vals in phases.items()},
+        f"recall@{args.k}": float(np.mean(recalls)) if recalls else 0.0,
+        "recall_vectors": "synthetic",
+    }
+
+    if args.chat:
+        chat_times = []
+        for q in queries[:min(5, len(queries))]:
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                chat.chat_with_data(q)
+            chat_times.append(time.perf_counter() - t0)
+        report["chat_p50_ms"] = percentile(chat_times, 50)
+
+    return report
+
+
+def print_report(reports, k):
+    phase_names = ["db_read", "embed", "parse", "score", "sort", "rerank", "fetch"]
+    print(f"\n{'ROWS':>9} | {'MODE':>8} | {'B/EVENT':>8} | {'P50 ms':>9} | {'P95 ms':>9} | " + " | ".join(f"{p:>8}" for p in phase_names) + f" | {'RECALL@' + str(k) + '*':>9}")
+    print("-" * 140)
+    for r in reports:
+        ph = r["phases_p50_ms"]
+        print(f"{r['size']:>9} | {r['mode']:>8} | {r['bytes_per_event']:>8.0f} | {r['total_p50_ms']:>9.1f} | {r['total_p95_ms']:>9.1f} | "
+              + " | ".join(f"{ph.get(p, 0):>8.1f}" for p in phase_names)
+              + f" | {r[f'recall@{k}']:>9.3f}"
+              + (f" | Chat: {r['chat_p50_ms']:.1f} ms" if "chat_p50_ms" in r else ""))
+    print(f"* {RECALL_NOTE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EVKO Retrieval Benchmark (mit lokalem OpenAI-Stub)")
+    parser.add_argument("-sizes", default=DEFAULT_SIZES, help="Kommagetrennte Korpusgrößen, z.B. 1000,10000,100000,1000000")
+    parser.add_argument("-dim", type=int, default=DEFAULT_DIM, help="Vektordimension")
+    parser.add_argument("-queries", type=int, default=20, help="Anzahl Testfragen pro Korpus")
+    parser.add_argument("-warmup", type=int, default=2, help="Nicht gemessene Aufwärm-Anfragen")
+    parser.add_argument("-modes", default=DEFAULT_MODES, help="Kommagetrennte Suchmodi (exact, int8, binary, snapshot, mmap)")
+    parser.add_argument("-k", type=int, default=5, help="Top-K für Suche und Recall")
+    parser.add_argument("-seed", type=int, default=42)
+    parser.add_argument("-latency", type=float, default=0.0, help="Künstliche Stub-Latenz in Sekunden")
+    parser.add_argument("-chat", action="store_true", help="Zusätzlich chat_with_data Ende-zu-Ende messen")
+    parser.add_argument("-json", help="Ergebnis zusätzlich als JSON speichern")
+    args = parser.parse_args()
+
+    # Stub starten, BEVOR chat.py den OpenAI-Client baut
+    server, base_url = start_stub(dim=args.dim, latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+    import chat
+
+    print(f"--- BENCHMARK search_events (Stub: {base_url}) ---")
+    reports = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            reports.append(run_size(chat, size, mode, args))
+
+    print_report(reports, args.k)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n💾 Ergebnis gespeichert: {args.json}")
+
+    server.shutdown()
+    print("--- ENDE ---")
+
+
+if __name__ == "__main__":
+    main()
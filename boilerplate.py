@@ -0,0 +1,107 @@
+import sqlite3
+import hashlib
+import argparse
+
+# --- KONFIGURATION ---
+DB_FILE = "evko.db"
+AI_MARKER = "--- ZUSATZINFO AUS PLAKAT ---"
+# Eine Zeile gilt als Template (Navigation, Footer, ...), wenn sie auf mindestens
+# TEMPLATE_RATIO aller gelernten Seiten einer Website vorkommt.
+TEMPLATE_RATIO = 0.6
+MIN_PAGES = 8   # Vorher wird nichts entfernt (zu wenig Statistik)
+
+_template_cache = {}
+
+
+def init_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS boilerplate_lines (
+        site TEXT, line_hash TEXT, pages INTEGER DEFAULT 0,
+        PRIMARY KEY (site, line_hash)
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS boilerplate_pages (
+        site TEXT, url TEXT, PRIMARY KEY (site, url)
+    )''')
+    conn.commit()
+
+
+def _norm(line):
+    return " ".join(line.split())
+
+
+def _line_hash(line):
+    return hashlib.md5(_norm(line).encode('utf-8')).hexdigest()
+
+
+def learn(conn, site, url, text):
+    """Zählt die Zeilen einer Seite (jede URL nur einmal) für die Template-Erkennung"""
+    if conn.execute("SELECT 1 FROM boilerplate_pages WHERE site = ? AND url = ?", (site, url)).fetchone():
+        return
+    hashes = {_line_hash(l) for l in text.split("\n") if _norm(l)}
+    conn.execute("INSERT INTO boilerplate_pages (site, url) VALUES (?, ?)", (site, url))
+    conn.executemany('''INSERT INTO boilerplate_lines (site, line_hash, pages) VALUES (?, ?, 1)
+                        ON CONFLICT(site, line_hash) DO UPDATE SET pages = pages + 1''',
+                     [(site, h) for h in hashes])
+    conn.commit()
+    _template_cache.pop(site, None)
+
+
+def template_lines(conn, site):
+    """Menge der Zeilen-Hashes, die zum Seiten-Template gehören"""
+    if site not in _template_cache:
+        total = conn.execute("SELECT COUNT(*) FROM boilerplate_pages WHERE site = ?", (site,)).fetchone()[0]
+        if total < MIN_PAGES:
+            _template_cache[site] = set()
+        else:
+            rows = conn.execute("SELECT line_hash FROM boilerplate_lines WHERE site = ? AND pages >= ?",
+                                (site, TEMPLATE_RATIO * total)).fetchall()
+            _template_cache[site] = {r[0] for r in rows}
+    return _template_cache[site]
+
+
+def strip(conn, site, text):
+    """Entfernt gelernte Template-Zeilen. Bleibt nichts übrig, wird der Originaltext behalten."""
+    template = template_lines(conn, site)
+    if not template or not text: return text
+    kept = [l for l in text.split("\n") if _norm(l) and _line_hash(l) not in template]
+    return "\n".join(kept) if kept else text
+
+
+def strip_description(conn, site, description):
+    """Wie strip(), lässt aber den AI-Plakat-Teil unangetastet"""
+    if not description: return description
+    main, sep, ai_part = description.partition(AI_MARKER)
+    cleaned = strip(conn, site, main.rstrip("\n"))
+    return cleaned + ("\n\n" + sep + ai_part if sep else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Boilerplate-Erkennung für gespeicherte Beschreibungen")
+    parser.add_argument("-site", default="evko", help="Website-Schlüssel (Standard: evko)")
+    parser.add_argument("-apply", action="store_true", help="Bereits gespeicherte Beschreibungen bereinigen")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    init_table(conn)
+    total = conn.execute("SELECT COUNT(*) FROM boilerplate_pages WHERE site = ?", (args.site,)).fetchone()[0]
+    template = template_lines(conn, args.site)
+    print(f"--- 🧹 BOILERPLATE [{args.site}] ---")
+    print(f"   Gelernte Seiten: {total} | Template-Zeilen: {len(template)}")
+
+    if args.apply and template:
+        # Nur Events dieser Quelle (events.source, siehe scheduler.py)
+        rows = conn.execute("SELECT url, description FROM events WHERE source = ?", (args.site,)).fetchall()
+        saved = 0
+        changed = 0
+        for url, desc in rows:
+            cleaned = strip_description(conn, args.site, desc)
+            if cleaned != desc:
+                conn.execute("UPDATE events SET description = ? WHERE url = ?", (cleaned, url))
+                saved += len(desc) - len(cleaned)
+                changed += 1
+        conn.commit()
+        print(f"   ✅ {changed} Beschreibungen bereinigt ({saved / 1024:.1f} KB gespart).")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,44 @@
 import sqlite3
 from datetime import datetime
 import os
-import json
+import hashlib
+from collections import Counter
+import metrics
+import profiling
+import neighbors
+import dedup
+import feed
+import publish
+import search_index
+import images
+import vector_store
+import tenants
+import export
 
 # --- KONFIGURATION ---
 DB_FILE = "evko.db"
 HTML_FILE = "index.html"
 JSON_FILE = "events.json"
 AI_MARKER = "--- ZUSATZINFO AUS PLAKAT ---"
+SIMILAR_IN_HTML = 3   # So viele ähnliche Events pro Zeile im HTML (im JSON: neighbors.NEIGHBORS_K)
+# Vorschaubilder liegen in images/ neben index.html, dist/index.html liegt eine Ebene tiefer.
+# Im HTML steht zuerst ein Platzhalter, beim Schreiben wird er durch den Pfad pro Ausgabe ersetzt.
+IMAGE_TOKEN = "@@IMG@@"
+DIST_IMAGE_PREFIX = os.path.relpath(".", publish.DIST_DIR) + "/"
 
-def get_subtle_color(text):
-    """Generiert eine konsistente, sehr helle Pastellfarbe basierend auf dem Text."""
-    if not text: return "#f0f0f0"
+def tag_hue(text):
+    """Konsistenter Farbton (0-359) basierend auf dem Text."""
     hash_val = sum(ord(c) for c in text)
-    hue = (hash_val * 37) % 360
+    return (hash_val * 37) % 360
+
+def tag_color_css(hues):
+    """Eine CSS-Klasse pro verwendetem Farbton statt style-Attribut an jedem Tag"""
     # 60% Sättigung, 96% Helligkeit -> Sehr dezent
-    return f"hsl({hue}, 60%, 96%)"
+    return "\n".join(f"        .h{hue} {{ background-color: hsl({hue}, 60%, 96%); }}" for hue in sorted(hues))
+
+def event_anchor(url):
+    """Stabile HTML-ID für eine Event-Zeile (für Links auf ähnliche Events)"""
+    return "e-" + hashlib.md5(url.encode('utf-8')).hexdigest()[:10]
 
 def format_date_german(iso_date):
     """Wandelt YYYY-MM-DD in DD.MM.YYYY um"""
@@ -25,6 +48,8 @@ def format_date_german(iso_date):
     except:
         return iso_date
 
+@profiling.profiled("builder")
+@metrics.track_run("builder")
 def main():
     print("--- START BUILDER (No-Chat Edition) ---")
     if not os.path.exists(DB_FILE):
@@ -34,29 +59,62 @@ def main():
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row # Zugriff über Spaltennamen ermöglichen
     c = conn.cursor()
+    dedup.init_column(conn)
+    images.init_tables(conn)
     
     today_iso = datetime.now().strftime("%Y-%m-%d")
     
-    # 1. Daten abfragen
+    # 1. Daten abfragen (Duplikate nur einmal, über das kanonische Event)
     try:
-        c.execute("""
-            SELECT date_str, title, tags, location, url, description, time_str, embedding 
+        c.execute(f"""
+            SELECT date_str, title, tags, location, url, description, time_str, image_urls, embedding_model, embedding_hash 
             FROM events 
-            WHERE start_iso >= ? 
+            WHERE start_iso >= ? AND {dedup.VISIBLE_CONDITION}
             ORDER BY start_iso ASC, time_str ASC
         """, (today_iso,))
     except sqlite3.OperationalError:
         print("WARNUNG: Spalte 'embedding' fehlt in der DB. (embedder.py ausführen!)")
         print("Erstelle JSON ohne Vektoren...")
-        c.execute("""
-            SELECT date_str, title, tags, location, url, description, time_str, NULL as embedding
+        c.execute(f"""
+            SELECT date_str, title, tags, location, url, description, time_str, image_urls, NULL as embedding_model, NULL as embedding_hash
             FROM events 
-            WHERE start_iso >= ? 
+            WHERE start_iso >= ? AND {dedup.VISIBLE_CONDITION}
             ORDER BY start_iso ASC, time_str ASC
         """, (today_iso,))
     
-    rows = c.fetchall()
-    conn.close()
+    with metrics.span("db.read"):
+        rows = c.fetchall()
+        # Weitere Quellen desselben Events (von dedup.py zugeordnet)
+        duplicates = {}
+        for canonical, url in c.execute("SELECT canonical_url, url FROM events WHERE canonical_url IS NOT NULL AND canonical_url != url"):
+            duplicates.setdefault(canonical, []).append(url)
+    metrics.inc("events.published", len(rows))
+
+    # 2. Vektoren (für JSON und Nachbarn): aus dem Vektor-Store, nur Fehlendes wird als JSON geparst
+    vectors = {}
+    by_model = {}
+    for row in rows:
+        if row['embedding_model'] and row['embedding_hash']:
+            by_model.setdefault(row['embedding_model'], []).append(row)
+    with metrics.span("vectors.load"):
+        for model, model_rows in by_model.items():
+            matrix = vector_store.load(conn, [r['url'] for r in model_rows], [r['embedding_hash'] for r in model_rows], model)
+            vectors.update({r['url']: matrix[i] for i, r in enumerate(model_rows) if matrix[i].any()})
+
+    # Verweise auf die Vektor-Chunks des Text-Exports (data/vectors/<sha256>.npy, Zeile) für JSON und Feed
+    with metrics.span("vectors.refs"):
+        vector_refs = export.vector_refs(conn)
+
+    # 3. Ähnliche Events (nur Vektoren des häufigsten Modells sind vergleichbar)
+    models = Counter(row['embedding_model'] for row in rows if row['url'] in vectors)
+    similar = {}
+    if models:
+        model = models.most_common(1)[0][0]
+        items = [(row['url'], f"{model}:{row['embedding_hash']}" if row['embedding_hash'] else None, vectors[row['url']])
+                 for row in rows if row['url'] in vectors and row['embedding_model'] == model]
+        with metrics.span("neighbors"):
+            similar = neighbors.update(conn, items)
+    titles = {row['url']: row['title'] for row in rows}
 
     print(f"Verarbeite {len(rows)} Events...")
 
@@ -66,7 +124,7 @@ def main():
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Korneuburg Events</title>
+    <title>{tenants.current()['name']} Events</title>
     <style>
         body {{ background-color: #fff; color: #111; font-family: "Courier New", monospace; padding: 20px; margin: 0; }}
         .container {{ max-width: 950px; margin: 0 auto; }}
@@ -97,13 +155,21 @@ def main():
         /* Links & Text */
         .title a {{ font-size: 1.1em; font-weight: bold; color: #000; text-decoration: none; }}
         .title a:hover {{ text-decoration: underline; }}
+        .thumb {{ float: right; width: 80px; margin-left: 10px; border: 1px solid #ddd; }}
+        .time {{ font-weight: normal; font-size: 0.85em; color: #666; }}
+        /* TAG-FARBEN */
+        .similar {{ margin-top: 6px; font-size: 0.75em; color: #666; }}
+        .similar a {{ color: #444; }}
+        tr:target {{ background-color: #fff8dc; }}
         .ai-hint {{ cursor: help; font-size: 14px; text-decoration: none; margin-left: 5px; opacity: 0.6; }}
         
+{search_index.SEARCH_CSS}
         footer {{ margin-top: 40px; padding-top: 10px; border-top: 2px solid #000; text-align: right; font-size: 0.75em; color: #555; }}
     </style>
 </head>
 <body>
     <div class="container">
+{search_index.SEARCH_FORM}
         <table>
             <thead>
                 <tr>
@@ -116,6 +182,8 @@ def main():
     """
 
     json_data = []
+    row_html = []
+    used_hues = set()
 
     for row in rows:
         # Daten aus Row extrahieren
@@ -126,7 +194,6 @@ def main():
         url = row['url']
         desc = row['description']
         time_str = row['time_str']
-        emb_json = row['embedding']
 
         # 1. Beschreibung bereinigen & AI Tooltip erstellen
         clean_desc = desc or ""
@@ -144,46 +211,61 @@ def main():
                     safe_ai = ai_text.replace('"', '&quot;').replace('\n', ' &#10; ')
                     ai_tooltip = f'<span class="ai-hint" title="KI-Infos vom Plakat:&#10;{safe_ai}">ℹ️</span>'
 
-        # 2. Vektor parsen (für JSON)
-        vector = []
-        if emb_json:
-            try:
-                vector = json.loads(emb_json)
-            except:
-                vector = []
+        similar_urls = similar.get(url, [])
 
-        # 3. HTML Datum formatieren (Schön machen!)
+        # Lokale Vorschaubilder (images.py) statt Bilder von der Quelle
+        first_img = (row['image_urls'] or "").split(",")[0].strip()
+        thumbs = images.thumbnails(conn, first_img) if first_img else {}
+        thumb_html = ""
+        if thumbs:
+            small = images.site_thumbnail(thumbs)
+            thumb_src = small.get("webp") or next(iter(small.values()))
+            thumb_html = f'<img class="thumb" src="{IMAGE_TOKEN}{thumb_src}" alt="" loading="lazy" decoding="async">'
+            if "avif" in small and thumb_src != small["avif"]:
+                thumb_html = f'<picture><source type="image/avif" srcset="{IMAGE_TOKEN}{small["avif"]}">{thumb_html}</picture>'
+
+        # 2. HTML Datum formatieren (Schön machen!)
         nice_date = format_date_german(date_iso)
         
         display_date = nice_date
         if time_str and time_str != "00:00":
-            display_date += f"<br><span style='font-weight:normal; font-size:0.85em; color:#666;'>{time_str} Uhr</span>"
+            display_date += f'<br><span class="time">{time_str} Uhr</span>'
 
-        # 4. Tags HTML bauen (mit Pastellfarben)
+        # 3. Tags HTML bauen (mit Pastellfarben)
         tags_html = ""
         tag_list = []
         if tags_str:
             tag_list = [t.strip() for t in tags_str.split(",") if t.strip()]
             for tag in tag_list:
-                bg_color = get_subtle_color(tag)
-                tags_html += f'<span class="tag" style="background-color: {bg_color};">{tag}</span>'
+                hue = tag_hue(tag)
+                used_hues.add(hue)
+                tags_html += f'<span class="tag h{hue}">{tag}</span>'
             
             if tags_html:
                 tags_html = f'<div class="tags-container">{tags_html}</div>'
 
-        # 5. Tabellenzeile hinzufügen
-        html_content += f"""
-                <tr>
+        # 4. Ähnliche Events verlinken
+        similar_html = ""
+        if similar_urls:
+            links = ", ".join(f'<a href="#{event_anchor(u)}">{titles.get(u, u)}</a>' for u in similar_urls[:SIMILAR_IN_HTML])
+            similar_html = f'<div class="similar">Ähnlich: {links}</div>'
+
+        # 5. Tabellenzeile (die ersten direkt ins HTML, alle für die Suche/Nachladen)
+        row_html.append(publish.minify_html(f"""
+                <tr id="{event_anchor(url)}">
                     <td class="col-date">{display_date}</td>
                     <td>
-                        <div class="title"><a href="{url}" target="_blank">{title}</a> {ai_tooltip}</div>
+                        {thumb_html}<div class="title"><a href="{url}" target="_blank">{title}</a> {ai_tooltip}</div>
                         {tags_html}
+                        {similar_html}
                     </td>
                     <td class="col-loc">{location}</td>
                 </tr>
-        """
+        """))
+        if len(row_html) <= search_index.INITIAL_ROWS:
+            html_content += row_html[-1]
         
-        # 6. JSON Datensatz erstellen (inkl. Embedding für n8n)
+        # 6. JSON Datensatz erstellen (Embedding für n8n als Verweis "sha256:zeile" auf data/vectors/<sha256>.npy)
         json_data.append({
             "date": date_iso, 
             "nice_date": nice_date, 
@@ -193,31 +275,58 @@ def main():
             "tags": tag_list,
             "url": url,
             "description": clean_desc,
-            "embedding": vector
+            "thumbnails": thumbs,
+            "similar": similar_urls,
+            "duplicates": sorted(duplicates.get(url, [])),
+            "vector": vector_refs.get(url),
+            "embedding_model": row['embedding_model'] if url in vector_refs else None
         })
 
     html_content += f"""
             </tbody>
         </table>
+        <div id="more"></div>
+        <noscript>Ohne JavaScript werden nur die ersten {search_index.INITIAL_ROWS} Events angezeigt (alle: {JSON_FILE}).</noscript>
         <footer>
             Stand: {datetime.now().strftime('%d.%m.%Y %H:%M')} | {len(rows)} Events
         </footer>
     </div>
+    {search_index.embed_json(search_index.build(json_data, row_html))}
+    {search_index.SCRIPT}
 </body>
 </html>
     """
 
-    # HTML Speichern
-    with open(HTML_FILE, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    html_content = html_content.replace("        /* TAG-FARBEN */", tag_color_css(used_hues))
+
+    # HTML Speichern (minifiziert)
+    with metrics.span("write.html"):
+        html_content = publish.minify_html(html_content)
+        html_bytes = html_content.replace(IMAGE_TOKEN, "").encode('utf-8')
+        with open(HTML_FILE, "wb") as f:
+            f.write(html_bytes)
 
-    # JSON Speichern
-    with open(JSON_FILE, "w", encoding="utf-8") as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
+    # JSON Speichern (kompakt)
+    with metrics.span("write.json"):
+        json_bytes = publish.compact_json(json_data).encode('utf-8')
+        with open(JSON_FILE, "wb") as f:
+            f.write(json_bytes)
+
+    # Vorkomprimierte Artefakte mit Content-Hash (dist/, siehe publish.py)
+    with metrics.span("write.dist"):
+        dist_html = html_content.replace(IMAGE_TOKEN, DIST_IMAGE_PREFIX).encode('utf-8')
+        publish.publish({HTML_FILE: dist_html, JSON_FILE: json_bytes})
+
+    # Delta-Feed (nur Änderungen seit dem letzten Lauf, siehe feed.py)
+    with metrics.span("write.feed"):
+        feed.publish(conn, json_data, JSON_FILE)
+    conn.close()
 
     print(f"✅ Builder fertig.")
     print(f"   - HTML: {HTML_FILE}")
     print(f"   - JSON: {JSON_FILE} (Größe: {os.path.getsize(JSON_FILE)/1024:.1f} KB)")
+    print(f"   - Feed: {feed.FEED_DIR}/{feed.INDEX_FILE}")
+    print(f"   - Dist: {publish.DIST_DIR}/{publish.MANIFEST_FILE}")
 
 if __name__ == "__main__":
     main()
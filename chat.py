@@ -1,92 +1,423 @@
 import sqlite3
 import json
 import numpy as np
-from openai import OpenAI
 import os
+import time
+import bisect
+import argparse
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import metrics
+import profiling
+import embeddings
+import vector_index
+import dedup
+import ai_client
+import context
+import sessions
+import snapshot
+import vector_store
+import tenants
 
 DB_FILE = "evko.db"
-client = OpenAI()
+# exact = alle vollen Vektoren | int8 / binary = Vorauswahl über Codes + exakte Nachbewertung.
+# Standard exact: der Recall-Verlust der Codes ist nur auf synthetischen Stub-Vektoren gemessen
+# (bench_search), int8/binary daher nur explizit per EVKO_SEARCH_MODE.
+SEARCH_MODE = os.getenv("EVKO_SEARCH_MODE", "exact")
+# Ohne expliziten Modus wird der Lese-Snapshot (snapshot.py) genutzt, falls vorhanden
+SNAPSHOT_FILE = snapshot.SNAPSHOT_FILE
+# Exakte Suche liest die Vektoren aus dem Vektor-Store (memmap), falls vorhanden
+VECTOR_STORE = vector_store.STORE_FILE
+CONTEXT_CANDIDATES = 20   # Suchtreffer, aus denen context.py unter Token-Budget auswählt
+SHARD_WORKERS = 8         # Parallele Suchen bei Anfragen über mehrere Mandanten
+_backend = None
 
+def get_backend():
+    """Embedding-Backend für Suchanfragen (EVKO_EMBED_BACKEND), muss zum Backend des Embedders passen"""
+    global _backend
+    if _backend is None:
+        _backend = embeddings.get_backend(embeddings.DEFAULT_BACKEND)
+    return _backend
+
+@lru_cache(maxsize=256)
 def get_embedding(text):
-    return client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
+    # Gecacht: Suche und Kontext-Auswahl brauchen denselben Anfrage-Vektor
+    return get_backend().embed([text])[0]
 
 def cosine_similarity(a, b):
-    # Da OpenAI Embeddings normalisiert sind, reicht das Dot-Product
+    # Da die Embeddings (OpenAI und lokal) normalisiert sind, reicht das Dot-Product
     return np.dot(a, b)
 
-def search_events(query, top_k=5):
+def search_events(query, top_k=5, timings=None, mode=None, query_vector=None):
+    """
+    Semantische Suche. Optional werden die Phasenzeiten (Sekunden) in `timings` eingetragen.
+    `query_vector` ersetzt das Einbetten von `query` (z.B. laufender Vektor einer Chat-Session).
+    """
+    if mode in (None, "snapshot"):
+        snap = snapshot.current(SNAPSHOT_FILE)
+        if snap is not None:
+            return search_snapshot(snap, query, top_k, timings, query_vector)
+        mode = SEARCH_MODE
+    if mode != "exact":
+        try:
+            return search_events_quantized(query, top_k, timings, mode, query_vector)
+        except sqlite3.OperationalError:
+            pass  # Spalte embedding_q fehlt noch (embedder.py ausführen) -> exakte Suche
+    if vector_store.current(VECTOR_STORE) is not None:
+        return search_events_mmap(query, top_k, timings, query_vector)
+    t0 = time.perf_counter()
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
-    # Nur zukünftige Events laden
+    # Nur zukünftige (kanonische) Events laden, deren Vektor vom selben Modell stammt wie die Anfrage
     today = datetime.now().strftime("%Y-%m-%d")
-    c.execute("SELECT * FROM events WHERE embedding IS NOT NULL AND start_iso >= ?", (today,))
+    c.execute(f"SELECT * FROM events WHERE embedding IS NOT NULL AND start_iso >= ? AND embedding_model = ? AND {dedup.VISIBLE_CONDITION}",
+              (today, get_backend().model_id))
     rows = c.fetchall()
     conn.close()
+    t_read = time.perf_counter()
 
     if not rows: return []
 
     # Query einbetten
-    query_vector = get_embedding(query)
+    if query_vector is None: query_vector = get_embedding(query)
+    t_embed = time.perf_counter()
+
+    # Vektoren parsen
+    vectors = [json.loads(row['embedding']) for row in rows]
+    t_parse = time.perf_counter()
 
     # Ähnlichkeiten berechnen
     results = []
-    for row in rows:
-        event_vector = json.loads(row['embedding'])
+    for row, event_vector in zip(rows, vectors):
         score = cosine_similarity(query_vector, event_vector)
         results.append((score, row))
+    t_score = time.perf_counter()
 
     # Sortieren (höchster Score zuerst) und Top K zurückgeben
     results.sort(key=lambda x: x[0], reverse=True)
+    t_sort = time.perf_counter()
+
+    for name, start, end in (("search.db_read", t0, t_read), ("search.parse", t_embed, t_parse),
+                             ("search.score", t_parse, t_score), ("search.sort", t_score, t_sort)):
+        metrics.record_span(name, end - start)
+
+    if timings is not None:
+        timings.update({
+            "db_read": t_read - t0,
+            "embed": t_embed - t_read,
+            "parse": t_parse - t_embed,
+            "score": t_score - t_parse,
+            "sort": t_sort - t_score,
+            "rows": len(rows),
+        })
     return [r[1] for r in results[:top_k]]
 
-def chat_with_data(user_question):
+def search_events_mmap(query, top_k, timings=None, query_vector=None):
+    """Exakte Suche mit Vektoren aus dem Vektor-Store (memmap): kein JSON-Parsen, nur Treffer-Zeilen laden"""
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = conn.execute(f"""SELECT url, embedding_hash FROM events WHERE embedding IS NOT NULL AND start_iso >= ?
+                            AND embedding_model = ? AND {dedup.VISIBLE_CONDITION}""",
+                        (today, get_backend().model_id)).fetchall()
+    t_read = time.perf_counter()
+
+    if not rows:
+        conn.close()
+        return []
+
+    if query_vector is None: query_vector = get_embedding(query)
+    t_embed = time.perf_counter()
+
+    # Neue/geänderte Events, die noch nicht im Store sind, kommen als JSON dazu
+    scores = vector_store.scores(conn, [row['url'] for row in rows], [row['embedding_hash'] for row in rows],
+                                 query_vector, get_backend().model_id, VECTOR_STORE)
+    k = min(top_k, len(rows))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    t_score = time.perf_counter()
+
+    urls = [rows[i]['url'] for i in top]
+    by_url = {row['url']: row for row in conn.execute(f"SELECT * FROM events WHERE url IN ({','.join('?' * len(urls))})", urls)}
+    conn.close()
+    t_fetch = time.perf_counter()
+
+    for name, start, end in (("search.db_read", t0, t_read), ("search.score", t_embed, t_score),
+                             ("search.fetch", t_score, t_fetch)):
+        metrics.record_span(name, end - start)
+
+    if timings is not None:
+        timings.update({
+            "db_read": t_read - t0,
+            "embed": t_embed - t_read,
+            "score": t_score - t_embed,
+            "fetch": t_fetch - t_score,
+            "rows": len(rows),
+        })
+    return [by_url[u] for u in urls if u in by_url]
+
+def search_snapshot(snap, query, top_k, timings=None, query_vector=None):
+    """Suche im Lese-Snapshot: ein Matrix-Produkt über den Vektorblock, danach nur die Treffer-Zeilen laden"""
+    t0 = time.perf_counter()
+    block = snap.blocks.get(get_backend().model_id)
+    if block is None: return []
+    matrix, starts = block
+    # Block ist nach Datum sortiert -> "ab heute" ist ein Suffix
+    first = bisect.bisect_left(starts, datetime.now().strftime("%Y-%m-%d"))
+    t_read = time.perf_counter()
+    if first >= len(starts): return []
+
+    if query_vector is None: query_vector = get_embedding(query)
+    t_embed = time.perf_counter()
+
+    scores = matrix[first:] @ np.asarray(query_vector, dtype=np.float32)
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])] + first
+    t_score = time.perf_counter()
+
+    rows = snap.conn.execute(f"SELECT * FROM events WHERE embedding_model = ? AND vec_row IN ({','.join('?' * len(top))})",
+                             [get_backend().model_id] + [int(i) for i in top]).fetchall()
+    by_row = {row['vec_row']: row for row in rows}
+    result = [dict(by_row[i], vector=matrix[i]) for i in top if i in by_row]
+    t_fetch = time.perf_counter()
+
+    for name, start, end in (("search.db_read", t0, t_read), ("search.score", t_embed, t_score),
+                             ("search.fetch", t_score, t_fetch)):
+        metrics.record_span(name, end - start)
+
+    if timings is not None:
+        timings.update({
+            "db_read": t_read - t0,
+            "embed": t_embed - t_read,
+            "score": t_score - t_embed,
+            "fetch": t_fetch - t_score,
+            "rows": len(starts) - first,
+        })
+    return result
+
+def search_events_quantized(query, top_k, timings, mode, query_vector=None):
+    """Vorauswahl über die int8/Binär-Codes, danach exakte Nachbewertung der Kandidaten"""
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    c.execute(f"SELECT url, embedding_q FROM events WHERE embedding IS NOT NULL AND start_iso >= ? AND embedding_model = ? AND {dedup.VISIBLE_CONDITION}",
+              (today, get_backend().model_id))
+    rows = c.fetchall()
+    t_read = time.perf_counter()
+
+    if not rows:
+        conn.close()
+        return []
+
+    if query_vector is None: query_vector = get_embedding(query)
+    t_embed = time.perf_counter()
+
+    # Events ohne (gültigen) Code kommen immer in die Nachbewertung
+    dims = vector_index.quant_dims(get_backend().model_id, len(query_vector))
+    size = vector_index.code_size(dims)
+    coded, candidates = [], []
+    for row in rows:
+        if row['embedding_q'] and len(row['embedding_q']) == size: coded.append(row)
+        else: candidates.append(row['url'])
+    t_parse = time.perf_counter()
+
+    if coded:
+        top = vector_index.select_candidates(query_vector, [row['embedding_q'] for row in coded], top_k, mode, dims)
+        candidates += [coded[i]['url'] for i in top]
+    t_score = time.perf_counter()
+
+    # Exakte Nachbewertung: Vektoren der Kandidaten aus dem Vektor-Store (memmap), nur Fehlendes als JSON
+    c.execute(f"SELECT {', '.join(snapshot.COLUMNS)} FROM events WHERE url IN ({','.join('?' * len(candidates))})", candidates)
+    cand_rows = c.fetchall()
+    matrix = vector_store.load(conn, [row['url'] for row in cand_rows], [row['embedding_hash'] for row in cand_rows],
+                               get_backend().model_id, VECTOR_STORE)
+    conn.close()
+    exact = matrix @ np.asarray(query_vector, dtype=np.float32)
+    order = np.argsort(-exact)[:top_k]
+    t_rerank = time.perf_counter()
+
+    for name, start, end in (("search.db_read", t0, t_read), ("search.parse", t_embed, t_parse),
+                             ("search.score", t_parse, t_score), ("search.rerank", t_score, t_rerank)):
+        metrics.record_span(name, end - start)
+
+    if timings is not None:
+        timings.update({
+            "db_read": t_read - t0,
+            "embed": t_embed - t_read,
+            "parse": t_parse - t_embed,
+            "score": t_score - t_parse,
+            "rerank": t_rerank - t_score,
+            "rows": len(rows),
+            "candidates": len(cand_rows),
+        })
+    return [dict(cand_rows[i], vector=matrix[i]) for i in order]
+
+def refine_snapshot(snap, urls, query_vector, top_k):
+    """Kandidaten (URLs) im Lese-Snapshot neu bewerten; Zeilen bringen ihren Vektor mit"""
+    matrix = snap.blocks[get_backend().model_id][0]
+    rows = snap.conn.execute(f"""SELECT * FROM events WHERE url IN ({','.join('?' * len(urls))}) AND vec_row IS NOT NULL
+                                 AND start_iso >= ? AND embedding_model = ?""",
+                             list(urls) + [datetime.now().strftime("%Y-%m-%d"), get_backend().model_id]).fetchall()
+    rows = [dict(row, vector=matrix[row['vec_row']]) for row in rows]
+    if not rows: return []
+    scores = np.array([row['vector'] for row in rows]) @ np.asarray(query_vector, dtype=np.float32)
+    return [rows[i] for i in np.argsort(-scores)[:top_k]]
+
+def _fan_out(shards, search):
+    """
+    Query-Router: `search(snap)` parallel auf den Lese-Snapshots der Mandanten, Treffer nach
+    Ähnlichkeit zusammenführen. Mandanten ohne Snapshot (snapshot.py noch nicht gelaufen) fehlen.
+    """
+    def _one(tenant):
+        snap = snapshot.current(tenants.path(tenant, snapshot.SNAPSHOT_FILE))
+        if snap is None or get_backend().model_id not in snap.blocks: return tenant, None
+        return tenant, search(snap)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(shards), SHARD_WORKERS))) as pool:
+        results = list(pool.map(_one, shards))
+    merged = []
+    for tenant, rows in results:
+        if rows is None:
+            print(f"⚠️ Kein Lese-Snapshot für {tenant['id']} - übersprungen.")
+            metrics.inc("chat.shards_missing")
+            continue
+        for row in rows:
+            if len(shards) > 1: row['region'] = tenant['name']
+            merged.append(row)
+    metrics.inc("chat.shards", len(shards))
+    return merged
+
+def _merge_top_k(rows, query_vector, top_k):
+    # Gleiche URL in mehreren Mandanten (z.B. gemeinsame Liga) -> nur einmal
+    q = np.asarray(query_vector, dtype=np.float32)
+    best = {}
+    for row in rows:
+        score = float(np.dot(row['vector'], q))
+        if row['url'] not in best or score > best[row['url']][0]: best[row['url']] = (score, row)
+    return [row for _, row in sorted(best.values(), key=lambda x: -x[0])[:top_k]]
+
+def search_shards(query, shards, top_k=5, query_vector=None):
+    """Suche über mehrere Mandanten: jeder liefert seine Top-k, zusammengeführt bleiben die besten k"""
+    if query_vector is None: query_vector = get_embedding(query)
+    with metrics.span("search.shards"):
+        rows = _fan_out(shards, lambda snap: search_snapshot(snap, query, top_k, query_vector=query_vector))
+        return _merge_top_k(rows, query_vector, top_k)
+
+def refine_candidates(urls, query_vector, top_k=CONTEXT_CANDIDATES, shards=None):
+    """Folgefrage: nur die Kandidaten der letzten Suche neu bewerten (kein Scan über alle Events)"""
+    if not urls: return []
+    if shards:
+        return _merge_top_k(_fan_out(shards, lambda snap: refine_snapshot(snap, urls, query_vector, top_k)),
+                            query_vector, top_k)
+    snap = snapshot.current(SNAPSHOT_FILE)
+    if snap is not None and get_backend().model_id in snap.blocks:
+        return refine_snapshot(snap, urls, query_vector, top_k)
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = conn.execute(f"""SELECT {', '.join(snapshot.COLUMNS)} FROM events WHERE url IN ({','.join('?' * len(urls))})
+                            AND embedding IS NOT NULL AND start_iso >= ? AND embedding_model = ? AND {dedup.VISIBLE_CONDITION}""",
+                        list(urls) + [today, get_backend().model_id]).fetchall()
+    if not rows:
+        conn.close()
+        return []
+    matrix = vector_store.load(conn, [row['url'] for row in rows], [row['embedding_hash'] for row in rows],
+                               get_backend().model_id, VECTOR_STORE)
+    conn.close()
+    order = np.argsort(-(matrix @ np.asarray(query_vector, dtype=np.float32)))[:top_k]
+    return [dict(rows[i], vector=matrix[i]) for i in order]
+
+def _best_score(rows, query_vector):
+    if not rows: return None
+    vectors = [row['vector'] if 'vector' in row.keys() else json.loads(row['embedding']) for row in rows]
+    return float(np.max(np.asarray(vectors, dtype=np.float32) @ np.asarray(query_vector, dtype=np.float32)))
+
+def chat_with_data(user_question, session_id=None, shards=None):
+    """Frage beantworten. `shards`: Liste von Mandanten (tenants.py) -> Suche über deren Lese-Snapshots."""
     print(f"User fragt: {user_question}...\n")
-    
-    # 1. RAG: Relevante Daten holen
-    relevant_events = search_events(user_question, top_k=4)
+
+    # Session: laufender Anfrage-Vektor, Kandidaten der letzten Suche, Verlauf
+    store = sessions.connect() if session_id else None
+    session = sessions.load(store, session_id) if store else None
+    query_vector = get_embedding(user_question)
+    followup = session is not None and sessions.is_followup(session, user_question, query_vector)
+    if session: query_vector = sessions.running_vector(session, query_vector, followup)
+    when = sessions.date_filter(user_question)
+
+    # 1. RAG: Relevante Daten holen (mehr Kandidaten als am Ende in den Kontext passen)
+    relevant_events, candidates, best_score = [], None, None
+    if followup:
+        # "und am Sonntag?" -> bisherige Kandidaten verfeinern statt neu suchen
+        relevant_events = refine_candidates(session["candidates"], query_vector, shards=shards)
+        if when: relevant_events = [e for e in relevant_events if when(e['start_iso'])]
+        if relevant_events and not sessions.refined_enough(session, _best_score(relevant_events, query_vector)):
+            # Neue Suche mit der Frage allein (ohne das alte Thema aus dem laufenden Vektor)
+            metrics.inc("sessions.refine_fallback")
+            relevant_events, followup = [], False
+            query_vector = get_embedding(user_question)
+        if relevant_events: metrics.inc("sessions.refined")
+    if not relevant_events:
+        if shards:
+            relevant_events = search_shards(user_question, shards, top_k=CONTEXT_CANDIDATES, query_vector=query_vector)
+        else:
+            relevant_events = search_events(user_question, top_k=CONTEXT_CANDIDATES, query_vector=query_vector)
+        candidates = [e['url'] for e in relevant_events]
+        best_score = _best_score(relevant_events, query_vector)
+        if when: relevant_events = [e for e in relevant_events if when(e['start_iso'])] or relevant_events
     
     if not relevant_events:
         print("Keine passenden Events gefunden.")
+        if store: store.close()
         return
 
-    # 2. Kontext für LLM bauen
-    context_text = ""
-    for e in relevant_events:
-        context_text += f"""
-        --- EVENT ---
-        Titel: {e['title']}
-        Wann: {e['date_str']} um {e['time_str']}
-        Wo: {e['location']}
-        Tags: {e['tags']}
-        Beschreibung: {e['description'][:200]}...
-        Link: {e['url']}
-        """
-
-    # 3. Prompt an GPT-4o-mini
-    system_prompt = """Du bist ein hilfreicher Event-Assistent für Korneuburg. 
-    Nutze NUR die folgenden Veranstaltungsinformationen, um die Frage zu beantworten.
-    Wenn du keine passende Veranstaltung findest, sag das ehrlich. 
-    Antworte freundlich und kurz. Formatiere Daten schön."""
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Hier sind die Events:\n{context_text}\n\nFrage des Nutzers: {user_question}"}
-    ]
-
-    response = client.chat.completions.create(
+    # 2. Kontext: relevante, unterschiedliche Events bis zum Token-Budget
+    context_text, chosen, used = context.build_context(query_vector, relevant_events)
+    print(f"📎 Kontext: {len(chosen)}/{len(relevant_events)} Events, {used} Tokens{' (Folgefrage)' if followup else ''}")
+
+    # 3. Prompt an GPT-4o-mini (statischer System-Prompt vorne, Event-Kontext in der Nutzer-Nachricht)
+    history = sessions.history_messages(session, sessions.recent_turns(store, session_id)) if session else []
+    region = ", ".join(t['name'] for t in shards) if shards else tenants.current()['name']
+    messages = context.build_messages(user_question, context_text, history, region)
+
+    response = ai_client.chat_sync(
         model="gpt-4o-mini",
         messages=messages,
         temperature=0.7
     )
 
+    answer = response.choices[0].message.content
     print("🤖 ANTWORT:")
-    print(response.choices[0].message.content)
+    print(answer)
+
+    if session:
+        sessions.save_turn(store, session, user_question, answer, [e['url'] for e in chosen], query_vector, candidates, best_score)
+        sessions.compact(store, session)
+        store.close()
+    return answer
+
+@profiling.profiled("chat")
+@metrics.track_run("chat")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-session", help="Session-ID: Fragen bauen aufeinander auf (Verlauf in chat.db)")
+    parser.add_argument("-q", action="append", help="Frage (mehrfach möglich)")
+    parser.add_argument("-tenants", help="Über mehrere Mandanten suchen: IDs kommagetrennt oder 'all' (siehe tenants.py)")
+    args = parser.parse_args()
+    shards = tenants.select(args.tenants) if args.tenants else None
 
-if __name__ == "__main__":
     # Testfragen
-    chat_with_data("Gibt es diese Woche Sportveranstaltungen?")
-    print("\n" + "-"*30 + "\n")
-    chat_with_data("Was kann ich mit Kindern machen?")
\ No newline at end of file
+    questions = args.q or ["Gibt es diese Woche Sportveranstaltungen?", "Was kann ich mit Kindern machen?"]
+    for i, question in enumerate(questions):
+        if i: print("\n" + "-"*30 + "\n")
+        chat_with_data(question, args.session, shards)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
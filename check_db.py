@@ -1,9 +1,125 @@
+import os
 import sqlite3
 import argparse
 import sys
 
+import metrics
+import profiling
+import dedup
+
 DB_FILE = "evko.db"
+# Anteil freier Seiten, ab dem -auto die volle Wartung (inkl. VACUUM) ausführt. Wächst nur bei
+# Datenbanken, die über viele Läufe bestehen (lokal, Mandanten-Verzeichnisse). Die Pipeline baut
+# evko.db jeden Lauf aus data/ neu (export.py -import, inkl. ANALYZE) -> dort nur Prüfung + optimize.
+FRAGMENTATION_THRESHOLD = 0.2
+# Heiße Abfragen aus builder.py und chat.py (für EXPLAIN QUERY PLAN, Parameter nur Platzhalter)
+HOT_QUERIES = [
+    ("builder.events", f"""SELECT date_str, title, tags, location, url, description, time_str, image_urls, embedding_model, embedding_hash
+        FROM events WHERE start_iso >= ? AND {dedup.VISIBLE_CONDITION} ORDER BY start_iso ASC, time_str ASC""", ("2000-01-01",)),
+    ("chat.exact", f"""SELECT * FROM events WHERE embedding IS NOT NULL AND start_iso >= ? AND embedding_model = ?
+        AND {dedup.VISIBLE_CONDITION}""", ("2000-01-01", "")),
+    ("chat.quantized", f"""SELECT url, embedding_q FROM events WHERE embedding IS NOT NULL AND start_iso >= ? AND embedding_model = ?
+        AND {dedup.VISIBLE_CONDITION}""", ("2000-01-01", "")),
+    ("chat.mmap", f"""SELECT url, embedding_hash FROM events WHERE embedding IS NOT NULL AND start_iso >= ? AND embedding_model = ?
+        AND {dedup.VISIBLE_CONDITION}""", ("2000-01-01", "")),
+    ("chat.fetch", "SELECT * FROM events WHERE url IN (?)", ("",)),
+    ("feed.since", "SELECT seq, url, op, record FROM feed_log WHERE seq > ? ORDER BY seq", (0,)),
+]
+
+
+def _kb(n):
+    return f"{(n or 0) / 1024:>10.1f} KB"
+
+
+def fragmentation(conn):
+    """(Seiten gesamt, freie Seiten, Seitengröße) und Anteil freier Seiten"""
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return (pages, free, size), (free / pages if pages else 0.0)
+
+
+def storage_report(conn):
+    """Speicher pro Tabelle/Index, pro Spalte (events) und pro Quelle"""
+    (pages, free, size), ratio = fragmentation(conn)
+    print(f"📦 Datei: {_kb(pages * size)} | {pages} Seiten à {size} B | frei: {free} ({ratio:.0%})")
+    metrics.inc("db.bytes", pages * size)
+    metrics.inc("db.free_pages", free)
+
+    try:
+        objects = conn.execute("SELECT name, SUM(pgsize), SUM(unused) FROM dbstat GROUP BY name ORDER BY 2 DESC").fetchall()
+        print(f"\n{'TABELLE/INDEX':<34} | {'BELEGT':>13} | {'UNGENUTZT':>13}")
+        print("-" * 66)
+        for name, used, unused in objects:
+            print(f"{name:<34} | {_kb(used)} | {_kb(unused)}")
+    except sqlite3.OperationalError:
+        print("   (dbstat nicht verfügbar - keine Aufteilung nach Tabellen)")
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+    sizes = conn.execute(f"SELECT COUNT(*), {', '.join(f'SUM(length(CAST({c} AS BLOB)))' for c in columns)} FROM events").fetchone()
+    count = sizes[0] or 1
+    print(f"\n{'SPALTE (events)':<32} | {'GESAMT':>13} | {'PRO EVENT':>10}")
+    print("-" * 62)
+    for col, total in sorted(zip(columns, sizes[1:]), key=lambda x: -(x[1] or 0)):
+        print(f"{col:<32} | {_kb(total)} | {(total or 0) / count:>8.0f} B")
+
+    print(f"\n{'QUELLE':<11} | {'EVENTS':>6} | {'BESCHREIBUNG':>13} | {'VEKTOREN':>13} | {'GESAMT':>13}")
+    print("-" * 70)
+    row_bytes = " + ".join(f"COALESCE(length(CAST({c} AS BLOB)), 0)" for c in columns)
+    vector_cols = [c for c in ("embedding", "embedding_q") if c in columns]
+    vector_bytes = " + ".join(f"COALESCE(length(CAST({c} AS BLOB)), 0)" for c in vector_cols) or "0"
+    by_source = "source" if "source" in columns else "NULL"
+    for source, n, desc, vec, total in conn.execute(f"""SELECT {by_source}, COUNT(*), SUM(length(CAST(description AS BLOB))),
+                                                       SUM({vector_bytes}), SUM({row_bytes}) FROM events
+                                                       GROUP BY 1 ORDER BY 2 DESC"""):
+        print(f"{source or '?':<11} | {n:>6} | {_kb(desc)} | {_kb(vec)} | {_kb(total)}")
 
+
+def query_plans(conn):
+    """EXPLAIN QUERY PLAN der heißen Abfragen. SCAN über events = Volltabellen-Scan."""
+    for name, sql, params in HOT_QUERIES:
+        print(f"\n🔎 {name}")
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"   ⚠️ {e}")
+            continue
+        for row in plan:
+            detail = row[-1]
+            print(f"   {'⚠️' if detail.startswith('SCAN') or 'TEMP B-TREE' in detail else '✅'} {detail}")
+
+
+def maintain(conn, full=True):
+    """
+    Integritätsprüfung und Statistiken. `full`: integrity_check, ANALYZE, VACUUM; sonst quick_check
+    und PRAGMA optimize (analysiert nur, wo SQLite es für nötig hält).
+    Bei Fehlern in der Prüfung wird nichts verändert. Liefert True, wenn die DB in Ordnung ist.
+    """
+    with metrics.span("db.integrity"):
+        result = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+    if [r[0] for r in result] != ["ok"]:
+        print(f"❌ Integritätsprüfung fehlgeschlagen: {'; '.join(r[0] for r in result[:5])}")
+        metrics.inc("db.integrity_errors", len(result))
+        return False
+    print("✅ Integrität ok")
+
+    with metrics.span("db.analyze"):
+        if full: conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+    print(f"✅ Statistiken aktualisiert ({'ANALYZE, ' if full else ''}PRAGMA optimize)")
+    if full:
+        before = os.path.getsize(DB_FILE)
+        with metrics.span("db.vacuum"):
+            conn.execute("VACUUM")
+        after = os.path.getsize(DB_FILE)
+        metrics.inc("db.vacuum_saved_bytes", before - after)
+        print(f"✅ VACUUM: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+    return True
+
+
+@profiling.profiled("check_db")
+@metrics.track_run("check_db")
 def check_db():
     # --- Argumente Parsen ---
     parser = argparse.ArgumentParser(description="EVKO Datenbank Checker")
@@ -11,15 +127,53 @@ def check_db():
     parser.add_argument("-handball", action="store_true", help="Zeige nur Handball")
     parser.add_argument("-stadt", action="store_true", help="Zeige Stadt/Kultur Events (Kein Sport)")
     parser.add_argument("-all", action="store_true", help="Zeige alle Events")
+    parser.add_argument("-stats", action="store_true", help="Speicher pro Tabelle, Spalte und Quelle")
+    parser.add_argument("-plans", action="store_true", help="Abfragepläne der heißen Abfragen (builder.py, chat.py)")
+    parser.add_argument("-maintain", action="store_true", help="Integritätsprüfung, ANALYZE, PRAGMA optimize, VACUUM")
+    parser.add_argument("-auto", action="store_true",
+                        help=f"Wartung nur ab {FRAGMENTATION_THRESHOLD:.0%} freien Seiten, sonst nur PRAGMA optimize (Pipeline)")
     
     args = parser.parse_args()
 
     # Wenn gar kein Argument übergeben wurde, Hilfetext anzeigen
-    if not any([args.kick, args.handball, args.stadt, args.all]):
+    if not any([args.kick, args.handball, args.stadt, args.all, args.stats, args.plans, args.maintain, args.auto]):
         print("ℹ️  Bitte Parameter wählen: -kick, -handball, -stadt oder -all")
+        print("   Wartung: -stats, -plans, -maintain oder -auto")
         print("   Beispiel: python check_db.py -kick")
         return
 
+    if args.stats or args.plans or args.maintain or args.auto:
+        if not os.path.exists(DB_FILE):
+            print(f"Datenbank {DB_FILE} nicht gefunden.")
+            return
+        print(f"--- 🧰 DB WARTUNG: {DB_FILE} ---")
+        conn = sqlite3.connect(DB_FILE)
+        dedup.init_column(conn)
+        if args.stats: storage_report(conn)
+        if args.plans: query_plans(conn)
+        ok = True
+        if args.maintain:
+            ok = maintain(conn, full=True)
+        elif args.auto:
+            _, ratio = fragmentation(conn)
+            analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+            if ratio >= FRAGMENTATION_THRESHOLD:
+                print(f"🧹 Fragmentierung {ratio:.0%} >= {FRAGMENTATION_THRESHOLD:.0%} -> volle Wartung")
+                ok = maintain(conn, full=True)
+            elif not analyzed:
+                # Nie analysiert (z.B. von den Scrapern neu angelegt): Statistiken einmal komplett erheben
+                print("📊 Keine Statistiken -> Prüfung + ANALYZE")
+                ok = maintain(conn, full=False)
+                if ok:
+                    conn.execute("ANALYZE")
+                    conn.commit()
+            else:
+                print(f"💤 Fragmentierung {ratio:.0%} < {FRAGMENTATION_THRESHOLD:.0%} -> nur PRAGMA optimize")
+                ok = maintain(conn, full=False)
+        conn.close()
+        if not ok: sys.exit(1)
+        return
+
     print(f"--- 🔍 DB CHECK: {DB_FILE} ---")
 
     try:
@@ -0,0 +1,100 @@
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+import tokens
+
+# --- KONFIGURATION ---
+# Kontext für chat.py: statt fix 4 Events mit abgeschnittener Beschreibung werden
+# aus den Suchtreffern so viele Events gewählt, wie ins Token-Budget passen -
+# nach "Maximal Marginal Relevance" (relevant, aber nicht fünfmal dasselbe Event).
+# Der statische Teil des Prompts ist eine Konstante und steht immer vorne. Prompt-Caching
+# spielt hier keine Rolle: es greift erst ab 1024 Tokens Präfix, der ganze Prompt hat aber
+# nur ~100 (System) + CONTEXT_TOKENS + Frage. Nachprüfbar über den Zähler
+# openai.<modell>.cached_tokens (metrics.record_usage), der bei Chat-Läufen 0 bleibt.
+CONTEXT_TOKENS = 400       # Budget für alle Event-Snippets zusammen (früher ~450 Tokens für 4 Events)
+DESC_TOKENS = 60           # Beschreibung pro Event höchstens so lang
+MMR_LAMBDA = 0.7           # 1.0 = nur Relevanz, 0.0 = nur Vielfalt
+MIN_RELEVANCE = 0.75       # Kandidaten unter 75% der besten Ähnlichkeit gar nicht erst nehmen
+SNIPPET_CACHE_SIZE = 2000
+
+# {region} = Name des Mandanten (bzw. der Mandanten)
+SYSTEM_PROMPT = """Du bist ein hilfreicher Event-Assistent für {region}.
+Nutze NUR die Veranstaltungen aus der Nachricht des Nutzers, um die Frage zu beantworten.
+Jede Veranstaltung steht in einem Block: Titel | Datum Uhrzeit | Ort | Tags, danach Beschreibung und Link.
+Wenn du keine passende Veranstaltung findest, sag das ehrlich.
+Antworte freundlich und kurz. Formatiere Daten schön und nenne den Link."""
+
+_snippets = OrderedDict()
+
+
+def render_snippet(row):
+    """Kompakter Event-Block; gecacht pro (url, embedding_hash) - ändert sich der Text, ändert sich der Hash"""
+    region = row['region'] if 'region' in row.keys() else None   # nur bei Suche über mehrere Mandanten
+    key = (row['url'], row['embedding_hash'], region)
+    cached = _snippets.get(key)
+    if cached:
+        _snippets.move_to_end(key)
+        metrics.inc("context.snippet_hits")
+        return cached
+
+    when = " ".join(x for x in (row['date_str'], row['time_str']) if x)
+    location = f"{row['location']} ({region})" if region and row['location'] else (row['location'] or region)
+    head = " | ".join(x for x in (row['title'], when, location, row['tags']) if x)
+    desc = " ".join((row['description'] or "").split())
+    short = tokens.truncate_tokens(desc, DESC_TOKENS)
+    if short != desc: short += " …"
+    text = f"{head}\n{short}\n{row['url']}" if short else f"{head}\n{row['url']}"
+
+    _snippets[key] = (text, tokens.count_tokens(text))
+    if len(_snippets) > SNIPPET_CACHE_SIZE: _snippets.popitem(last=False)
+    return _snippets[key]
+
+
+def select_mmr(query_vector, vectors, costs, budget, lam=MMR_LAMBDA, min_relevance=MIN_RELEVANCE):
+    """
+    Greedy MMR unter Token-Budget. Liefert die gewählten Indizes in Auswahl-Reihenfolge.
+    Events, die nicht mehr ins Budget passen, werden übersprungen (ein kürzeres passt evtl. noch).
+    """
+    if not len(vectors): return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    relevance = matrix @ np.asarray(query_vector, dtype=np.float32)
+    redundancy = np.full(len(matrix), -np.inf, dtype=np.float32)
+    remaining = relevance >= relevance.max() * min_relevance if relevance.max() > 0 else np.ones(len(matrix), dtype=bool)
+    chosen, used = [], 0
+
+    while remaining.any():
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        score = np.where(remaining, lam * relevance - (1 - lam) * penalty, -np.inf)
+        i = int(np.argmax(score))
+        remaining[i] = False
+        if used + costs[i] > budget: continue
+        chosen.append(i)
+        used += costs[i]
+        redundancy = np.maximum(redundancy, matrix @ matrix[i])
+    return chosen
+
+
+def build_context(query_vector, rows, budget=CONTEXT_TOKENS):
+    """Gewählte Snippets (relevanteste zuerst) als ein Text. Liefert (text, gewählte rows, tokens)."""
+    with metrics.span("context.pack"):
+        snippets = [render_snippet(row) for row in rows]
+        # Snapshot-Treffer bringen ihren Vektor mit, sonst JSON aus evko.db
+        vectors = [row['vector'] if 'vector' in row.keys() else json.loads(row['embedding']) for row in rows]
+        chosen = select_mmr(query_vector, vectors, [s[1] for s in snippets], budget)
+        text = "\n\n".join(snippets[i][0] for i in chosen)
+        used = sum(snippets[i][1] for i in chosen)
+    metrics.inc("context.events", len(chosen))
+    metrics.inc("context.tokens", used)
+    return text, [rows[i] for i in chosen], used
+
+
+def build_messages(question, context_text, history=None, region="Korneuburg"):
+    """System-Prompt (pro Region identisch) + ggf. Gesprächsverlauf + variable Nachricht am Ende"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT.format(region=region)},
+        *(history or []),
+        {"role": "user", "content": f"Veranstaltungen:\n\n{context_text}\n\nFrage: {question}"},
+    ]
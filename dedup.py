@@ -0,0 +1,222 @@
+import re
+import zlib
+import sqlite3
+import argparse
+from datetime import datetime
+from collections import defaultdict
+
+import numpy as np
+
+import metrics
+import profiling
+import scheduler
+import vector_store
+
+# --- KONFIGURATION ---
+# Dasselbe Event kommt oft von mehreren Scrapern (Stadt-URL, verband_/liga_ Hash,
+# Kinderwelt post_link#hash). Kandidaten werden nur innerhalb desselben Datums
+# verglichen (Blocking), über MinHash/LSH der Titel-Shingles und die Embeddings.
+DB_FILE = "evko.db"
+SHINGLE_SIZE = 3            # Zeichen-Trigramme des normalisierten Titels
+NUM_PERM = 64               # MinHash-Signaturlänge
+BANDS = 16                  # LSH: 16 Bänder x 4 Zeilen -> Schwelle ca. Jaccard 0.5
+TITLE_MIN_JACCARD = 0.5     # Titel ähnlich genug ...
+EMBED_CONFIRM = 0.85        # ... und Inhalt ähnlich (falls Vektoren vorhanden)
+EMBED_STRONG = 0.95         # Inhalt praktisch identisch -> auch bei abweichendem Titel
+# Bevorzugte Quelle für das kanonische Event (ausführlichste Daten zuerst)
+SOURCE_PRIORITY = ["evko", "kinderwelt", "kicks", "handball"]
+# Nur kanonische bzw. nicht zugeordnete Events anzeigen (für builder.py / chat.py)
+VISIBLE_CONDITION = "(canonical_url IS NULL OR canonical_url = url)"
+
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+
+
+def init_column(conn):
+    try:
+        conn.execute("ALTER TABLE events ADD COLUMN canonical_url TEXT")
+        print("✅ Spalte 'canonical_url' wurde hinzugefügt.")
+    except sqlite3.OperationalError: pass
+
+
+def normalize_title(title):
+    return " ".join(re.findall(r"\w+", (title or "").lower()))
+
+
+def shingles(title):
+    text = normalize_title(title)
+    if len(text) <= SHINGLE_SIZE: return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    """MinHash-Signatur (NUM_PERM Werte) einer Shingle-Menge"""
+    if not shingle_set: return None
+    x = np.array([zlib.crc32(s.encode('utf-8')) for s in shingle_set], dtype=np.uint64)
+    return ((np.outer(_PERM_A, x) + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def times_conflict(t1, t2):
+    """Zwei bekannte, unterschiedliche Uhrzeiten -> verschiedene Termine"""
+    known = lambda t: t and t != "00:00"
+    return known(t1) and known(t2) and t1 != t2
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb: self.parent[rb] = ra
+
+
+def candidate_pairs(block):
+    """LSH: Paare, die in mindestens einem Band dieselbe Signatur haben"""
+    rows_per_band = NUM_PERM // BANDS
+    buckets = defaultdict(list)
+    for i, ev in enumerate(block):
+        if ev['sig'] is None: continue
+        for b in range(BANDS):
+            buckets[(b, ev['sig'][b * rows_per_band:(b + 1) * rows_per_band].tobytes())].append(i)
+    pairs = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pairs.add((members[x], members[y]))
+    return pairs
+
+
+def find_duplicates(block):
+    """Liefert die Duplikat-Paare (Indizes) innerhalb eines Datums-Blocks"""
+    found = []
+    # Ähnlichkeiten nur zwischen Vektoren desselben Modells (andere Modelle sind nie vergleichbar)
+    by_model = defaultdict(list)
+    for i, ev in enumerate(block):
+        if ev['vec'] is not None: by_model[ev['model']].append(i)
+    sims = {}
+    for with_vec in by_model.values():
+        if len(with_vec) < 2: continue
+        m = np.asarray([block[i]['vec'] for i in with_vec], dtype=np.float32)
+        s = m @ m.T
+        for x in range(len(with_vec)):
+            for y in range(x + 1, len(with_vec)):
+                sims[(with_vec[x], with_vec[y])] = float(s[x, y])
+
+    # 1. Titel-Kandidaten aus LSH, bestätigt über exakte Jaccard + Embedding
+    for i, j in candidate_pairs(block):
+        a, b = block[i], block[j]
+        if times_conflict(a['time'], b['time']): continue
+        if jaccard(a['shingles'], b['shingles']) < TITLE_MIN_JACCARD: continue
+        sim = sims.get((i, j))
+        if sim is None or sim >= EMBED_CONFIRM:
+            found.append((i, j))
+
+    # 2. Fast identischer Inhalt unter anderem Titel
+    for (i, j), sim in sims.items():
+        if sim >= EMBED_STRONG and not times_conflict(block[i]['time'], block[j]['time']):
+            found.append((i, j))
+    return found
+
+
+def pick_canonical(events):
+    """Bevorzugte Quelle, dann längste Beschreibung, dann URL (stabil)"""
+    def key(ev):
+        source = ev['source']
+        prio = SOURCE_PRIORITY.index(source) if source in SOURCE_PRIORITY else len(SOURCE_PRIORITY)
+        return (prio, -len(ev['desc'] or ""), ev['url'])
+    return min(events, key=key)['url']
+
+
+@profiling.profiled("dedup")
+@metrics.track_run("dedup")
+def main():
+    parser = argparse.ArgumentParser(description="Duplikat-Erkennung über alle Quellen")
+    parser.add_argument("-list", action="store_true", help="Gefundene Duplikat-Gruppen ausgeben")
+    args = parser.parse_args()
+
+    print("--- START DEDUP ---")
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    init_column(conn)
+    scheduler.init_source_column(conn)
+    try:
+        conn.execute("SELECT embedding_model, embedding_hash FROM events LIMIT 1")
+        emb_cols = "embedding_model, embedding_hash"
+    except sqlite3.OperationalError:
+        emb_cols = "NULL AS embedding_model, NULL AS embedding_hash"   # embedder.py noch nie gelaufen
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    with metrics.span("db.read"):
+        rows = conn.execute(f"SELECT url, title, start_iso, time_str, description, source, {emb_cols} FROM events WHERE start_iso >= ?",
+                            (today,)).fetchall()
+
+    # Vektoren pro Modell aus dem Vektor-Store (nur Fehlendes wird als JSON geparst)
+    vectors = {}
+    by_model = defaultdict(list)
+    for row in rows:
+        if row['embedding_model'] and row['embedding_hash']: by_model[row['embedding_model']].append(row)
+    with metrics.span("vectors.load"):
+        for model, model_rows in by_model.items():
+            matrix = vector_store.load(conn, [r['url'] for r in model_rows], [r['embedding_hash'] for r in model_rows], model)
+            vectors.update({r['url']: matrix[i] for i, r in enumerate(model_rows) if matrix[i].any()})
+
+    # Blocking: nur Events am selben Tag können Duplikate sein
+    blocks = defaultdict(list)
+    with metrics.span("dedup.signatures"):
+        for row in rows:
+            sh = shingles(row['title'])
+            blocks[row['start_iso']].append({
+                "url": row['url'], "time": row['time_str'], "desc": row['description'], "source": row['source'],
+                "shingles": sh, "sig": minhash(sh),
+                "vec": vectors.get(row['url']), "model": row['embedding_model'],
+            })
+
+    uf = UnionFind()
+    with metrics.span("dedup.compare"):
+        for block in blocks.values():
+            if len(block) < 2: continue
+            for i, j in find_duplicates(block):
+                uf.union(block[i]['url'], block[j]['url'])
+
+    groups = defaultdict(list)
+    by_url = {ev['url']: ev for block in blocks.values() for ev in block}
+    for url in uf.parent:
+        groups[uf.find(url)].append(by_url[url])
+    groups = [g for g in groups.values() if len(g) > 1]
+
+    updates = [(None, row['url']) for row in rows]
+    for group in groups:
+        canonical = pick_canonical(group)
+        updates += [(canonical, ev['url']) for ev in group]
+        if args.list:
+            print(f"   🔁 {canonical}")
+            for ev in group:
+                if ev['url'] != canonical: print(f"      = {ev['url']}")
+
+    conn.executemany("UPDATE events SET canonical_url = ? WHERE url = ?", updates)
+    conn.commit()
+    conn.close()
+
+    hidden = sum(len(g) - 1 for g in groups)
+    metrics.inc("dedup.groups", len(groups))
+    metrics.inc("dedup.hidden", hidden)
+    print(f"✅ {len(rows)} Events in {len(blocks)} Tagen geprüft: {len(groups)} Duplikat-Gruppen, {hidden} ausgeblendet.")
+    print("--- ENDE ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,19 @@
 import sqlite3
-import openai
 import os
 import json
-import time
+import argparse
 import hashlib
+import metrics
+import profiling
+import tokens
+import embeddings
+import vector_index
+import vector_store
 
 # --- KONFIGURATION ---
 DB_FILE = "evko.db"
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not OPENAI_API_KEY:
-    print("❌ FEHLER: Kein OPENAI_API_KEY gesetzt!")
-    exit(1)
-
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Obergrenze pro Event-Text: längere Beschreibungen bringen kaum Suchqualität, kosten aber Tokens
+EMBED_MAX_TOKENS = 512
 
 def make_hash(text):
     """Erstellt einen MD5 Hash vom Text"""
@@ -35,24 +35,46 @@ def init_db_columns():
         print("✅ Spalte 'embedding_hash' wurde hinzugefügt (Smart Updates aktiviert).")
     except sqlite3.OperationalError: pass
     
+    # 3. Modell-Kennung (Vektoren verschiedener Modelle nie miteinander vergleichen)
+    try:
+        c.execute("ALTER TABLE events ADD COLUMN embedding_model TEXT")
+        c.execute("UPDATE events SET embedding_model = ? WHERE embedding IS NOT NULL", (embeddings.LEGACY_MODEL_ID,))
+        print("✅ Spalte 'embedding_model' wurde hinzugefügt.")
+    except sqlite3.OperationalError: pass
+    
+    # 4. Quantisierter Code für die Schnellsuche (siehe vector_index.py)
+    vector_index.init_column(conn)
+    
     conn.commit()
     conn.close()
 
-def get_embedding(text):
-    """Holt den Vektor von OpenAI"""
-    text = text.replace("\n", " ")
+def embed_batch(backend, texts):
+    """Holt die Vektoren für mehrere Texte. Bei einem Fehler: None"""
     try:
-        response = client.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small" 
-        )
-        return response.data[0].embedding
+        return backend.embed(texts)
     except Exception as e:
-        print(f"⚠️ OpenAI Fehler: {e}")
+        print(f"⚠️ Embedding Fehler: {e}")
         return None
 
+@profiling.profiled("embedder")
+@metrics.track_run("embedder")
 def main():
-    print("--- START EMBEDDER (Smart Update) ---")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-maxtokens", type=int, default=EMBED_MAX_TOKENS, help="Token-Limit pro Event-Text (0 = unbegrenzt)")
+    parser.add_argument("-backend", default=embeddings.DEFAULT_BACKEND, choices=list(embeddings.BACKENDS),
+                        help="Embedding-Backend: openai (API) oder local (CPU)")
+    args = parser.parse_args()
+
+    if args.backend == "openai" and not os.getenv("OPENAI_API_KEY"):
+        print("❌ FEHLER: Kein OPENAI_API_KEY gesetzt!")
+        exit(1)
+    try:
+        backend = embeddings.get_backend(args.backend)
+    except RuntimeError as e:
+        print(f"❌ FEHLER: {e}")
+        exit(1)
+
+    print(f"--- START EMBEDDER (Smart Update) [{backend.model_id}] [Max Tokens: {args.maxtokens or '∞'}] ---")
     
     init_db_columns()
     
@@ -60,8 +82,8 @@ def main():
     conn.row_factory = sqlite3.Row 
     c = conn.cursor()
     
-    # Wir holen ALLE Events, um zu prüfen, ob sich der Text geändert hat
-    c.execute("SELECT url, title, description, tags, location, embedding_hash FROM events")
+    # Wir holen ALLE Events, um zu prüfen, ob sich der Text (oder das Modell) geändert hat
+    c.execute("SELECT url, title, description, tags, location, embedding_hash, embedding_model FROM events")
     rows = c.fetchall()
     
     total = len(rows)
@@ -70,6 +92,7 @@ def main():
     updated_count = 0
     skipped_count = 0
     error_count = 0
+    todo = []
 
     for row in rows:
         url = row['url']
@@ -80,37 +103,51 @@ def main():
         stored_hash = row['embedding_hash']
         
         # Den Text bauen, der "verstanden" werden soll
-        full_text = f"{title} {tags} {loc} {desc}"
+        full_text = tokens.truncate_tokens(f"{title} {tags} {loc} {desc}", args.maxtokens)
         
         # Aktuellen Hash berechnen
         current_hash = make_hash(full_text)
         
-        # CHECK: Ist der Text neu oder hat er sich geändert?
-        if current_hash != stored_hash:
-            # Ja -> Wir müssen (neu) embedden
+        # CHECK: Ist der Text neu, hat er sich geändert oder stammt der Vektor von einem anderen Modell?
+        if current_hash != stored_hash or row['embedding_model'] != backend.model_id:
             change_type = "NEU" if not stored_hash else "UPDATE"
             print(f"   📝 [{change_type}] {title[:40]}...")
-            
-            vector = get_embedding(full_text)
-            
-            if vector:
-                vector_json = json.dumps(vector)
-                
-                c.execute("""
-                    UPDATE events 
-                    SET embedding = ?, embedding_hash = ? 
-                    WHERE url = ?
-                """, (vector_json, current_hash, url))
-                conn.commit()
-                updated_count += 1
-                
-                # Kurze Pause für Rate Limits
-                time.sleep(0.1)
-            else:
-                error_count += 1
+            todo.append((url, full_text, current_hash))
         else:
             # Nein -> Alles beim Alten, überspringen (Spart Geld!)
             skipped_count += 1
+            metrics.inc("embeddings.skipped")
+
+    # Gesammelt in Batches embedden (ein Request / ein Modell-Durchlauf pro Batch)
+    for i in range(0, len(todo), embeddings.BATCH_SIZE):
+        batch = todo[i:i + embeddings.BATCH_SIZE]
+        vectors = embed_batch(backend, [t[1] for t in batch])
+        if not vectors:
+            error_count += len(batch)
+            continue
+
+        c.executemany("""
+            UPDATE events 
+            SET embedding = ?, embedding_hash = ?, embedding_model = ?, embedding_q = ?
+            WHERE url = ?
+        """, [(json.dumps(vec), h, backend.model_id, vector_index.encode(vec, backend.model_id), url)
+              for (url, _, h), vec in zip(batch, vectors)])
+        with metrics.span("db.commit"):
+            conn.commit()
+        updated_count += len(batch)
+        metrics.inc("embeddings.updated", len(batch))
+        print(f"   ✅ {updated_count}/{len(todo)} eingebettet")
+
+    # Codes für ältere Vektoren nachtragen (einmalig nach der Migration)
+    with metrics.span("quant.backfill"):
+        backfilled = vector_index.backfill(conn)
+    if backfilled: print(f"   🧮 {backfilled} quantisierte Codes nachgetragen")
+
+    # Vektor-Store (memmap) für Chat und Builder nachziehen: anhängen + atomar ersetzen
+    with metrics.span("vector_store.sync"):
+        appended, compacted = vector_store.sync(conn, backend.model_id)
+    if appended or compacted:
+        print(f"   🗄️  Vektor-Store: +{appended} Vektoren{' (kompaktiert)' if compacted else ''}")
 
     conn.close()
     print("-" * 40)
@@ -0,0 +1,61 @@
+import os
+
+import metrics
+import ai_client
+
+# --- KONFIGURATION ---
+# Auswahl pro Lauf: -backend bzw. Umgebungsvariable EVKO_EMBED_BACKEND (openai | local)
+DEFAULT_BACKEND = os.getenv("EVKO_EMBED_BACKEND", "openai")
+OPENAI_MODEL = "text-embedding-3-small"
+LOCAL_MODEL = os.getenv("EVKO_LOCAL_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+BATCH_SIZE = 64
+# Vektoren ohne Kennung (vor Einführung der Spalte) stammen von OpenAI
+LEGACY_MODEL_ID = f"openai/{OPENAI_MODEL}"
+
+
+class OpenAIBackend:
+    """Embeddings über die OpenAI API (Netzwerk, kostenpflichtig) via ai_client (Rate-Limit, Retries)"""
+
+    def __init__(self, model=OPENAI_MODEL):
+        self.model = model
+        self.model_id = f"openai/{model}"
+
+    def embed(self, texts):
+        batches = [[t.replace("\n", " ") for t in texts[i:i + BATCH_SIZE]] for i in range(0, len(texts), BATCH_SIZE)]
+        vectors = []
+        for response in ai_client.embed_many_sync(batches, self.model):
+            vectors.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+        return vectors
+
+
+class LocalBackend:
+    """Lokales Sentence-Transformer Modell auf der CPU (offline, ohne Kosten)"""
+
+    def __init__(self, model=LOCAL_MODEL, batch_size=BATCH_SIZE):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("Lokales Backend braucht 'sentence-transformers' (pip install sentence-transformers)")
+        torch.set_num_threads(os.cpu_count() or 1)
+        with metrics.span("local.model_load"):
+            self.st_model = SentenceTransformer(model, device="cpu")
+        self.batch_size = batch_size
+        self.model_id = f"local/{model}"
+
+    def embed(self, texts):
+        with metrics.span("local.embedding"):
+            vectors = self.st_model.encode(list(texts), batch_size=self.batch_size,
+                                           normalize_embeddings=True, convert_to_numpy=True)
+        metrics.inc("local.embedded_texts", len(texts))
+        return vectors.tolist()
+
+
+BACKENDS = {"openai": OpenAIBackend, "local": LocalBackend}
+
+
+def get_backend(name=None, **kwargs):
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unbekanntes Embedding-Backend '{name}' (verfügbar: {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
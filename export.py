@@ -0,0 +1,236 @@
+import io
+import os
+import re
+import json
+import base64
+import hashlib
+import sqlite3
+import argparse
+
+import numpy as np
+
+import metrics
+import profiling
+import vector_index
+
+# --- KONFIGURATION ---
+# Text-Export der Datenbank für Git: statt evko.db (Binärdatei, ändert sich bei jedem
+# Lauf komplett) wird data/ committet - deterministisch sortiert und in Stücke geteilt,
+# damit ein neues Event nur die Datei seines Monats (und einen Vektor-Chunk) ändert.
+# Die Pipeline baut evko.db daraus wieder auf (-import).
+#
+#   data/schema.sql               CREATE-Anweisungen (Tabellen, Indizes)
+#   data/events/YYYY-MM.ndjson    Events nach Monat (start_iso), eine Zeile pro Event, nach URL sortiert
+#   data/vectors/<sha256>.npy     float32-Vektoren eines Monats und Modells, Name = Hash des Inhalts
+#   data/tables/<tabelle>.ndjson  übrige Tabellen, nach Primärschlüssel sortiert
+DB_FILE = "evko.db"
+DATA_DIR = "data"
+UNDATED = "undatiert"
+# Nicht exportiert: Vektor-JSON (liegt in den Chunks), abgeleitete Codes (vector_index.backfill)
+# und last_scraped (ändert sich bei jedem Lauf für jedes Event, wird nirgends gelesen)
+SKIP_COLUMNS = {"embedding", "embedding_q", "last_scraped"}
+# Abgeleitete Tabellen: baut builder.py/neighbors.py bei Bedarf neu
+SKIP_TABLES = {"events", "event_neighbors"}
+
+
+def _line(record):
+    return json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _encode(value):
+    return {"$blob": base64.b64encode(value).decode("ascii")} if isinstance(value, bytes) else value
+
+
+def _decode(value):
+    return base64.b64decode(value["$blob"]) if isinstance(value, dict) and "$blob" in value else value
+
+
+def _month(start_iso):
+    return start_iso[:7] if start_iso and re.match(r"\d{4}-\d{2}", start_iso) else UNDATED
+
+
+def _npy_bytes(vectors):
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(vectors, dtype="<f4"), allow_pickle=False)
+    return buf.getvalue()
+
+
+def _table_order(conn, table):
+    """ORDER BY über den Primärschlüssel (sonst alle Spalten) -> gleiche Daten, gleiche Datei"""
+    info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    pk = [row[1] for row in sorted(info, key=lambda r: r[5]) if row[5]]
+    return ", ".join(pk or [row[1] for row in info])
+
+
+def _months(conn, columns="*"):
+    """Events nach Monat, innerhalb des Monats nach URL sortiert"""
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    months = {}
+    for row in cur.execute(f"SELECT {columns} FROM events ORDER BY url"):
+        months.setdefault(_month(row['start_iso']), []).append(row)
+    return months
+
+
+def _vector_chunks(rows):
+    """Vektoren eines Monats pro Modell als ein Chunk: ({sha256: npy-Bytes}, {url: "sha256:zeile"})"""
+    blocks = {}
+    for row in rows:
+        if row['embedding']:
+            blocks.setdefault(row['embedding_model'] or "", []).append(row['url'])
+    parsed = {row['url']: json.loads(row['embedding']) for row in rows if row['embedding']}
+    chunks, refs = {}, {}
+    for urls in blocks.values():
+        data = _npy_bytes([parsed[u] for u in urls])
+        chunk = hashlib.sha256(data).hexdigest()
+        chunks[chunk] = data
+        refs.update({u: f"{chunk}:{i}" for i, u in enumerate(urls)})
+    return chunks, refs
+
+
+def vector_refs(conn):
+    """{url: "sha256:zeile"} - dieselben Verweise wie in data/events (für events.json und den Feed)"""
+    refs = {}
+    for rows in _months(conn, "url, start_iso, embedding, embedding_model").values():
+        refs.update(_vector_chunks(rows)[1])
+    return refs
+
+
+def collect(conn):
+    """Alle Export-Dateien als {relativer Pfad: Bytes}"""
+    files = {}
+    schema = conn.execute("""SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                             ORDER BY type DESC, name""").fetchall()
+    files["schema.sql"] = "".join(f"{sql};\n" for (sql,) in schema).encode("utf-8")
+
+    # Events pro Monat, Vektoren pro (Monat, Modell) als ein Chunk
+    conn.row_factory = sqlite3.Row
+    for month, rows in _months(conn).items():
+        chunks, refs = _vector_chunks(rows)
+        files.update({f"vectors/{chunk}.npy": data for chunk, data in chunks.items()})
+        lines = []
+        for row in rows:
+            record = {k: _encode(row[k]) for k in row.keys() if k not in SKIP_COLUMNS}
+            if row['url'] in refs: record["vector"] = refs[row['url']]
+            lines.append(_line(record))
+        files[f"events/{month}.ndjson"] = ("\n".join(lines) + "\n").encode("utf-8")
+
+    # sqlite_stat*: Statistiken von ANALYZE (check_db.py), werden neu erhoben
+    tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+              if name not in SKIP_TABLES and not name.startswith("sqlite_stat")]
+    for table in tables:
+        rows = conn.execute(f"SELECT * FROM {table} ORDER BY {_table_order(conn, table)}").fetchall()
+        files[f"tables/{table}.ndjson"] = "".join(_line({k: _encode(r[k]) for k in r.keys()}) + "\n" for r in rows).encode("utf-8")
+    conn.row_factory = None
+    return files
+
+
+def write(files, data_dir=DATA_DIR):
+    """Schreibt nur geänderte Dateien, entfernt verwaiste. Liefert (geschrieben, gelöscht)."""
+    written = removed = 0
+    for rel, data in files.items():
+        path = os.path.join(data_dir, rel)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if f.read() == data: continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        written += 1
+    for sub in ("events", "vectors", "tables"):
+        folder = os.path.join(data_dir, sub)
+        if not os.path.isdir(folder): continue
+        for name in os.listdir(folder):
+            if f"{sub}/{name}" not in files:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+    return written, removed
+
+
+def _ndjson(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _insert(conn, table, records):
+    for record in records:
+        cols = list(record)
+        conn.execute(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                     [_decode(record[c]) for c in cols])
+
+
+def restore(data_dir=DATA_DIR, db_file=DB_FILE):
+    """Baut die Datenbank aus data/ neu (temporäre Datei, dann atomar ersetzt). Liefert die Anzahl Events."""
+    tmp = db_file + ".tmp"
+    if os.path.exists(tmp): os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    with open(os.path.join(data_dir, "schema.sql"), "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+
+    chunks = {}
+    count = 0
+    events_dir = os.path.join(data_dir, "events")
+    for name in sorted(os.listdir(events_dir)):
+        records = _ndjson(os.path.join(events_dir, name))
+        for record in records:
+            ref = record.pop("vector", None)
+            if ref:
+                chunk, i = ref.split(":")
+                if chunk not in chunks:
+                    chunks[chunk] = np.load(os.path.join(data_dir, "vectors", f"{chunk}.npy"), allow_pickle=False)
+                # float32 -> float64 ist exakt: erneuter Export liefert dieselben Chunks
+                record["embedding"] = json.dumps(chunks[chunk][int(i)].astype(np.float64).tolist())
+        _insert(conn, "events", records)
+        count += len(records)
+
+    tables_dir = os.path.join(data_dir, "tables")
+    for name in sorted(os.listdir(tables_dir)) if os.path.isdir(tables_dir) else []:
+        table = name[:-len(".ndjson")]
+        # AUTOINCREMENT-Zähler: die Inserts oben haben ihn schon gesetzt, gespeicherter Stand gewinnt
+        if table == "sqlite_sequence": conn.execute("DELETE FROM sqlite_sequence")
+        _insert(conn, table, _ndjson(os.path.join(tables_dir, name)))
+    conn.commit()
+    try:
+        vector_index.backfill(conn)
+    except sqlite3.OperationalError:
+        pass  # Spalte embedding_q fehlt (Export vor embedder.py)
+    # Statistiken werden nicht exportiert (sqlite_stat*) -> für die frische DB neu erheben
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    os.replace(tmp, db_file)
+    return count
+
+
+@profiling.profiled("export")
+@metrics.track_run("export")
+def main():
+    parser = argparse.ArgumentParser(description="Datenbank als sortierten Text-Export (data/) schreiben oder daraus neu bauen")
+    parser.add_argument("-import", dest="restore", action="store_true", help="evko.db aus data/ neu bauen")
+    parser.add_argument("-dir", default=DATA_DIR, help="Export-Verzeichnis")
+    args = parser.parse_args()
+
+    if args.restore:
+        if not os.path.exists(os.path.join(args.dir, "schema.sql")):
+            print(f"Kein Export in {args.dir}/ gefunden.")
+            return
+        with metrics.span("export.restore"):
+            count = restore(args.dir, DB_FILE)
+        print(f"✅ {DB_FILE} aus {args.dir}/ gebaut: {count} Events")
+        return
+
+    if not os.path.exists(DB_FILE):
+        print(f"Datenbank {DB_FILE} nicht gefunden.")
+        return
+    conn = sqlite3.connect(DB_FILE)
+    with metrics.span("export.collect"):
+        files = collect(conn)
+    conn.close()
+    with metrics.span("export.write"):
+        written, removed = write(files, args.dir)
+    print(f"✅ Export {args.dir}/: {len(files)} Dateien, {written} geändert, {removed} entfernt")
+
+
+if __name__ == "__main__":
+    main()
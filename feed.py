@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+import metrics
+
+# --- KONFIGURATION ---
+# Änderungs-Feed für Konsumenten (n8n, Website): statt immer die komplette
+# events.json zu laden, holt ein Client feed/index.json und nur die Delta-Dateien
+# mit Sequenznummern > seiner zuletzt gesehenen Nummer.
+#
+#   index.json:  {"schema": 2, "latest_seq": 120, "min_seq": 81, "snapshot": "events.json", "snapshot_seq": 120,
+#                 "deltas": [{"from": 81, "to": 95, "file": "delta_...ndjson", "count": 15}, ...]}
+#   Delta-Zeile: {"seq": 96, "op": "upsert", "url": "...", "event": {...}}
+#                {"seq": 97, "op": "delete", "url": "..."}
+#
+# Ist die eigene Nummer kleiner als min_seq - 1, muss der Client den Snapshot neu laden.
+#
+# Schema der Event-Datensätze (Snapshot und Deltas):
+#   1: "embedding": [float, ...] direkt im Datensatz
+#   2: "vector": "<sha256>:<zeile>" -> Zeile in data/vectors/<sha256>.npy (float32, numpy .npy)
+FEED_DIR = "feed"
+SCHEMA_VERSION = 2
+INDEX_FILE = "index.json"
+RETENTION_DAYS = 30
+
+
+def init_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS feed_state (
+        url TEXT PRIMARY KEY, record_hash TEXT, seq INTEGER
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS feed_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, op TEXT, record TEXT, created TIMESTAMP
+    )''')
+    conn.commit()
+
+
+def record_hash(record):
+    return hashlib.md5(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def log_changes(conn, records):
+    """Vergleicht die veröffentlichten Datensätze mit dem letzten Stand und schreibt Änderungen ins Log"""
+    init_tables(conn)
+    state = dict(conn.execute("SELECT url, record_hash FROM feed_state").fetchall())
+    now = datetime.now().isoformat()
+    current = {}
+    inserted = updated = 0
+
+    for rec in records:
+        url = rec['url']
+        h = record_hash(rec)
+        current[url] = h
+        if state.get(url) == h: continue
+        if url in state: updated += 1
+        else: inserted += 1
+        cur = conn.execute("INSERT INTO feed_log (url, op, record, created) VALUES (?, 'upsert', ?, ?)",
+                           (url, json.dumps(rec, ensure_ascii=False), now))
+        conn.execute("INSERT OR REPLACE INTO feed_state (url, record_hash, seq) VALUES (?, ?, ?)", (url, h, cur.lastrowid))
+
+    # Nicht mehr veröffentlicht (vorbei, gelöscht oder als Duplikat erkannt)
+    removed = [url for url in state if url not in current]
+    for url in removed:
+        conn.execute("INSERT INTO feed_log (url, op, record, created) VALUES (?, 'delete', NULL, ?)", (url, now))
+        conn.execute("DELETE FROM feed_state WHERE url = ?", (url,))
+    conn.commit()
+
+    metrics.inc("feed.inserted", inserted)
+    metrics.inc("feed.updated", updated)
+    metrics.inc("feed.removed", len(removed))
+    return inserted, updated, len(removed)
+
+
+def latest_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM feed_log").fetchone()[0]
+
+
+def _delta_name(first, last):
+    return f"delta_{first:08d}_{last:08d}.ndjson"
+
+
+def write_delta(conn, after_seq):
+    """Schreibt alle Log-Einträge mit seq > after_seq in eine neue Delta-Datei"""
+    rows = conn.execute("SELECT seq, url, op, record FROM feed_log WHERE seq > ? ORDER BY seq", (after_seq,)).fetchall()
+    if not rows: return None
+    os.makedirs(FEED_DIR, exist_ok=True)
+    name = _delta_name(rows[0][0], rows[-1][0])
+    with open(os.path.join(FEED_DIR, name), "w", encoding="utf-8") as f:
+        for seq, url, op, record in rows:
+            entry = {"seq": seq, "op": op, "url": url}
+            if record: entry["event"] = json.loads(record)
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return name
+
+
+def prune(conn, now=None):
+    """Löscht Log-Einträge älter als RETENTION_DAYS (die aktuellsten Zustände bleiben in feed_state)"""
+    cutoff = ((now or datetime.now()) - timedelta(days=RETENTION_DAYS)).isoformat()
+    conn.execute("DELETE FROM feed_log WHERE created < ? AND seq < (SELECT MAX(seq) FROM feed_log)", (cutoff,))
+    conn.commit()
+
+
+def write_index(conn, snapshot_file):
+    """Index über alle noch vorhandenen Delta-Dateien; vollständig veraltete Dateien werden entfernt"""
+    oldest = conn.execute("SELECT MIN(seq) FROM feed_log").fetchone()[0] or 0
+    deltas = []
+    if os.path.isdir(FEED_DIR):
+        for name in sorted(os.listdir(FEED_DIR)):
+            if not (name.startswith("delta_") and name.endswith(".ndjson")): continue
+            first, last = (int(x) for x in name[len("delta_"):-len(".ndjson")].split("_"))
+            if last < oldest:
+                os.remove(os.path.join(FEED_DIR, name))
+                continue
+            deltas.append({"from": first, "to": last, "file": name, "count": last - first + 1})
+
+    latest = latest_seq(conn)
+    index = {
+        "schema": SCHEMA_VERSION,
+        "latest_seq": latest,
+        "min_seq": deltas[0]["from"] if deltas else latest + 1,
+        "snapshot": snapshot_file,
+        "snapshot_seq": latest,
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "deltas": deltas,
+    }
+    os.makedirs(FEED_DIR, exist_ok=True)
+    tmp = os.path.join(FEED_DIR, INDEX_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, os.path.join(FEED_DIR, INDEX_FILE))
+    return index
+
+
+def publish(conn, records, snapshot_file):
+    """Änderungen loggen, Delta-Datei + Index schreiben. Liefert die neue Sequenznummer."""
+    init_tables(conn)
+    before = latest_seq(conn)
+    with metrics.span("feed.log"):
+        inserted, updated, removed = log_changes(conn, records)
+    name = write_delta(conn, before)
+    prune(conn)
+    index = write_index(conn, snapshot_file)
+    if name:
+        print(f"   📰 Feed: +{inserted} ~{updated} -{removed} -> {FEED_DIR}/{name} (seq {index['latest_seq']})")
+    else:
+        print(f"   📰 Feed: keine Änderungen (seq {index['latest_seq']})")
+    return index['latest_seq']
@@ -0,0 +1,244 @@
+import os
+import io
+import json
+import base64
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+
+import requests
+
+import metrics
+import profiling
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+# --- KONFIGURATION ---
+# Plakate werden genau einmal heruntergeladen und inhaltsadressiert abgelegt
+# (gleicher Inhalt unter verschiedenen URLs -> eine Datei). Vision-Analyse und
+# Website nutzen danach nur noch die lokale Kopie bzw. die Vorschaubilder.
+# Ins Repository kommen nur die Vorschaubilder der Website (-site), Originale und
+# übrige Größen bleiben lokal und werden bei Bedarf neu geladen. Bilder, die kein
+# kommendes Event mehr nutzt, werden bei jedem Lauf gelöscht (Zeilen und Dateien).
+DB_FILE = "evko.db"
+STORE_DIR = "images"
+THUMB_WIDTHS = (160, 480, 800)
+THUMB_FORMATS = ("webp", "avif")     # avif nur, wenn Pillow es unterstützt
+THUMB_QUALITY = {"webp": 80, "avif": 60}
+MAX_BYTES = 10 * 1024 * 1024
+TIMEOUT = 15
+MIME_EXT = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp", "image/avif": "avif"}
+
+
+def init_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS images (
+        url TEXT PRIMARY KEY, sha256 TEXT, fetched TIMESTAMP, error TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS image_files (
+        sha256 TEXT PRIMARY KEY, path TEXT, mime TEXT, bytes INTEGER,
+        width INTEGER, height INTEGER, thumbs TEXT
+    )''')
+    conn.commit()
+
+
+def _store_path(sha, ext):
+    return os.path.join(STORE_DIR, sha[:2], f"{sha}.{ext}")
+
+
+def _thumb_path(sha, width, fmt):
+    return os.path.join(STORE_DIR, sha[:2], f"{sha}_{width}.{fmt}")
+
+
+def _formats():
+    if Image is None: return []
+    return [fmt for fmt in THUMB_FORMATS if features.check(fmt)]
+
+
+def make_thumbnails(sha, data):
+    """Erzeugt Vorschaubilder (nie größer als das Original). Liefert (breite, höhe, {"160": {"webp": pfad}})"""
+    if Image is None: return None, None, {}
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        width, height = img.size
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        thumbs = {}
+        for w in THUMB_WIDTHS:
+            if w > width and thumbs: break
+            tw = min(w, width)
+            resized = img.resize((tw, max(1, round(height * tw / width))), Image.LANCZOS)
+            for fmt in _formats():
+                path = _thumb_path(sha, tw, fmt)
+                if not os.path.exists(path):
+                    resized.save(path, fmt.upper(), quality=THUMB_QUALITY[fmt])
+                thumbs.setdefault(str(tw), {})[fmt] = path
+    return width, height, thumbs
+
+
+def _save_file(conn, data, mime):
+    sha = hashlib.sha256(data).hexdigest()
+    known = conn.execute("SELECT path FROM image_files WHERE sha256 = ?", (sha,)).fetchone()
+    if known and os.path.exists(known[0]):
+        metrics.inc("images.dedup_hits")
+        return sha
+    # Neu oder Datei fehlt (z.B. DB ohne images/ kopiert) -> (wieder) ablegen
+    path = _store_path(sha, MIME_EXT.get(mime, "bin"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    width = height = None
+    thumbs = {}
+    try:
+        with metrics.span("images.thumbnails"):
+            width, height, thumbs = make_thumbnails(sha, data)
+    except Exception as e:
+        print(f"    ⚠️ Vorschaubild fehlgeschlagen ({sha[:10]}): {e}")
+    conn.execute("INSERT OR REPLACE INTO image_files (sha256, path, mime, bytes, width, height, thumbs) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (sha, path, mime, len(data), width, height, json.dumps(thumbs, separators=(",", ":"))))
+    metrics.inc("images.stored")
+    return sha
+
+
+def fetch(conn, url, session=None):
+    """Lädt ein Bild einmalig herunter (bereits bekannte URLs ohne Netzwerk). Liefert sha256 oder None."""
+    row = conn.execute("SELECT sha256 FROM images WHERE url = ?", (url,)).fetchone()
+    if row and row[0]:
+        path = conn.execute("SELECT path FROM image_files WHERE sha256 = ?", (row[0],)).fetchone()
+        if path and os.path.exists(path[0]):
+            metrics.inc("images.cache_hits")
+            return row[0]
+
+    try:
+        with metrics.span("http.image"):
+            r = (session or requests).get(url, timeout=TIMEOUT)
+        metrics.inc("http.requests")
+        r.raise_for_status()
+        mime = r.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not mime.startswith("image/"): raise ValueError(f"kein Bild ({mime or 'unbekannt'})")
+        if len(r.content) > MAX_BYTES: raise ValueError(f"zu groß ({len(r.content) // 1024} KB)")
+        sha = _save_file(conn, r.content, mime)
+        error = None
+    except Exception as e:
+        # Fehlt nur das Original (Vorschaubilder sind noch da), bleibt die bekannte Zuordnung erhalten
+        sha, error = (row[0] if row else None), str(e)[:200]
+        print(f"    ⚠️ Bild-Download fehlgeschlagen: {url[-50:]} ({error})")
+
+    conn.execute("INSERT OR REPLACE INTO images (url, sha256, fetched, error) VALUES (?, ?, ?, ?)",
+                 (url, sha, datetime.now().isoformat(), error))
+    conn.commit()
+    return sha
+
+
+def local_file(conn, url):
+    """(pfad, mime) der lokalen Kopie (lädt bei Bedarf herunter) oder None"""
+    sha = fetch(conn, url)
+    if not sha: return None
+    found = conn.execute("SELECT path, mime FROM image_files WHERE sha256 = ?", (sha,)).fetchone()
+    return found if found and os.path.exists(found[0]) else None
+
+
+def vision_url(conn, url):
+    """Data-URL aus der lokalen Kopie für die Vision-API; Fallback: Original-URL"""
+    found = local_file(conn, url) if conn is not None else None
+    if not found: return url
+    path, mime = found
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+
+def upcoming_urls(conn, first_only=False):
+    """Bild-URLs kommender Events (first_only: nur das erste Bild, wie auf der Website)"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = conn.execute("SELECT image_urls FROM events WHERE start_iso >= ? AND image_urls IS NOT NULL AND image_urls != ''",
+                        (today,)).fetchall()
+    urls = set()
+    for (s,) in rows:
+        parts = [u.strip() for u in s.split(",")]
+        urls.update(u for u in (parts[:1] if first_only else parts) if u.startswith("http"))
+    return urls
+
+
+def thumbnails(conn, url):
+    """Vorschaubilder einer URL (nur aus dem Cache, kein Netzwerk): {"160": {"webp": pfad, ...}, ...}"""
+    row = conn.execute("""SELECT f.thumbs FROM images i JOIN image_files f ON f.sha256 = i.sha256
+                          WHERE i.url = ?""", (url,)).fetchone()
+    return json.loads(row[0]) if row and row[0] else {}
+
+
+def site_thumbnail(thumbs):
+    """Die Größe, die die Website zeigt (die kleinste): {"webp": pfad, "avif": pfad}"""
+    return thumbs[min(thumbs, key=int)] if thumbs else {}
+
+
+def site_files(conn):
+    """Pfade aller Vorschaubilder, die die Website für kommende Events braucht"""
+    files = set()
+    for url in upcoming_urls(conn, first_only=True):
+        files.update(site_thumbnail(thumbnails(conn, url)).values())
+    return sorted(p for p in files if os.path.exists(p))
+
+
+def prune(conn):
+    """Löscht Zuordnungen, Dateieinträge und Dateien, die kein kommendes Event mehr nutzt. Liefert (urls, dateien)."""
+    keep = upcoming_urls(conn)
+    stale = [u for (u,) in conn.execute("SELECT url FROM images") if u not in keep]
+    conn.executemany("DELETE FROM images WHERE url = ?", [(u,) for u in stale])
+    conn.execute("DELETE FROM image_files WHERE sha256 NOT IN (SELECT sha256 FROM images WHERE sha256 IS NOT NULL)")
+    conn.commit()
+    shas = {sha for (sha,) in conn.execute("SELECT sha256 FROM image_files")}
+    removed = 0
+    if os.path.isdir(STORE_DIR):
+        for sub in os.listdir(STORE_DIR):
+            folder = os.path.join(STORE_DIR, sub)
+            if not os.path.isdir(folder): continue
+            # <sha>.<ext> (Original) und <sha>_<breite>.<format> (Vorschaubild)
+            for name in os.listdir(folder):
+                if name.split(".")[0].split("_")[0] not in shas:
+                    os.remove(os.path.join(folder, name))
+                    removed += 1
+            if not os.listdir(folder): os.rmdir(folder)
+    metrics.inc("images.pruned", removed)
+    return len(stale), removed
+
+
+@profiling.profiled("images")
+@metrics.track_run("images")
+def main():
+    parser = argparse.ArgumentParser(description="Plakat-Cache: Download, Dedup, Vorschaubilder")
+    parser.add_argument("-retry", action="store_true", help="Fehlgeschlagene Downloads erneut versuchen")
+    parser.add_argument("-site", metavar="DATEI", help="Nur die Pfade der Vorschaubilder der Website in DATEI schreiben (für git add)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    init_tables(conn)
+    if args.site:
+        files = site_files(conn)
+        conn.close()
+        with open(args.site, "w", encoding="utf-8") as f:
+            f.write("".join(p + "\n" for p in files))
+        print(f"🖼️  {len(files)} Vorschaubilder der Website -> {args.site}")
+        return
+    urls = sorted(upcoming_urls(conn))
+    known = {u for (u,) in conn.execute("SELECT url FROM images WHERE sha256 IS NOT NULL" + ("" if args.retry else " OR error IS NOT NULL"))}
+    todo = [u for u in urls if u not in known]
+
+    print(f"--- 🖼️  IMAGES: {len(urls)} URLs, {len(todo)} neu (Formate: {', '.join(_formats()) or 'keine (Pillow fehlt)'}) ---")
+    session = requests.Session()
+    for url in todo:
+        fetch(conn, url, session)
+    stale, removed = prune(conn)
+    if stale or removed:
+        print(f"🧹 {stale} alte URLs, {removed} Dateien entfernt")
+
+    files, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM image_files").fetchone()
+    mapped = conn.execute("SELECT COUNT(*) FROM images WHERE sha256 IS NOT NULL").fetchone()[0]
+    conn.close()
+    print(f"✅ {mapped} URLs -> {files} Dateien ({size / 1024 / 1024:.1f} MB) in {STORE_DIR}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- KONFIGURATION ---
+METRICS_DIR = os.getenv("EVKO_METRICS_DIR", "metrics")
+# EVKO_METRICS_PROM=1 -> zusätzlich Prometheus Textformat (.prom) schreiben
+METRICS_PROM = os.getenv("EVKO_METRICS_PROM", "0") not in ("", "0", "false")
+
+# Preise in USD pro 1 Mio. Tokens (Input, Output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-3-small": (0.02, 0.0),
+}
+
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_run_started = datetime.now()
+
+
+def record_span(name, seconds):
+    """Trägt eine gemessene Dauer (Sekunden) unter `name` ein"""
+    with _lock:
+        s = _spans.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        s["count"] += 1
+        s["total_s"] += seconds
+        if seconds > s["max_s"]: s["max_s"] = seconds
+
+
+@contextmanager
+def span(name):
+    """Misst die Laufzeit des with-Blocks: `with metrics.span("http.get"): ...`"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - t0)
+
+
+def inc(name, value=1):
+    """Erhöht einen Zähler"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record_usage(model, usage, price_factor=1.0):
+    """Zählt Tokens und Kosten aus dem `usage` Objekt einer OpenAI Antwort (price_factor: z.B. 0.5 für Batch)"""
+    if usage is None: return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    inc(f"openai.{model}.calls")
+    inc(f"openai.{model}.prompt_tokens", prompt)
+    inc(f"openai.{model}.completion_tokens", completion)
+    # Vom Anbieter gecachter Prompt-Präfix (günstiger und schneller)
+    details = getattr(usage, "prompt_tokens_details", None)
+    inc(f"openai.{model}.cached_tokens", getattr(details, "cached_tokens", 0) or 0)
+    inc("openai.cost_usd", (prompt * price_in + completion * price_out) * price_factor / 1_000_000)
+
+
+def snapshot():
+    with _lock:
+        return {
+            "started": _run_started.isoformat(),
+            "spans": {k: dict(v) for k, v in sorted(_spans.items())},
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def to_prometheus(run_name, data):
+    """Wandelt einen Snapshot in das Prometheus Textformat um"""
+    def clean(name): return "".join(ch if ch.isalnum() else "_" for ch in name)
+
+    lines = [
+        "# TYPE evko_span_seconds_total counter",
+        "# TYPE evko_span_count counter",
+        "# TYPE evko_span_max_seconds gauge",
+    ]
+    for name, s in data["spans"].items():
+        label = f'{{run="{run_name}",span="{name}"}}'
+        lines.append(f"evko_span_seconds_total{label} {s['total_s']:.6f}")
+        lines.append(f"evko_span_count{label} {s['count']}")
+        lines.append(f"evko_span_max_seconds{label} {s['max_s']:.6f}")
+    for name, val in data["counters"].items():
+        metric = f"evko_{clean(name)}"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f'{metric}{{run="{run_name}"}} {val}')
+    return "\n".join(lines) + "\n"
+
+
+def run_stamp():
+    """Zeitstempel des Laufs, gemeinsam genutzt für alle Artefakt-Dateinamen"""
+    return _run_started.strftime("%Y%m%d-%H%M%S")
+
+
+def write_run(run_name):
+    """Schreibt die Metriken des aktuellen Laufs nach METRICS_DIR. Gibt den JSON-Pfad zurück."""
+    data = snapshot()
+    data["run"] = run_name
+    data["finished"] = datetime.now().isoformat()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{run_name}_{run_stamp()}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    if METRICS_PROM:
+        with open(path[:-5] + ".prom", "w", encoding="utf-8") as f:
+            f.write(to_prometheus(run_name, data))
+    return path
+
+
+def print_summary(top_n=8):
+    data = snapshot()
+    slowest = sorted(data["spans"].items(), key=lambda x: x[1]["total_s"], reverse=True)[:top_n]
+    if not slowest: return
+    print("📊 Zeitverbrauch:")
+    for name, s in slowest:
+        print(f"   {name:<32} {s['total_s']:>8.2f}s  ({s['count']}x, max {s['max_s']:.2f}s)")
+    cost = data["counters"].get("openai.cost_usd")
+    if cost: print(f"   💰 OpenAI Kosten: ${cost:.4f}")
+
+
+def track_run(run_name):
+    """Decorator für Einstiegspunkte: misst den ganzen Lauf und schreibt am Ende die Metrik-Datei"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                with span("run.total"):
+                    return func(*args, **kwargs)
+            finally:
+                print_summary()
+                try:
+                    print(f"📊 Metriken: {write_run(run_name)}")
+                except OSError as e:
+                    print(f"⚠️ Metriken konnten nicht geschrieben werden: {e}")
+        return wrapper
+    return decorator
@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+
+import metrics
+
+# --- KONFIGURATION ---
+# "Ähnliche Veranstaltungen": Top-K Nachbarn pro Event über das Skalarprodukt der
+# (normalisierten) Embeddings. Ergebnisse werden in event_neighbors gecacht und
+# nur für geänderte Events (bzw. deren betroffene Nachbarn) neu berechnet.
+NEIGHBORS_K = 5
+BLOCK_SIZE = 512    # Zeilen pro Matrix-Block (begrenzt den Speicher auf BLOCK_SIZE x N Scores)
+
+
+def init_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS event_neighbors (
+        url TEXT PRIMARY KEY, vector_key TEXT, neighbors TEXT
+    )''')
+    conn.commit()
+
+
+def _top_k(scores, k):
+    """Indizes der k besten Scores, absteigend sortiert"""
+    k = min(k, len(scores))
+    if k <= 0: return np.array([], dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def _blocked_top_k(matrix, query_idx, k):
+    """Top-K Nachbarn (Index, Score) für die Zeilen `query_idx` gegen alle Zeilen, blockweise"""
+    result = {}
+    for s in range(0, len(query_idx), BLOCK_SIZE):
+        block = query_idx[s:s + BLOCK_SIZE]
+        scores = matrix[block] @ matrix.T
+        scores[np.arange(len(block)), block] = -np.inf   # sich selbst ausschließen
+        for row, i in enumerate(block):
+            top = _top_k(scores[row], k)
+            result[i] = [(int(j), float(scores[row, j])) for j in top]
+    return result
+
+
+def update(conn, items, k=NEIGHBORS_K):
+    """
+    items: Liste von (url, vector_key, vector) - vector_key ändert sich, wenn sich der Vektor ändert
+    (z.B. Modell + embedding_hash). Liefert {url: [nachbar_url, ...]}.
+    """
+    init_table(conn)
+    items = [it for it in items if it[2] is not None and len(it[2])]
+    if len(items) < 2:
+        return {url: [] for url, _, _ in items}
+
+    urls = [it[0] for it in items]
+    pos = {url: i for i, url in enumerate(urls)}
+    matrix = np.asarray([it[2] for it in items], dtype=np.float32)
+
+    cached = {row[0]: (row[1], json.loads(row[2])) for row in
+              conn.execute("SELECT url, vector_key, neighbors FROM event_neighbors")}
+
+    # Neu/geändert: Vektor-Key weicht ab (oder kein Key vorhanden)
+    changed = {url for url, key, _ in items if not key or url not in cached or cached[url][0] != key}
+    gone = (set(cached) - set(pos)) | changed
+
+    # Unveränderte Events, deren Liste ein verschwundenes/geändertes Event enthält -> komplett neu
+    dirty = set(changed)
+    for url, key, _ in items:
+        if url not in dirty and any(n in gone for n, _ in cached[url][1]):
+            dirty.add(url)
+
+    result = {}
+    if dirty:
+        with metrics.span("neighbors.full"):
+            full = _blocked_top_k(matrix, np.array(sorted(pos[u] for u in dirty)), k)
+        for i, pairs in full.items():
+            result[urls[i]] = [(urls[j], score) for j, score in pairs]
+
+    # Restliche Events: nur gegen die geänderten Vektoren vergleichen und mit dem Cache mischen
+    keep = [u for u in urls if u not in dirty]
+    if keep and changed:
+        with metrics.span("neighbors.merge"):
+            changed_idx = np.array([pos[u] for u in changed])
+            for s in range(0, len(keep), BLOCK_SIZE):
+                block = keep[s:s + BLOCK_SIZE]
+                scores = matrix[[pos[u] for u in block]] @ matrix[changed_idx].T
+                for row, url in enumerate(block):
+                    pairs = cached[url][1] + [(urls[j], float(sc)) for j, sc in zip(changed_idx, scores[row])]
+                    result[url] = sorted(pairs, key=lambda p: p[1], reverse=True)[:k]
+    for url in keep:
+        if url not in result:
+            result[url] = [tuple(p) for p in cached[url][1]]
+
+    metrics.inc("neighbors.recomputed", len(dirty))
+    metrics.inc("neighbors.merged", len(keep) if changed else 0)
+
+    keys = {url: key for url, key, _ in items}
+    conn.execute("DELETE FROM event_neighbors WHERE url NOT IN (SELECT value FROM json_each(?))", (json.dumps(urls),))
+    conn.executemany("INSERT OR REPLACE INTO event_neighbors (url, vector_key, neighbors) VALUES (?, ?, ?)",
+                     [(url, keys[url], json.dumps(result[url])) for url in urls
+                      if url in dirty or (changed and url in result)])
+    conn.commit()
+    print(f"   🔗 Nachbarn: {len(dirty)} neu berechnet, {len(keep) if changed else 0} aktualisiert, {len(urls)} gesamt")
+    return {url: [n for n, _ in pairs] for url, pairs in result.items()}
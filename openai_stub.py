@@ -0,0 +1,166 @@
+import json
+import hashlib
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# --- KONFIGURATION ---
+# Lokaler Ersatz für die OpenAI Endpunkte (Embeddings, Chat, Files + Batches), damit
+# Benchmarks und Tests ohne Netzwerk, API-Key und Kosten laufen.
+STUB_DIM = 1536
+STUB_ANSWER = "Stub-Antwort: Hier sind passende Veranstaltungen."
+STUB_JSON_ANSWER = '{"events": []}'     # bei response_format=json_object
+
+
+def stub_vector(text, dim=STUB_DIM):
+    """Deterministischer Einheitsvektor aus dem Text (gleicher Text -> gleicher Vektor)"""
+    seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _count_tokens(text):
+    # Grobe Schätzung reicht für den Stub (ca. 4 Zeichen pro Token)
+    return max(1, len(text) // 4)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server_version = "EvkoOpenAIStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chat_completion(self, req):
+        stub = self.server
+        prompt = json.dumps(req.get("messages", []), ensure_ascii=False)
+        answer = STUB_JSON_ANSWER if (req.get("response_format") or {}).get("type") == "json_object" else STUB_ANSWER
+        p_tok = _count_tokens(prompt)
+        c_tok = _count_tokens(answer)
+        return {
+            "id": f"chatcmpl-stub-{stub.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": p_tok, "completion_tokens": c_tok, "total_tokens": p_tok + c_tok},
+        }
+
+    def _store_file(self, data, purpose):
+        stub = self.server
+        file_id = f"file-stub-{len(stub.files) + 1}"
+        stub.files[file_id] = data
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": f"{file_id}.jsonl", "purpose": purpose}
+
+    def _run_batch(self, req):
+        """Batches werden sofort komplett abgearbeitet (Status 'completed')"""
+        stub = self.server
+        out = []
+        for line in stub.files[req["input_file_id"]].decode('utf-8').splitlines():
+            if not line.strip(): continue
+            item = json.loads(line)
+            out.append(json.dumps({"id": f"batch-req-{len(out)}", "custom_id": item["custom_id"], "error": None,
+                                   "response": {"status_code": 200, "body": self._chat_completion(item["body"])}}))
+        output = self._store_file(("\n".join(out) + "\n").encode('utf-8'), "batch_output")
+        batch_id = f"batch-stub-{len(stub.batches) + 1}"
+        now = int(time.time())
+        stub.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": req.get("endpoint"), "input_file_id": req["input_file_id"],
+            "completion_window": req.get("completion_window", "24h"), "status": "completed",
+            "output_file_id": output["id"], "error_file_id": None, "created_at": now, "completed_at": now,
+            "request_counts": {"total": len(out), "completed": len(out), "failed": 0},
+        }
+        return stub.batches[batch_id]
+
+    def do_GET(self):
+        stub = self.server
+        if self.path.startswith("/v1/batches/") and self.path[len("/v1/batches/"):] in stub.batches:
+            self._send(200, stub.batches[self.path[len("/v1/batches/"):]])
+        elif self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+            data = stub.files.get(self.path[len("/v1/files/"):-len("/content")])
+            if data is None:
+                self._send(404, {"error": {"message": "Unbekannte Datei"}})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send(404, {"error": {"message": f"Unbekannter Pfad {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        stub = self.server
+        if self.path.endswith("/files"):
+            # multipart/form-data: Teile "file" und "purpose"
+            msg = BytesParser().parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw)
+            parts = {p.get_param("name", header="content-disposition"): p.get_payload(decode=True) for p in msg.get_payload()}
+            self._send(200, self._store_file(parts.get("file") or b"", (parts.get("purpose") or b"batch").decode()))
+            return
+        req = json.loads(raw or b"{}")
+        stub.request_count += 1
+
+        if stub.latency: time.sleep(stub.latency)
+        if stub.fail_every and stub.request_count % stub.fail_every == 0:
+            self._send(429, {"error": {"message": "Rate limit (stub)", "type": "rate_limit_error"}})
+            return
+
+        if self.path.endswith("/embeddings"):
+            inputs = req.get("input", [])
+            if isinstance(inputs, str): inputs = [inputs]
+            tokens = sum(_count_tokens(t) for t in inputs)
+            self._send(200, {
+                "object": "list",
+                "model": req.get("model", "stub"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": stub_vector(t, stub.dim).tolist()}
+                    for i, t in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+        elif self.path.endswith("/chat/completions"):
+            self._send(200, self._chat_completion(req))
+        elif self.path.endswith("/batches"):
+            self._send(200, self._run_batch(req))
+        else:
+            self._send(404, {"error": {"message": f"Unbekannter Pfad {self.path}"}})
+
+
+def start_stub(port=0, dim=STUB_DIM, latency=0.0, fail_every=0):
+    """Startet den Stub-Server im Hintergrund. Gibt (server, base_url) zurück."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StubHandler)
+    server.daemon_threads = True
+    server.dim = dim
+    server.latency = latency
+    server.fail_every = fail_every
+    server.request_count = 0
+    server.files = {}
+    server.batches = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    srv, url = start_stub(port=8765)
+    print(f"🧪 OpenAI-Stub läuft auf {url} (Strg+C zum Beenden)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
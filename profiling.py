@@ -0,0 +1,149 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import functools
+import threading
+import tracemalloc
+from collections import Counter
+
+import metrics
+
+# --- KONFIGURATION ---
+# Jeder Einstiegspunkt versteht zusätzlich:
+#   --profile [cprofile|sample]   Profiling aktivieren (Standard: cprofile)
+#   --profile-top N               Anzahl Hot-Functions in der Zusammenfassung
+# Die Ergebnisse landen neben den Metriken des Laufs (metrics.METRICS_DIR).
+DEFAULT_TOP_N = 15
+SAMPLE_INTERVAL = 0.005  # Sekunden zwischen zwei Stichproben (sample-Modus)
+
+
+def _pop_profile_args():
+    """Holt die Profiling-Optionen aus sys.argv, damit die eigentlichen Parser sie nicht sehen"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-profile", "--profile", nargs="?", const="cprofile", choices=["cprofile", "sample"])
+    parser.add_argument("-profile-top", "--profile-top", type=int, default=DEFAULT_TOP_N)
+    args, rest = parser.parse_known_args(sys.argv[1:])
+    sys.argv[1:] = rest
+    return args
+
+
+class SamplingProfiler:
+    """Sehr einfacher Stichproben-Profiler: schaut periodisch in den Stack des Haupt-Threads"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    # Gleiche Schnittstelle wie cProfile.Profile
+    def enable(self): self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path):
+        """Collapsed-Stack Format (kompatibel mit flamegraph.pl / speedscope)"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def summary(self, top_n):
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = [fr.rsplit(":", 1)[0] for fr in stack.split(";")]
+            own[frames[-1]] += count
+            for fn in set(frames): total[fn] += count
+        lines = [f"{'EIGEN %':>8} {'GESAMT %':>9}  FUNKTION  ({self.samples} Stichproben)"]
+        for fn, count in own.most_common(top_n):
+            lines.append(f"{100 * count / max(1, self.samples):>7.1f}% {100 * total[fn] / max(1, self.samples):>8.1f}%  {fn}")
+        return "\n".join(lines)
+
+
+def _memory_summary(snapshot, top_n):
+    lines = ["Top Speicher-Allokationen (tracemalloc):"]
+    for stat in snapshot.statistics("lineno")[:top_n]:
+        frame = stat.traceback[0]
+        lines.append(f"   {stat.size / 1024:>10.1f} KB  {stat.count:>7}x  {os.path.basename(frame.filename)}:{frame.lineno}")
+    return "\n".join(lines)
+
+
+def profiled(run_name):
+    """Decorator für Einstiegspunkte: aktiviert Profiling, wenn --profile übergeben wurde"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            opts = _pop_profile_args()
+            if not opts.profile:
+                return func(*args, **kwargs)
+
+            os.makedirs(metrics.METRICS_DIR, exist_ok=True)
+            base = os.path.join(metrics.METRICS_DIR, f"{run_name}_{metrics.run_stamp()}")
+
+            tracemalloc.start()
+            profiler = cProfile.Profile() if opts.profile == "cprofile" else SamplingProfiler()
+            profiler.enable()
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - t0
+                _, peak = tracemalloc.get_traced_memory()
+                mem_text = _memory_summary(tracemalloc.take_snapshot(), opts.profile_top)
+                tracemalloc.stop()
+
+                if opts.profile == "cprofile":
+                    profiler.dump_stats(base + ".prof")
+                    stream = io.StringIO()
+                    stats = pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats("cumulative")
+                    stats.print_stats(opts.profile_top)
+                    stats.sort_stats("tottime").print_stats(opts.profile_top)
+                    hot_text = stream.getvalue()
+                    raw_file = base + ".prof"
+                else:
+                    profiler.write_folded(base + ".folded")
+                    hot_text = profiler.summary(opts.profile_top)
+                    raw_file = base + ".folded"
+
+                report = (f"Profil: {run_name} ({opts.profile})\n"
+                          f"Laufzeit: {elapsed:.2f}s | Peak Speicher (tracemalloc): {peak / 1024 / 1024:.1f} MB\n\n"
+                          f"{hot_text}\n\n{mem_text}\n")
+                with open(base + "_profile.txt", "w", encoding="utf-8") as f:
+                    f.write(report)
+
+                print(f"\n🔬 PROFIL ({opts.profile}) | Laufzeit {elapsed:.2f}s | Peak RAM {peak / 1024 / 1024:.1f} MB")
+                print(hot_text if opts.profile == "sample" else _top_lines(profiler, opts.profile_top))
+                print(f"🔬 Dateien: {raw_file}, {base}_profile.txt")
+        return wrapper
+    return decorator
+
+
+def _top_lines(profiler, top_n):
+    """Kompakte Konsolen-Zusammenfassung der cProfile Daten (nach Eigenzeit)"""
+    stats = pstats.Stats(profiler).strip_dirs()
+    rows = sorted(stats.stats.items(), key=lambda x: x[1][2], reverse=True)[:top_n]
+    lines = [f"{'EIGEN s':>9} {'GESAMT s':>9} {'AUFRUFE':>9}  FUNKTION"]
+    for (file, line, fn), (cc, nc, tt, ct, _) in rows:
+        lines.append(f"{tt:>9.3f} {ct:>9.3f} {nc:>9}  {file}:{line}({fn})")
+    return "\n".join(lines)
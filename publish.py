@@ -0,0 +1,110 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- KONFIGURATION ---
+# Veröffentlichungs-Stufe: minifizierte Artefakte in dist/, jeweils mit .gz/.br
+# Geschwistern (vorkomprimiert, der Webserver liefert sie direkt aus). Dateien
+# bekommen einen Content-Hash im Namen -> dürfen unbegrenzt gecacht werden.
+# Nur der Einstiegspunkt (index.html) behält seinen Namen.
+DIST_DIR = "dist"
+MANIFEST_FILE = "manifest.json"
+ENTRY_POINTS = {"index.html"}
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).replace(";}", "}").strip()
+
+
+def minify_html(html):
+    """Entfernt Kommentare und überflüssige Leerzeichen. <script>/<pre> Blöcke bleiben unverändert."""
+    protected = []
+
+    def protect(m):
+        protected.append(m.group(0))
+        return f"\x00{len(protected) - 1}\x00"
+
+    html = re.sub(r"<(script|pre|textarea)\b.*?</\1>", protect, html, flags=re.S | re.I)
+    html = re.sub(r"<style>(.*?)</style>", lambda m: "<style>" + minify_css(m.group(1)) + "</style>", html, flags=re.S)
+    html = re.sub(r"<!--.*?-->", "", html, flags=re.S)
+    html = re.sub(r">\s+<", "><", html)
+    html = re.sub(r"\s{2,}", " ", html)
+    html = re.sub(r"\x00(\d+)\x00", lambda m: protected[int(m.group(1))], html)
+    return html.strip()
+
+
+def compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def hashed_name(name, data):
+    base, ext = os.path.splitext(name)
+    return f"{base}.{content_hash(data)}{ext}"
+
+
+def _write(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_compressed(path, data):
+    """Schreibt die Datei plus .gz (und .br, falls brotli installiert ist). Liefert die Größen."""
+    sizes = {"raw": len(data)}
+    _write(path, data)
+    # mtime=0 -> identischer Inhalt ergibt byte-identische .gz Dateien (keine unnötigen Commits)
+    gz = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    _write(path + ".gz", gz)
+    sizes["gz"] = len(gz)
+    if brotli:
+        br = brotli.compress(data, quality=BROTLI_QUALITY)
+        _write(path + ".br", br)
+        sizes["br"] = len(br)
+    return sizes
+
+
+def publish(files, dist_dir=DIST_DIR):
+    """
+    files: {logischer Name: bytes}. Schreibt alle Artefakte nach dist/ und ein Manifest
+    (logischer Name -> Dateiname + Größen). Nicht mehr referenzierte Dateien werden gelöscht.
+    """
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    with metrics.span("publish.compress"):
+        for name, data in files.items():
+            target = name if name in ENTRY_POINTS else hashed_name(name, data)
+            sizes = write_compressed(os.path.join(dist_dir, target), data)
+            manifest[name] = {"file": target, **sizes}
+
+    keep = {MANIFEST_FILE}
+    for entry in manifest.values():
+        keep |= {entry["file"], entry["file"] + ".gz", entry["file"] + ".br"}
+    for name in os.listdir(dist_dir):
+        if name not in keep:
+            os.remove(os.path.join(dist_dir, name))
+
+    _write(os.path.join(dist_dir, MANIFEST_FILE), json.dumps(manifest, indent=2).encode('utf-8'))
+    for name, entry in manifest.items():
+        metrics.inc("publish.bytes_raw", entry["raw"])
+        metrics.inc("publish.bytes_gz", entry["gz"])
+        extra = f" | br {entry['br'] / 1024:.1f} KB" if "br" in entry else ""
+        print(f"   📦 {entry['file']}: {entry['raw'] / 1024:.1f} KB | gz {entry['gz'] / 1024:.1f} KB{extra}")
+    return manifest
@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+# --- KONFIGURATION ---
+DB_FILE = "evko.db"
+
+# Wiederbesuchs-Intervall (Stunden) = BASE / Änderungsrate, begrenzt auf [MIN, MAX]
+BASE_INTERVAL_H = 12
+MIN_INTERVAL_H = 10
+MAX_INTERVAL_H = 24 * 14
+# Seiten in naher Zukunft werden normal oft besucht, weiter entfernte seltener
+NEAR_TERM_DAYS = 14
+HORIZON_SLOWDOWN_DAYS = 30     # Pro 30 Tage Entfernung -> Intervall +100%
+MAX_HORIZON_FACTOR = 6
+# Spiele der letzten Tage ohne Endstand -> Quelle sofort wieder besuchen
+RESULT_LOOKBACK_DAYS = 3
+
+# Quellen (= Scraper). Jeder Scraper schreibt seine Quelle in events.source.
+SOURCES = ["evko", "kinderwelt", "handball", "kicks"]
+RESULT_SOURCES = ["handball", "kicks"]
+# Nur für Altbestand ohne events.source (einmalige Migration): URL-Schema der Korneuburger Scraper
+LEGACY_SOURCE_CONDITIONS = {
+    "kicks": "(url LIKE 'verband_%' OR url LIKE 'liga_%')",
+    "handball": "url LIKE '%#match-%'",
+    "kinderwelt": "url LIKE '%kinderwelt%'",
+    "evko": "1",
+}
+
+
+def init_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS crawl_stats (
+        source TEXT, page TEXT, last_hash TEXT, horizon_days INTEGER,
+        checks INTEGER DEFAULT 0, changes INTEGER DEFAULT 0,
+        last_checked TIMESTAMP, last_changed TIMESTAMP,
+        PRIMARY KEY (source, page)
+    )''')
+    conn.commit()
+    init_source_column(conn)
+
+
+def init_source_column(conn):
+    """Spalte events.source (+ Index); Altbestand ohne Quelle einmalig über das URL-Schema zuordnen"""
+    try:
+        conn.execute("ALTER TABLE events ADD COLUMN source TEXT")
+        print("✅ Spalte 'source' wurde hinzugefügt.")
+    except sqlite3.OperationalError: pass
+    try:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_source ON events(source, start_iso)")
+        for source, condition in LEGACY_SOURCE_CONDITIONS.items():
+            conn.execute(f"UPDATE events SET source = ? WHERE source IS NULL AND {condition}", (source,))
+        conn.commit()
+    except sqlite3.OperationalError: pass   # noch keine events-Tabelle
+
+
+def page_fingerprint(hashes):
+    """Fingerprint einer Seite aus den content_hash Werten ihrer Einträge"""
+    return hashlib.md5("|".join(hashes).encode('utf-8')).hexdigest()
+
+
+def horizon_from_dates(iso_dates, now=None):
+    """Tage bis zum frühesten (zukünftigen) Event einer Seite"""
+    today = (now or datetime.now()).strftime("%Y-%m-%d")
+    future = sorted(d for d in iso_dates if d and d >= today)
+    if not future: return 0
+    return (datetime.strptime(future[0], "%Y-%m-%d") - datetime.strptime(today, "%Y-%m-%d")).days
+
+
+def record_visit(conn, source, page, fingerprint, horizon_days=0):
+    """Speichert einen Besuch. Gibt True zurück, wenn sich die Seite seit dem letzten Mal geändert hat."""
+    now = datetime.now().isoformat()
+    row = conn.execute("SELECT last_hash FROM crawl_stats WHERE source = ? AND page = ?", (source, page)).fetchone()
+    changed = row is None or row[0] != fingerprint
+    conn.execute('''INSERT INTO crawl_stats (source, page, last_hash, horizon_days, checks, changes, last_checked, last_changed)
+                    VALUES (?, ?, ?, ?, 1, 1, ?, ?)
+                    ON CONFLICT(source, page) DO UPDATE SET
+                    last_hash=excluded.last_hash, horizon_days=excluded.horizon_days,
+                    checks=checks + 1, changes=changes + ?, last_checked=excluded.last_checked,
+                    last_changed=CASE WHEN ? THEN excluded.last_changed ELSE last_changed END''',
+                 (source, page, fingerprint, horizon_days, now, now, int(changed), int(changed)))
+    conn.commit()
+    return changed
+
+
+def last_fingerprint(conn, source, page):
+    """Fingerprint vom letzten Besuch (oder None)"""
+    row = conn.execute("SELECT last_hash FROM crawl_stats WHERE source = ? AND page = ?", (source, page)).fetchone()
+    return row[0] if row else None
+
+
+def change_rate(checks, changes):
+    """Geglättete Änderungswahrscheinlichkeit pro Besuch (Laplace)"""
+    return (changes + 1) / (checks + 2)
+
+
+def revisit_interval_hours(checks, changes, horizon_days):
+    interval = BASE_INTERVAL_H / change_rate(checks, changes)
+    if horizon_days and horizon_days > NEAR_TERM_DAYS:
+        interval *= min(MAX_HORIZON_FACTOR, 1 + (horizon_days - NEAR_TERM_DAYS) / HORIZON_SLOWDOWN_DAYS)
+    return max(MIN_INTERVAL_H, min(MAX_INTERVAL_H, interval))
+
+
+def _hours_since(iso_ts, now):
+    try:
+        return (now - datetime.fromisoformat(iso_ts)).total_seconds() / 3600
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def is_due(conn, source, page, now=None):
+    """Soll diese Seite in diesem Lauf besucht werden?"""
+    now = now or datetime.now()
+    row = conn.execute("SELECT checks, changes, horizon_days, last_checked FROM crawl_stats WHERE source = ? AND page = ?",
+                       (source, page)).fetchone()
+    if not row: return True
+    checks, changes, horizon, last_checked = row
+    return _hours_since(last_checked, now) >= revisit_interval_hours(checks, changes, horizon)
+
+
+def page_budget(conn, source, max_pages, page_key=lambda p: f"listing:{p}"):
+    """Höchste fällige Seitennummer einer paginierten Quelle (mind. 1).
+    Ist die letzte bekannte Seite fällig, darf weitergeblättert werden (neue Seiten entdecken)."""
+    known = [p for p in range(1, max_pages + 1)
+             if conn.execute("SELECT 1 FROM crawl_stats WHERE source = ? AND page = ?", (source, page_key(p))).fetchone()]
+    if not known: return max_pages
+    due = [p for p in known if is_due(conn, source, page_key(p))]
+    if known[-1] in due: return max_pages
+    return max(due, default=1)
+
+
+def due_after(conn, source, page, max_pages, page_key=lambda p: f"listing:{p}"):
+    """Ist irgendeine bekannte Seite NACH `page` fällig?"""
+    for p in range(page + 1, max_pages + 1):
+        key = page_key(p)
+        if conn.execute("SELECT 1 FROM crawl_stats WHERE source = ? AND page = ?", (source, key)).fetchone() and is_due(conn, source, key):
+            return True
+    return False
+
+
+def results_pending(conn, source, now=None):
+    """Gibt es kürzlich gespielte Spiele dieser Quelle ohne Endstand?"""
+    if source not in RESULT_SOURCES: return False
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    since = (now - timedelta(days=RESULT_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+    row = conn.execute("""SELECT COUNT(*) FROM events WHERE source = ?
+                          AND start_iso BETWEEN ? AND ? AND description NOT LIKE '%Endstand%'""",
+                       (source, since, today)).fetchone()
+    return row[0] > 0
+
+
+def plan(conn, now=None):
+    """Entscheidet pro Quelle, ob sie in diesem Lauf gescraped werden soll. Gibt {source: (due, grund)} zurück."""
+    now = now or datetime.now()
+    decisions = {}
+    for source in SOURCES:
+        pages = conn.execute("SELECT page FROM crawl_stats WHERE source = ?", (source,)).fetchall()
+        if not pages:
+            decisions[source] = (True, "keine Historie")
+        elif results_pending(conn, source, now):
+            decisions[source] = (True, "Ergebnisse ausständig")
+        else:
+            due = [p[0] for p in pages if is_due(conn, source, p[0], now)]
+            decisions[source] = (bool(due), f"{len(due)}/{len(pages)} Seiten fällig")
+    return decisions
+
+
+def print_stats(conn):
+    now = datetime.now()
+    rows = conn.execute("SELECT source, page, checks, changes, horizon_days, last_checked FROM crawl_stats ORDER BY source, page").fetchall()
+    print(f"{'QUELLE':<11} | {'SEITE':<28} | {'RATE':>5} | {'HORIZ.':>6} | {'INTERVALL':>9} | FÄLLIG")
+    print("-" * 90)
+    for source, page, checks, changes, horizon, last_checked in rows:
+        interval = revisit_interval_hours(checks, changes, horizon)
+        due = _hours_since(last_checked, now) >= interval
+        print(f"{source:<11} | {page[-28:]:<28} | {change_rate(checks, changes):>5.2f} | {horizon or 0:>5}d | {interval:>8.0f}h | {'✅' if due else '💤'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EVKO Crawl-Scheduler")
+    parser.add_argument("-plan", action="store_true", help="Fällige Quellen bestimmen (schreibt auch nach $GITHUB_OUTPUT)")
+    parser.add_argument("-stats", action="store_true", help="Änderungsraten pro Seite anzeigen")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_FILE):
+        decisions = {s: (True, "keine Datenbank") for s in SOURCES}
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        init_table(conn)
+        if args.stats: print_stats(conn)
+        decisions = plan(conn)
+        conn.close()
+
+    if args.plan or not args.stats:
+        print("--- 🗓️  CRAWL PLAN ---")
+        for source, (due, reason) in decisions.items():
+            print(f"  {'✅' if due else '💤'} {source:<11} ({reason})")
+        gh_output = os.getenv("GITHUB_OUTPUT")
+        if args.plan and gh_output:
+            with open(gh_output, "a", encoding="utf-8") as f:
+                for source, (due, _) in decisions.items():
+                    f.write(f"{source}={'true' if due else 'false'}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,15 +11,25 @@ import re
 import base64
 from datetime import datetime
 from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
-import openai 
+import metrics
+import profiling
+import scheduler
+import tenants
+import boilerplate
+import images
+import ai_client
+import ai_jobs
 
 # --- 1. SETUP ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+AI_ENABLED = bool(OPENAI_API_KEY)   # Anfragen laufen über ai_client (Rate-Limit, Retries)
 
 # --- 2. CONFIG ---
 DB_FILE = "evko.db"
+SOURCE = "evko"   # events.source (siehe scheduler.SOURCES)
 AI_MARKER = "--- ZUSATZINFO AUS PLAKAT ---"
+MAX_PAGES = 20
+EARLY_STOP_PAGES = 2   # So viele unveränderte Listenseiten in Folge -> Crawl beenden
 
 # URLs Base64 kodiert
 _SOURCE_BASE_B64 = "aHR0cHM6Ly93d3cua29ybmV1YnVyZy5ndi5hdA=="
@@ -28,6 +38,9 @@ _SOURCE_START_B64 = "aHR0cHM6Ly93d3cua29ybmV1YnVyZy5ndi5hdC9TdGFkdC9LdWx0dXIvVmV
 TITLE_TAG_WHITELIST = ["Shopping-Event", "Kultur- und Musiktage", "Kabarett-Picknick", "Werftbühne", "Ausstellung", "Sonderausstellung", "Vernissage", "Lesung", "Konzert", "Flohmarkt", "Kindermaskenball"]
 SUBTITLE_REMOVE_LIST = ["Veranstaltungen - Rathaus", "Veranstaltungen - Stadt", "Veranstaltungen -"]
 REFERER_LIST = ["https://www.google.com/", "https://www.bing.com/", "https://www.wix.com/", "https://duckduckgo.com/"]
+# Mandant: Quellen-Konfiguration aus tenants.json überschreibt die Werte oben
+TENANT = tenants.configure(globals(), "evko")
+
 ua = UserAgent()
 
 def decode_url(b64_string):
@@ -60,6 +73,10 @@ def init_db():
         )
     ''')
     conn.commit()
+    scheduler.init_table(conn)
+    boilerplate.init_table(conn)
+    images.init_tables(conn)
+    ai_jobs.init_table(conn)
     return conn
 
 def auto_clean_dates(conn):
@@ -72,6 +89,16 @@ def auto_clean_dates(conn):
 def make_hash(data_string):
     return hashlib.md5(data_string.encode('utf-8')).hexdigest()
 
+def needs_time_fix(db_time):
+    """Zeit fehlt oder enthält noch "Uhr" -> Detailseite neu laden"""
+    return not db_time or len(db_time) < 3 or "uhr" in db_time.lower()
+
+def load_existing_rows(c, urls):
+    """Lädt die gespeicherten Daten aller URLs einer Listenseite mit EINER Abfrage"""
+    if not urls: return {}
+    c.execute(f"SELECT url, content_hash, description, image_urls, time_str FROM events WHERE url IN ({','.join('?' * len(urls))})", urls)
+    return {r[0]: (r[1], r[2] or "", r[3] or "", r[4] or "") for r in c.fetchall()}
+
 def parse_german_date(date_text):
     try:
         clean = re.search(r'\d{2}\.\d{2}\.\d{4}', date_text)
@@ -99,34 +126,48 @@ def get_tags_from_title(title):
                 break
     return found
 
-def analyze_image_content(image_url):
-    if not client: return ""
+def vision_request(image_url, conn=None):
+    """Request-Body der Plakat-Analyse (direkt oder als Job in ai_jobs.py)"""
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Extrahiere Fakten vom Plakat (Datum, Zeit, Preis, Ort). Wenn das Bild KEIN Plakat ist oder KEINEN Text enthält, antworte NUR mit dem Wort 'SKIP'. Sei sonst präzise und kurz."},
+                    {"type": "image_url", "image_url": {"url": images.vision_url(conn, image_url), "detail": "low"}}
+                ]
+            }
+        ],
+        "max_tokens": 300,
+    }
+
+def parse_vision_answer(content):
     REFUSAL_PHRASES = ["tut mir leid", "kann das bild nicht", "keine informationen", "entschuldigung"]
+    content = (content or "").strip()
+    if "SKIP" in content:
+        print("    🚫 AI sagt: Kein Plakat/Text erkannt.")
+        return ""
+    if any(phrase in content.lower() for phrase in REFUSAL_PHRASES): return ""
+    return content
+
+def analyze_image_content(image_url, conn=None):
+    if not AI_ENABLED: return ""
     try:
         print(f"    --> 🤖 AI Vision Anfrage: {image_url[-35:]}...")
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user", 
-                    "content": [
-                        {"type": "text", "text": "Extrahiere Fakten vom Plakat (Datum, Zeit, Preis, Ort). Wenn das Bild KEIN Plakat ist oder KEINEN Text enthält, antworte NUR mit dem Wort 'SKIP'. Sei sonst präzise und kurz."}, 
-                        {"type": "image_url", "image_url": {"url": image_url, "detail": "low"}}
-                    ]
-                }
-            ],
-            max_tokens=300,
-        )
-        content = response.choices[0].message.content.strip()
-        if "SKIP" in content:
-            print("    🚫 AI sagt: Kein Plakat/Text erkannt.")
-            return ""
-        if any(phrase in content.lower() for phrase in REFUSAL_PHRASES): return ""
-        return content
+        response = ai_client.chat_sync(span="openai.vision", **vision_request(image_url, conn))
+        return parse_vision_answer(response.choices[0].message.content)
     except Exception as e:
         print(f"    ⚠️ AI Error: {e}")
         return ""
 
+def apply_vision(conn, url, payload, content):
+    """Ergebnis eines verzögerten Vision-Jobs an die Beschreibung anhängen (nur einmal)"""
+    info = parse_vision_answer(content)
+    if not info: return
+    conn.execute("UPDATE events SET description = COALESCE(description, '') || ? WHERE url = ? AND instr(COALESCE(description, ''), ?) = 0",
+                 (f"\n\n{AI_MARKER}\n{info}", url, AI_MARKER))
+
 def fix_korneuburg_url(url):
     if "GetImage.ashx" not in url: return url
     parsed = urlparse(url)
@@ -152,11 +193,14 @@ def get_best_image_url(container, base_url):
         return fix_korneuburg_url(urljoin(base_url, raw))
     return None
 
-def scrape_details(url, title, existing_desc="", existing_imgs="", use_ai=True):
+def scrape_details(url, title, existing_desc="", existing_imgs="", use_ai=True, conn=None, defer=False):
     base_url = decode_url(_SOURCE_BASE_B64)
     try:
-        response = requests.get(url, headers=get_random_header(), timeout=15)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        with metrics.span("http.evko.detail"):
+            response = requests.get(url, headers=get_random_header(), timeout=15)
+        metrics.inc("http.requests")
+        with metrics.span("parse.evko.detail"):
+            soup = BeautifulSoup(response.content, 'html.parser')
         
         content_div = soup.select_one('#content') or soup.select_one('.main-content') or soup.body
         full_text = content_div.get_text(separator="\n", strip=True) if content_div else ""
@@ -223,23 +267,42 @@ def scrape_details(url, title, existing_desc="", existing_imgs="", use_ai=True):
                     print("    ♻️  Nutze AI-Text aus Cache.")
             except: pass
 
-        if not vision_text and target_img and use_ai and client:
+        if not vision_text and target_img and use_ai and (AI_ENABLED or defer):
              if any(x in target_img for x in [".jpg", ".png", "GetImage.ashx"]):
-                info = analyze_image_content(target_img)
-                if info: vision_text = f"\n\n{AI_MARKER}\n{info}"
+                if defer and conn is not None:
+                    # Event ohne Plakat-Text speichern, ai_jobs.py ergänzt ihn später
+                    if ai_jobs.enqueue(conn, "vision", url, {"image_url": target_img}):
+                        print("    ⏳ Vision-Job eingereiht.")
+                else:
+                    info = analyze_image_content(target_img, conn)
+                    if info: vision_text = f"\n\n{AI_MARKER}\n{info}"
         
+        # --- BOILERPLATE ---
+        # Navigation/Footer etc. (auf fast allen Seiten gleich) nicht als Beschreibung speichern
+        if conn is not None and full_text:
+            boilerplate.learn(conn, "evko", url, full_text)
+            full_text = boilerplate.strip(conn, "evko", full_text)
+
         return full_text + vision_text, ", ".join(sorted(list(tags))), images, time_str
         
     except Exception as e:
         print(f"Error {url}: {e}"); return "", "", [], ""
 
+@profiling.profiled("scraper_evko")
+@metrics.track_run("scraper_evko")
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-test", action="store_true", help="Nur Seite 1 scrapen")
     parser.add_argument("-noai", action="store_true", help="Deaktiviert OpenAI Vision Analyse")
+    parser.add_argument("-full", action="store_true", help="Alle Seiten scrapen (Scheduler und Früh-Stopp ignorieren)")
+    parser.add_argument("-defer", action="store_true", help="Vision-Analyse als Job einreihen (ai_jobs.py) statt sofort")
     args = parser.parse_args()
 
-    print(f"--- EVKO SCRAPER [{'TEST' if args.test else 'FULL'}] [AI: {'OFF' if args.noai else 'ON'}] ---")
+    if not tenants.enabled("evko", TENANT):
+        print(f"💤 Quelle evko ist für {TENANT['name']} nicht konfiguriert.")
+        return
+    ai_mode = 'OFF' if args.noai else ('DEFER' if args.defer else 'ON')
+    print(f"--- EVKO SCRAPER [{'TEST' if args.test else 'FULL'}] [AI: {ai_mode}] ---")
     conn = init_db()
     
     auto_clean_dates(conn)
@@ -248,16 +311,26 @@ def main():
     base_url = decode_url(_SOURCE_BASE_B64)
     curr = decode_url(_SOURCE_START_B64)
     p_cnt = 1
-    max_p = 1 if args.test else 20
+    unchanged_run = 0
+    max_p = 1 if args.test else MAX_PAGES
+    if not args.test and not args.full:
+        # Nur bis zur letzten fälligen Seite blättern (ferne Seiten ändern sich selten)
+        max_p = scheduler.page_budget(conn, "evko", MAX_PAGES)
+        print(f"🗓️  Scheduler: {max_p}/{MAX_PAGES} Seiten fällig.")
     
     while curr and p_cnt <= max_p:
         print(f"\nSeite {p_cnt}...")
         try:
-            r = requests.get(curr, headers=get_random_header())
-            soup = BeautifulSoup(r.content, 'html.parser')
+            with metrics.span("http.evko.listing"):
+                r = requests.get(curr, headers=get_random_header())
+            metrics.inc("http.requests")
+            with metrics.span("parse.evko.listing"):
+                soup = BeautifulSoup(r.content, 'html.parser')
             tbl = soup.select_one('table.vazusatzinfo_tabelle')
             if not tbl: break
             
+            # 1. Tabelle komplett einlesen (noch ohne DB-Zugriff)
+            entries = []
             for row in tbl.find_all('tr'):
                 cells = row.find_all('td')
                 if len(cells) < 3: continue 
@@ -272,44 +345,76 @@ def main():
                 loc = cells[2].get_text(strip=True)
                 
                 h = make_hash(f"{title}{raw_date}{loc}")
-                
-                c.execute("SELECT content_hash, description, image_urls, time_str FROM events WHERE url = ?", (url,))
-                row_data = c.fetchone()
-                
-                existing_desc = ""
-                existing_imgs = ""
-                db_time = ""
-                
-                if row_data:
-                    db_hash = row_data[0]
-                    existing_desc = row_data[1] or ""
-                    existing_imgs = row_data[2] or ""
-                    db_time = row_data[3] or ""
+                entries.append((url, title, iso_date, loc, h))
+
+            page_key = f"listing:{p_cnt}"
+            fingerprint = scheduler.page_fingerprint([e[4] for e in entries])
+            existing = load_existing_rows(c, [e[0] for e in entries])
+            now_iso = datetime.now().isoformat()
+
+            # 2. Seite unverändert? -> Keine Arbeit pro Zeile
+            page_unchanged = (
+                fingerprint == scheduler.last_fingerprint(conn, "evko", page_key)
+                and all(e[0] in existing for e in entries)
+                and not any(needs_time_fix(existing[e[0]][3]) for e in entries)
+            )
+
+            if page_unchanged:
+                unchanged_run += 1
+                print(f"  [SKIP SEITE] unverändert ({len(entries)} Einträge)")
+                c.execute(f"UPDATE events SET last_scraped = ? WHERE url IN ({','.join('?' * len(entries))})",
+                          [now_iso] + [e[0] for e in entries])
+                with metrics.span("db.commit"):
+                    conn.commit()
+                metrics.inc("events.skipped", len(entries))
+                metrics.inc("pages.unchanged")
+            else:
+                unchanged_run = 0
+                skipped_urls = []
+                for url, title, iso_date, loc, h in entries:
+                    existing_desc = ""
+                    existing_imgs = ""
+                    
+                    if url in existing:
+                        db_hash, existing_desc, existing_imgs, db_time = existing[url]
+                        
+                        # Force Update wenn Zeit fehlt oder "Uhr" enthält
+                        if db_hash == h and not needs_time_fix(db_time):
+                            print(f"  [SKIP] {title}")
+                            skipped_urls.append(url)
+                            continue
+
+                    print(f"  [UPDATE] {title}")
+                    
+                    desc, t_str, imgs, time_val = scrape_details(url, title, existing_desc, existing_imgs, use_ai=not args.noai, conn=conn, defer=args.defer)
                     
-                    # Force Update wenn Zeit fehlt oder "Uhr" enthält
-                    force_update = False
-                    if not db_time or len(db_time) < 3 or "uhr" in db_time.lower():
-                        force_update = True
-
-                    if db_hash == h and not force_update:
-                        print(f"  [SKIP] {title}")
-                        c.execute("UPDATE events SET last_scraped = ? WHERE url = ?", (datetime.now().isoformat(), url))
+                    c.execute('''
+                        INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped, source)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(url) DO UPDATE SET
+                            title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso,
+                            time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
+                            image_urls=excluded.image_urls, content_hash=excluded.content_hash, last_scraped=excluded.last_scraped, source=excluded.source
+                    ''', (url, title, t_str, iso_date, iso_date, time_val, loc, desc, ",".join(imgs), h, datetime.now().isoformat(), SOURCE))
+                    with metrics.span("db.commit"):
                         conn.commit()
-                        continue 
+                    metrics.inc("events.updated")
 
-                print(f"  [UPDATE] {title}")
-                
-                desc, t_str, imgs, time_val = scrape_details(url, title, existing_desc, existing_imgs, use_ai=not args.noai)
-                
-                c.execute('''
-                    INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(url) DO UPDATE SET
-                        title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso,
-                        time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
-                        image_urls=excluded.image_urls, content_hash=excluded.content_hash, last_scraped=excluded.last_scraped
-                ''', (url, title, t_str, iso_date, iso_date, time_val, loc, desc, ",".join(imgs), h, datetime.now().isoformat()))
-                conn.commit()
+                if skipped_urls:
+                    c.executemany("UPDATE events SET last_scraped = ? WHERE url = ?", [(now_iso, u) for u in skipped_urls])
+                    with metrics.span("db.commit"):
+                        conn.commit()
+                    metrics.inc("events.skipped", len(skipped_urls))
+
+            scheduler.record_visit(conn, "evko", page_key, fingerprint,
+                                   scheduler.horizon_from_dates([e[2] for e in entries]))
+
+            # 3. Frühzeitig aufhören, wenn mehrere Seiten am Stück unverändert sind
+            #    und keine spätere Seite laut Scheduler fällig ist
+            if (unchanged_run >= EARLY_STOP_PAGES and not args.full
+                    and not scheduler.due_after(conn, "evko", p_cnt, max_p)):
+                print(f"⏹️  {unchanged_run} Seiten in Folge unverändert -> Stopp.")
+                break
 
             nxt = soup.select_one('a[rel="Next"]')
             curr = urljoin(base_url, nxt['href']) if nxt else None
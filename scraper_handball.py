@@ -9,10 +9,18 @@ import os
 import re
 import base64
 from datetime import datetime
-from urllib.parse import urljoin
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urlparse
+import metrics
+import profiling
+import scheduler
+import tenants
 
 # --- KONFIGURATION ---
 DB_FILE = "evko.db"
+SOURCE = "handball"   # events.source (siehe scheduler.SOURCES)
 
 # URLs Base64 kodiert (Sichtschutz)
 _SOURCE_BASE_B64 = "aHR0cHM6Ly9vZWhiLWhhbmRiYWxsLmxpZ2EubnU="
@@ -22,6 +30,21 @@ AK_WHITELIST = ["WHA1", "WHA2", "WHA1U18", "HLA-HLA2-RL"]
 
 FIXED_LOCATION = "Franz Guggenberger Sporthalle"
 FIXED_TAGS = "Sport, Handball"
+# Team-Namen: (enthält, umbenennen in oder None, Tag) - erste passende Regel gilt
+TEAM_RULES = [
+    ("heinekingmedia", "Union Korneuburg Damen", "RLO"),
+    ("Union Korneuburg Damen", None, "WHA"),
+    ("Union Sparkasse Korneuburg", None, "HLA"),
+]
+
+# Crawl: max. Monatsseiten, parallele Downloads, Höflichkeits-Limit pro Host
+MAX_PAGES = 12
+MAX_WORKERS = 4
+# Alle Mandanten crawlen denselben Host: tenants.py teilt das Limit auf die parallelen Läufe auf
+REQUESTS_PER_SECOND = float(os.getenv("EVKO_HANDBALL_RPS", "2"))
+
+# Mandant: Quellen-Konfiguration aus tenants.json überschreibt die Werte oben
+TENANT = tenants.configure(globals(), "handball")
 
 ua = UserAgent()
 
@@ -40,6 +63,7 @@ def init_db():
         content_hash TEXT, last_scraped TIMESTAMP
     )''')
     conn.commit()
+    scheduler.init_table(conn)
     return conn
 
 def make_hash(s): return hashlib.md5(s.encode('utf-8')).hexdigest()
@@ -51,125 +75,174 @@ def parse_german_date(t):
     except: return None
     return None
 
-def scrape_month_page(url, conn):
+class HostRateLimiter:
+    """Höflichkeits-Limit: pro Host höchstens `per_second` Anfragen (Start-zu-Start), thread-sicher"""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            with metrics.span("sleep.politeness"):
+                time.sleep(slot - now)
+
+def fetch_page(url, limiter):
+    """Läuft im Worker-Thread: nur HTTP, kein Parsing, keine DB"""
+    limiter.wait(url)
     print(f"Scrape: {url[-30:]}...") 
     try:
-        r = requests.get(url, headers=get_header(), timeout=15)
-        soup = BeautifulSoup(r.content, 'html.parser')
-        table = soup.select_one('table.result-set')
-        
-        new_links = []
-        base_url = decode_url(_SOURCE_BASE_B64)
-        for a in soup.select('#sub-navigation li a'):
-            if a.get('href'): new_links.append(urljoin(base_url, a.get('href')))
+        with metrics.span("http.handball.month"):
+            r = requests.get(url, headers=get_header(), timeout=15)
+        metrics.inc("http.requests")
+        return r.content
+    except Exception as e:
+        print(f"Fehler: {e}")
+        return None
+
+def parse_month_page(content):
+    """Parst eine Monatsseite. Gibt (neue Links, Datensätze für die DB) zurück."""
+    with metrics.span("parse.handball.month"):
+        soup = BeautifulSoup(content, 'html.parser')
+    table = soup.select_one('table.result-set')
+    
+    new_links = []
+    base_url = decode_url(_SOURCE_BASE_B64)
+    for a in soup.select('#sub-navigation li a'):
+        if a.get('href'): new_links.append(urljoin(base_url, a.get('href')))
 
-        if not table: return new_links
+    records = []
+    if not table: return new_links, records
+    
+    curr_date = None
+    start_url = decode_url(_SOURCE_START_B64)
+    
+    for row in table.find_all('tr'):
+        cells = row.find_all('td')
+        if len(cells) < 9: continue
         
-        c = conn.cursor()
-        curr_date = None
+        d_txt = cells[1].get_text(strip=True)
+        if d_txt: curr_date = d_txt
+        if not curr_date: continue
         
-        for row in table.find_all('tr'):
-            cells = row.find_all('td')
-            if len(cells) < 9: continue
-            
-            d_txt = cells[1].get_text(strip=True)
-            if d_txt: curr_date = d_txt
-            if not curr_date: continue
-            
-            ak = cells[4].get_text(strip=True)
-            if not any(w in ak for w in AK_WHITELIST): continue
-            
-            time_raw = cells[2].get_text(strip=True).replace('v', '').strip()
-            gid = cells[3].get_text(strip=True)
-            if not gid: continue
-            
-            # Ergebnis auslesen (Spalte 8)
-            result_raw = cells[8].get_text(strip=True)
-            final_score = ""
-            score_match = re.search(r'(\d+:\d+)', result_raw.split("Halbzeit")[-1]) 
-            if score_match: final_score = score_match.group(1)
-            elif re.search(r'\d+:\d+', result_raw): final_score = result_raw
-
-            start_url = decode_url(_SOURCE_START_B64)
-            valid_url = f"{start_url}#match-{gid}"
-            
-            home = cells[6].get_text(strip=True)
-            guest = cells[7].get_text(strip=True)
-            
-            # --- TEAM NAMEN & TAGS LOGIK ---
-            current_tags_list = ["Sport", "Handball"]
-            
-            # Helper Funktion für Logik
-            def process_team_name(name, tags):
-                # Fall 1: heinekingmedia -> Umbenennen + Tag RLO
-                if "heinekingmedia" in name:
-                    tags.append("RLO")
-                    return "Union Korneuburg Damen"
-                
-                # Fall 2: Union Korneuburg Damen -> Tag WHA
-                if "Union Korneuburg Damen" in name:
-                    tags.append("WHA")
-                    return name 
-                
-                # Fall 3: Union Sparkasse Korneuburg -> Tag HLA
-                if "Union Sparkasse Korneuburg" in name:
-                    tags.append("HLA")
-                    return name
-
-                return name # Sonst nichts ändern
-
-            # Anwenden auf Heim und Gast
-            home = process_team_name(home, current_tags_list)
-            guest = process_team_name(guest, current_tags_list)
-            
-            # Tags finalisieren (Duplikate entfernen und joinen)
-            final_tags = ", ".join(sorted(list(set(current_tags_list)), key=lambda x: current_tags_list.index(x)))
-            # -------------------------------
-
-            title = f"{home} - {guest}"
-            iso = parse_german_date(curr_date)
-            desc = f"Liga: {ak}\nHeim: {home}\nGast: {guest}"
-            if final_score: desc += f"\nEndstand: {final_score}"
-            
-            h = make_hash(f"{gid}{iso}{home}")
-            
-            print(f"  [HANDBALL] {iso} | {title} | {final_tags} {f'({final_score})' if final_score else ''}")
-            
-            c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped) 
-                         VALUES (?,?,?,?,?,?,?,?,?,?,?) 
-                         ON CONFLICT(url) DO UPDATE SET 
-                         title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso, 
-                         time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
-                         content_hash=excluded.content_hash, last_scraped=excluded.last_scraped''', 
-                         (valid_url, title, final_tags, curr_date, iso, time_raw, FIXED_LOCATION, desc, "", h, datetime.now().isoformat()))
-            conn.commit()
-
-        return new_links
-
-    except Exception as e: 
-        print(f"Fehler: {e}")
-        return []
+        ak = cells[4].get_text(strip=True)
+        if not any(w in ak for w in AK_WHITELIST): continue
+        
+        time_raw = cells[2].get_text(strip=True).replace('v', '').strip()
+        gid = cells[3].get_text(strip=True)
+        if not gid: continue
+        
+        # Ergebnis auslesen (Spalte 8)
+        result_raw = cells[8].get_text(strip=True)
+        final_score = ""
+        score_match = re.search(r'(\d+:\d+)', result_raw.split("Halbzeit")[-1]) 
+        if score_match: final_score = score_match.group(1)
+        elif re.search(r'\d+:\d+', result_raw): final_score = result_raw
+
+        valid_url = f"{start_url}#match-{gid}"
+        
+        home = cells[6].get_text(strip=True)
+        guest = cells[7].get_text(strip=True)
+        
+        # --- TEAM NAMEN & TAGS LOGIK ---
+        current_tags_list = ["Sport", "Handball"]
+        
+        # Helper Funktion für Logik (Regeln pro Mandant in TEAM_RULES)
+        def process_team_name(name, tags):
+            for needle, rename, tag in TEAM_RULES:
+                if needle in name:
+                    tags.append(tag)
+                    return rename or name
+            return name # Sonst nichts ändern
+
+        # Anwenden auf Heim und Gast
+        home = process_team_name(home, current_tags_list)
+        guest = process_team_name(guest, current_tags_list)
+        
+        # Tags finalisieren (Duplikate entfernen und joinen)
+        final_tags = ", ".join(sorted(list(set(current_tags_list)), key=lambda x: current_tags_list.index(x)))
+        # -------------------------------
+
+        title = f"{home} - {guest}"
+        iso = parse_german_date(curr_date)
+        desc = f"Liga: {ak}\nHeim: {home}\nGast: {guest}"
+        if final_score: desc += f"\nEndstand: {final_score}"
+        
+        h = make_hash(f"{gid}{iso}{home}{final_score}")
+        
+        print(f"  [HANDBALL] {iso} | {title} | {final_tags} {f'({final_score})' if final_score else ''}")
+        records.append((valid_url, title, final_tags, curr_date, iso, time_raw, FIXED_LOCATION, desc, "", h, datetime.now().isoformat(), SOURCE))
+
+    return new_links, records
 
+def store_records(conn, records):
+    """Upsert aller Spiele einer Seite in einer Transaktion"""
+    c = conn.cursor()
+    c.executemany('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped, source) 
+                     VALUES (?,?,?,?,?,?,?,?,?,?,?,?) 
+                     ON CONFLICT(url) DO UPDATE SET 
+                     title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso, 
+                     time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
+                     content_hash=excluded.content_hash, last_scraped=excluded.last_scraped, source=excluded.source''', records)
+    with metrics.span("db.commit"):
+        conn.commit()
+    metrics.inc("events.updated", len(records))
+
+@profiling.profiled("scraper_handball")
+@metrics.track_run("scraper_handball")
 def main():
+    if not tenants.enabled("handball", TENANT):
+        print(f"💤 Quelle handball ist für {TENANT['name']} nicht konfiguriert.")
+        return
     print("--- START HANDBALL SCRAPER ---")
     conn = init_db()
     start_url = decode_url(_SOURCE_START_B64)
-    visited = set()
-    queue = [start_url]
+    limiter = HostRateLimiter(REQUESTS_PER_SECOND)
+    # Gespielte Matches ohne Ergebnis -> alle Monate neu laden
+    force = scheduler.results_pending(conn, "handball")
+
+    frontier = deque([start_url])
+    seen = {start_url}
+    pending = {}
     count = 0
-    
-    while queue and count < 12: 
-        curr = queue.pop(0)
-        if curr in visited: continue
-        visited.add(curr)
-        count += 1
-        
-        found_links = scrape_month_page(curr, conn)
-        for l in found_links:
-            if l not in visited and l not in queue: queue.append(l)
-        time.sleep(1) 
+
+    # Worker holen die Seiten parallel, Parsing + DB laufen hier im Haupt-Thread
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while frontier or pending:
+            while frontier and len(pending) < MAX_WORKERS and count < MAX_PAGES:
+                curr = frontier.popleft()
+                if curr != start_url and not force and not scheduler.is_due(conn, "handball", curr):
+                    print(f"💤 Nicht fällig: {curr[-30:]}")
+                    continue
+                pending[pool.submit(fetch_page, curr, limiter)] = curr
+                count += 1
+            if not pending: break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                curr = pending.pop(fut)
+                content = fut.result()
+                if content is None: continue
+                try:
+                    found_links, records = parse_month_page(content)
+                except Exception as e:
+                    print(f"Fehler: {e}")
+                    continue
+                store_records(conn, records)
+                scheduler.record_visit(conn, "handball", curr, scheduler.page_fingerprint([r[9] for r in records]),
+                                       scheduler.horizon_from_dates([r[4] for r in records]))
+                for l in found_links:
+                    if l not in seen:
+                        seen.add(l)
+                        frontier.append(l)
         
     conn.close()
     print("--- ENDE ---")
 
-if __name__ == "__main__": main()
\ No newline at end of file
+if __name__ == "__main__": main()
@@ -8,9 +8,14 @@ import time
 import base64
 from datetime import datetime
 import argparse  # <--- NEU
+import metrics
+import profiling
+import scheduler
+import tenants
 
 # --- KONFIGURATION ---
 DB_FILE = "evko.db"
+SOURCE = "kicks"   # events.source (siehe scheduler.SOURCES)
 
 # URLs (Base64 kodiert)
 _SOURCE_A_B64 = "aHR0cHM6Ly92ZXJlaW5lLm9lZmIuYXQvU0tTcGFya2Fzc2VLb3JuZXVidXJnL01hbm5zY2hhZnRlbg=="
@@ -20,9 +25,16 @@ _IMG_DEFAULT_B64 = "aHR0cHM6Ly9zdGF0aWMubGlnYXBvcnRhbC5hdC9pbWFnZXMvY2x1Yi9jbHVi
 
 LOCATION_NAME = "Rattenfängerstadion Korneuburg"
 
+# JSON-Datenblöcke im HTML: SG.container.appPreloads['...'] = [...];
+PRELOAD_MARKER = "SG.container.appPreloads["
+_json_decoder = json.JSONDecoder()
+
 # Filter
 HOME_TEAM_FILTER = ["Korneuburg", "Korneuburg/Stetten", "SK Sparkasse Korneuburg", "SG Korneuburg"]
 
+# Mandant: Quellen-Konfiguration aus tenants.json überschreibt die Werte oben
+TENANT = tenants.configure(globals(), "kicks")
+
 ua = UserAgent()
 
 def decode_url(b64_string):
@@ -45,6 +57,7 @@ def init_db():
         content_hash TEXT, last_scraped TIMESTAMP
     )''')
     conn.commit()
+    scheduler.init_table(conn)
     return conn
 
 def make_hash(s): return hashlib.md5(s.encode('utf-8')).hexdigest()
@@ -82,20 +95,49 @@ def map_competition_to_tags(bewerb_name):
 
     return ", ".join(tags)
 
-def find_games_list_recursive(data):
-    if isinstance(data, dict):
-        if "spiele" in data and isinstance(data["spiele"], list) and len(data["spiele"]) > 0:
-            if "datum" in data["spiele"][0]:
-                return data["spiele"]
-        for key, value in data.items():
-            result = find_games_list_recursive(value)
-            if result: return result
-    elif isinstance(data, list):
-        for item in data:
-            result = find_games_list_recursive(item)
-            if result: return result
+def find_games_list(data):
+    """Sucht (Tiefensuche, ohne Rekursion) die erste Liste "spiele" mit "datum" Feldern"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            spiele = node.get("spiele")
+            if isinstance(spiele, list) and spiele and isinstance(spiele[0], dict) and "datum" in spiele[0]:
+                return spiele
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
     return None
 
+def iter_preload_blocks(html):
+    """Ein Durchlauf über das HTML: liefert (Start des JSON, Ende des Abschnitts) je appPreloads-Block"""
+    pos = html.find(PRELOAD_MARKER)
+    while pos != -1:
+        nxt = html.find(PRELOAD_MARKER, pos + len(PRELOAD_MARKER))
+        end = nxt if nxt != -1 else len(html)
+        eq = html.find("=", pos, end)
+        if eq != -1:
+            start = eq + 1
+            while start < end and html[start].isspace(): start += 1
+            if start < end and html[start] == "[":
+                yield start, end
+        pos = nxt
+
+def extract_games(html):
+    """Dekodiert die Blöcke direkt ab ihrem Offset (raw_decode) und stoppt beim ersten Treffer.
+    Gibt (Blocknummer, Spiele) zurück oder (None, None)."""
+    for i, (start, end) in enumerate(iter_preload_blocks(html)):
+        # Billiger Vorfilter: Blöcke ohne "spiele"/"datum" gar nicht erst dekodieren
+        if html.find('"spiele"', start, end) == -1 or html.find('"datum"', start, end) == -1:
+            continue
+        try:
+            data, _ = _json_decoder.raw_decode(html, start)
+        except ValueError:
+            continue
+        found = find_games_list(data)
+        if found: return i, found
+    return None, None
+
 def scrape_primary(conn):
     url = get_primary_season_url()
     print(f"Versuche PRIMARY Scrape (Obfuscated): {url}")
@@ -103,28 +145,22 @@ def scrape_primary(conn):
     count = 0
     
     try:
-        r = requests.get(url, headers=get_header(), timeout=15)
+        with metrics.span("http.kicks.primary"):
+            r = requests.get(url, headers=get_header(), timeout=15)
+        metrics.inc("http.requests")
         html_content = r.text
         
-        pattern = r"SG\.container\.appPreloads\['[^']+'\]\s*=\s*(\[.*?\]);"
-        matches = list(re.finditer(pattern, html_content, re.DOTALL))
-        
-        if not matches:
+        block_count = html_content.count(PRELOAD_MARKER)
+        if not block_count:
             print("  ⚠️ Kein JSON-Datenblock gefunden.")
             return 0
             
-        print(f"  -> {len(matches)} JSON-Blöcke gefunden. Analysiere...")
+        print(f"  -> {block_count} JSON-Blöcke gefunden. Analysiere...")
 
-        games_list = []
-        for i, match in enumerate(matches):
-            try:
-                data = json.loads(match.group(1))
-                found = find_games_list_recursive(data)
-                if found:
-                    print(f"  ✅ Spiele in Block {i+1} gefunden!")
-                    games_list = found
-                    break 
-            except: continue
+        with metrics.span("parse.kicks.json"):
+            block_idx, games_list = extract_games(html_content)
+        if games_list:
+            print(f"  ✅ Spiele in Block {block_idx+1} gefunden!")
 
         if not games_list:
             print("  ⚠️ Keine Spiele gefunden.")
@@ -132,6 +168,8 @@ def scrape_primary(conn):
         
         print(f"  -> Verarbeite {len(games_list)} Spiele...")
         default_img = decode_url(_IMG_DEFAULT_B64)
+        page_items = []
+        page_dates = []
 
         for game in games_list:
             timestamp_ms = game.get("datum")
@@ -176,18 +214,25 @@ def scrape_primary(conn):
                 
             h = make_hash(f"{date_str}{heim}{gast}{time_str}")
             full_url = f"verband_{h}" 
+            page_items.append(f"{h}{desc}")
+            page_dates.append(date_str)
             
             print(f"  [VERBAND] {date_str} | {title} | {tags}")
             
-            c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped) 
-                         VALUES (?,?,?,?,?,?,?,?,?,?,?) 
+            c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped, source) 
+                         VALUES (?,?,?,?,?,?,?,?,?,?,?,?) 
                          ON CONFLICT(url) DO UPDATE SET 
                          title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso, 
                          time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
-                         image_urls=excluded.image_urls, content_hash=excluded.content_hash, last_scraped=excluded.last_scraped''', 
-                         (full_url, title, tags, date_str, date_str, time_str, ort_clean, desc, default_img, h, datetime.now().isoformat()))
-            conn.commit()
+                         image_urls=excluded.image_urls, content_hash=excluded.content_hash, last_scraped=excluded.last_scraped, source=excluded.source''', 
+                         (full_url, title, tags, date_str, date_str, time_str, ort_clean, desc, default_img, h, datetime.now().isoformat(), SOURCE))
+            with metrics.span("db.commit"):
+                conn.commit()
+            metrics.inc("events.updated")
             count += 1
+
+        scheduler.record_visit(conn, "kicks", "spielplan", scheduler.page_fingerprint(page_items),
+                               scheduler.horizon_from_dates(page_dates))
             
     except Exception as e:
         print(f"Fehler: {e}")
@@ -203,7 +248,9 @@ def scrape_secondary(conn):
         base_url = decode_url(_SOURCE_B_BASE_B64)
         default_img = decode_url(_IMG_DEFAULT_B64)
         
-        r = requests.get(url, headers=get_header(), timeout=15)
+        with metrics.span("http.kicks.fallback"):
+            r = requests.get(url, headers=get_header(), timeout=15)
+        metrics.inc("http.requests")
         from bs4 import BeautifulSoup
         soup = BeautifulSoup(r.content, 'html.parser')
         table = soup.select_one('table.teamSchedule')
@@ -239,14 +286,16 @@ def scrape_secondary(conn):
                     full_url = f"liga_{h}"
                     print(f"  [FALLBACK] {iso_date} | {title}")
                     
-                    c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped) 
-                                 VALUES (?,?,?,?,?,?,?,?,?,?,?) 
+                    c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped, source) 
+                                 VALUES (?,?,?,?,?,?,?,?,?,?,?,?) 
                                  ON CONFLICT(url) DO UPDATE SET 
                                  title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso, 
                                  time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
-                                 image_urls=excluded.image_urls, content_hash=excluded.content_hash, last_scraped=excluded.last_scraped''', 
-                                 (full_url, title, "Sport, Fussball, Meisterschaft", current_date_str, iso_date, time_str, LOCATION_NAME, desc, default_img, h, datetime.now().isoformat()))
-                    conn.commit()
+                                 image_urls=excluded.image_urls, content_hash=excluded.content_hash, last_scraped=excluded.last_scraped, source=excluded.source''', 
+                                 (full_url, title, "Sport, Fussball, Meisterschaft", current_date_str, iso_date, time_str, LOCATION_NAME, desc, default_img, h, datetime.now().isoformat(), SOURCE))
+                    with metrics.span("db.commit"):
+                        conn.commit()
+                    metrics.inc("events.updated")
                     count += 1
     except Exception as e: print(e)
     return count
@@ -273,12 +322,17 @@ def run_correction(conn):
     else:
         print("  ✅ Keine Korrekturen notwendig (Alles sauber).")
 
+@profiling.profiled("scraper_kicks")
+@metrics.track_run("scraper_kicks")
 def main():
     # Argumente parsen
     parser = argparse.ArgumentParser()
     parser.add_argument("-korr", action="store_true", help="Führt nur eine Korrektur der Stadionnamen in der DB durch")
     args = parser.parse_args()
 
+    if not tenants.enabled("kicks", TENANT):
+        print(f"💤 Quelle kicks ist für {TENANT['name']} nicht konfiguriert.")
+        return
     conn = init_db()
 
     if args.korr:
@@ -7,18 +7,29 @@ import time
 import os
 import json
 import re
+import argparse
 from datetime import datetime
 from urllib.parse import urljoin
-import openai
+import metrics
+import profiling
+import scheduler
+import tenants
+import images
+import ai_client
+import ai_jobs
 
 # --- KONFIGURATION ---
 DB_FILE = "evko.db"
+SOURCE = "kinderwelt"   # events.source (siehe scheduler.SOURCES)
 STATE_FILE = "kinderwelt.state"
 BASE_URL = "https://kinderwelt-korneuburg.at"
 START_URL = "https://kinderwelt-korneuburg.at/index.php?option=com_content&view=featured&Itemid=110"
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+AI_ENABLED = bool(OPENAI_API_KEY)   # Anfragen laufen über ai_client (Rate-Limit, Retries)
+
+# Mandant: Quellen-Konfiguration aus tenants.json überschreibt die Werte oben
+TENANT = tenants.configure(globals(), "kinderwelt")
 
 ua = UserAgent()
 
@@ -38,6 +49,9 @@ def init_db():
     try: c.execute("ALTER TABLE events ADD COLUMN embedding_hash TEXT")
     except: pass
     conn.commit()
+    scheduler.init_table(conn)
+    images.init_tables(conn)
+    ai_jobs.init_table(conn)
     return conn
 
 def make_hash(s): return hashlib.md5(s.encode('utf-8')).hexdigest()
@@ -51,11 +65,8 @@ def save_state(new_hash):
     with open(STATE_FILE, "w") as f: f.write(new_hash)
 
 # --- AI ANALYSE (Text + normale Bilder) ---
-def analyze_content_with_ai(text_content, image_urls):
-    if not client: return []
-
-    print(f"    🧠 Frage AI (Textlänge: {len(text_content)}, Bilder: {len(image_urls)})...")
-    
+def extract_request(text_content, image_urls, conn=None):
+    """Request-Body der Event-Extraktion (direkt oder als Job in ai_jobs.py)"""
     prompt = """
     Analysiere diesen Webseiten-Text. Er kann MEHRERE verschiedene Veranstaltungen enthalten.
     Extrahiere alle zukünftigen Events als JSON-Liste.
@@ -80,30 +91,37 @@ def analyze_content_with_ai(text_content, image_urls):
     3. Nutze das aktuelle Jahr (oder nächstes), falls im Text nur Tag/Monat steht.
     """
 
-    try:
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "text", "text": f"Webseiten-Inhalt:\n{text_content[:2500]}"} 
-                ]
-            }
-        ]
-        
-        # Nur echte URLs anhängen, keine Base64 Blobs
-        for img_url in image_urls[:2]:
-            messages[0]["content"].append(
-                {"type": "image_url", "image_url": {"url": img_url, "detail": "low"}}
-            )
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=600,
-            response_format={"type": "json_object"}
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "text", "text": f"Webseiten-Inhalt:\n{text_content[:2500]}"} 
+            ]
+        }
+    ]
+    
+    # Nur echte URLs anhängen, keine Base64 Platzhalter der Seite.
+    # Gesendet wird die lokale Kopie (images.py), damit die Quelle nicht erneut geladen wird.
+    for img_url in image_urls[:2]:
+        messages[0]["content"].append(
+            {"type": "image_url", "image_url": {"url": images.vision_url(conn, img_url), "detail": "low"}}
         )
-        
+
+    return {
+        "model": "gpt-4o-mini",
+        "messages": messages,
+        "max_tokens": 600,
+        "response_format": {"type": "json_object"}
+    }
+
+def analyze_content_with_ai(text_content, image_urls, conn=None):
+    if not AI_ENABLED: return []
+
+    print(f"    🧠 Frage AI (Textlänge: {len(text_content)}, Bilder: {len(image_urls)})...")
+
+    try:
+        response = ai_client.chat_sync(span="openai.extract", **extract_request(text_content, image_urls, conn))
         data = json.loads(response.choices[0].message.content)
         return data.get("events", [])
         
@@ -111,12 +129,71 @@ def analyze_content_with_ai(text_content, image_urls):
         print(f"    ⚠️ AI Fehler: {e}")
         return []
 
+def save_events(conn, post_link, extracted_events, clean_images):
+    c = conn.cursor()
+    for evt in extracted_events:
+        evt_title = evt.get('title', 'Unbekannt')
+        evt_date = evt.get('date_iso')
+        
+        if not evt_date: continue
+        
+        print(f"  ✅ GEFUNDEN: {evt_date} | {evt_title}")
+        
+        # Unique ID bauen
+        unique_part = make_hash(f"{evt_date}{evt_title}")
+        unique_url = f"{post_link}#{unique_part}"
+        
+        # Das erste saubere Bild für die DB verwenden
+        main_img = clean_images[0] if clean_images else ""
+        
+        h_content = make_hash(json.dumps(evt, sort_keys=True))
+        
+        c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped, source) 
+                     VALUES (?,?,?,?,?,?,?,?,?,?,?,?) 
+                     ON CONFLICT(url) DO UPDATE SET 
+                     title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso, 
+                     time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
+                     content_hash=excluded.content_hash, last_scraped=excluded.last_scraped, source=excluded.source''', 
+                     (
+                         unique_url, 
+                         evt_title, 
+                         "Kinder, Familie, Freizeit", 
+                         evt_date, 
+                         evt_date, 
+                         evt.get('time', ''), 
+                         evt.get('location', TENANT['name']), 
+                         evt.get('description', ''), 
+                         main_img, 
+                         h_content, 
+                         datetime.now().isoformat(),
+                         SOURCE
+                     ))
+        with metrics.span("db.commit"):
+            conn.commit()
+        metrics.inc("events.updated")
+
+def apply_extraction(conn, url, payload, content):
+    """Ergebnis eines verzögerten Extraktions-Jobs: Events anlegen wie im direkten Modus"""
+    save_events(conn, payload["post_link"], json.loads(content).get("events", []), payload["image_urls"])
+
+@profiling.profiled("scraper_kinderwelt")
+@metrics.track_run("scraper_kinderwelt")
 def main():
-    print("--- START KINDERWELT SCRAPER (Text Only) ---")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-defer", action="store_true", help="AI-Extraktion als Job einreihen (ai_jobs.py) statt sofort")
+    args = parser.parse_args()
+
+    if not tenants.enabled("kinderwelt", TENANT):
+        print(f"💤 Quelle kinderwelt ist für {TENANT['name']} nicht konfiguriert.")
+        return
+    print(f"--- START KINDERWELT SCRAPER (Text Only){' [AI: DEFER]' if args.defer else ''} ---")
     
     try:
-        r = requests.get(START_URL, headers=get_header(), timeout=15)
-        soup = BeautifulSoup(r.content, 'html.parser')
+        with metrics.span("http.kinderwelt.start"):
+            r = requests.get(START_URL, headers=get_header(), timeout=15)
+        metrics.inc("http.requests")
+        with metrics.span("parse.kinderwelt.start"):
+            soup = BeautifulSoup(r.content, 'html.parser')
     except Exception as e:
         print(f"❌ Fehler Startseite: {e}")
         return
@@ -140,6 +217,11 @@ def main():
         if h1: state_str += h1.get_text(strip=True)
     
     current_hash = make_hash(state_str)
+
+    # Änderungsrate für den Scheduler mitschreiben
+    stats_conn = init_db()
+    scheduler.record_visit(stats_conn, "kinderwelt", "start", current_hash)
+    stats_conn.close()
     
     if current_hash == load_state():
         print("💤 Startseite unverändert (Hash Match).")
@@ -147,7 +229,6 @@ def main():
     
     print("✨ Änderungen erkannt! Analysiere Beiträge...")
     conn = init_db()
-    c = conn.cursor()
 
     for i, art in enumerate(articles):
         h1 = art.find('h1', class_='item-title')
@@ -179,53 +260,26 @@ def main():
             
             clean_images.append(src)
 
+        if args.defer:
+            # Kinderwelt-Events entstehen erst durch die Extraktion -> kommen mit ai_jobs.py
+            job_url = post_link if post_link != START_URL else f"{START_URL}#post-{make_hash(title_raw)}"
+            payload = {"post_link": post_link, "text": full_text[:2500], "image_urls": clean_images}
+            if ai_jobs.enqueue(conn, "extract", job_url, payload):
+                print("  ⏳ Extraktion eingereiht.")
+            continue
+
         # AI Analyse
-        extracted_events = analyze_content_with_ai(full_text, clean_images)
+        extracted_events = analyze_content_with_ai(full_text, clean_images, conn)
         
         if not extracted_events:
             print("  -> Keine Events gefunden.")
             continue
             
-        for evt in extracted_events:
-            evt_title = evt.get('title', 'Unbekannt')
-            evt_date = evt.get('date_iso')
-            
-            if not evt_date: continue
-            
-            print(f"  ✅ GEFUNDEN: {evt_date} | {evt_title}")
-            
-            # Unique ID bauen
-            unique_part = make_hash(f"{evt_date}{evt_title}")
-            unique_url = f"{post_link}#{unique_part}"
-            
-            # Das erste saubere Bild für die DB verwenden
-            main_img = clean_images[0] if clean_images else ""
-            
-            h_content = make_hash(json.dumps(evt, sort_keys=True))
-            
-            c.execute('''INSERT INTO events (url, title, tags, date_str, start_iso, time_str, location, description, image_urls, content_hash, last_scraped) 
-                         VALUES (?,?,?,?,?,?,?,?,?,?,?) 
-                         ON CONFLICT(url) DO UPDATE SET 
-                         title=excluded.title, tags=excluded.tags, date_str=excluded.date_str, start_iso=excluded.start_iso, 
-                         time_str=excluded.time_str, location=excluded.location, description=excluded.description, 
-                         content_hash=excluded.content_hash, last_scraped=excluded.last_scraped''', 
-                         (
-                             unique_url, 
-                             evt_title, 
-                             "Kinder, Familie, Freizeit", 
-                             evt_date, 
-                             evt_date, 
-                             evt.get('time', ''), 
-                             evt.get('location', 'Korneuburg'), 
-                             evt.get('description', ''), 
-                             main_img, 
-                             h_content, 
-                             datetime.now().isoformat()
-                         ))
-            conn.commit()
+        save_events(conn, post_link, extracted_events, clean_images)
             
         time.sleep(1)
 
+    conn.commit()   # eingereihte Jobs (-defer)
     save_state(current_hash)
     conn.close()
     print("--- ENDE ---")
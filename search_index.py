@@ -0,0 +1,171 @@
+import re
+import json
+import unicodedata
+from collections import defaultdict
+
+# --- KONFIGURATION ---
+# Vorab gebauter Suchindex für index.html: Token -> Event-IDs plus Tag- und
+# Monats-Facetten. Das Skript filtert im Browser (ohne Server/API) und rendert
+# die Tabellenzeilen blockweise nach, sobald der Nutzer nach unten scrollt.
+INITIAL_ROWS = 40      # So viele Zeilen stehen direkt im HTML (erster Paint, ohne JS)
+CHUNK_ROWS = 40        # Nachladen beim Scrollen
+MIN_TOKEN_LEN = 2
+STOPWORDS = {"im", "in", "am", "an", "um", "der", "die", "das", "den", "dem", "und", "oder", "mit", "fur",
+             "von", "vom", "zu", "zum", "zur", "ein", "eine", "es", "gibt", "was", "wann", "wo", "bei", "auf"}
+MONTHS = {"jan": 1, "janner": 1, "januar": 1, "feb": 2, "februar": 2, "feber": 2, "marz": 3, "maerz": 3,
+          "apr": 4, "april": 4, "mai": 5, "jun": 6, "juni": 6, "jul": 7, "juli": 7, "aug": 8, "august": 8,
+          "sep": 9, "sept": 9, "september": 9, "okt": 10, "oktober": 10, "nov": 11, "november": 11,
+          "dez": 12, "dezember": 12}
+
+
+def normalize(text):
+    """Kleinschreibung ohne Akzente/Umlaut-Punkte (identisch zum JS: NFKD + Kombinationszeichen entfernen)"""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9ß]+", normalize(text)) if len(t) >= MIN_TOKEN_LEN and t not in STOPWORDS]
+
+
+def build(records, row_html):
+    """
+    records: Event-Datensätze wie in events.json, row_html: fertige <tr> Zeilen (gleiche Reihenfolge).
+    Liefert den Index als kompakt serialisierbares Dict.
+    """
+    tokens = defaultdict(set)
+    tags = defaultdict(list)
+    months = defaultdict(list)
+    for i, rec in enumerate(records):
+        text = " ".join([rec.get('title') or "", rec.get('location') or "", " ".join(rec.get('tags') or [])])
+        for tok in tokenize(text):
+            tokens[tok].add(i)
+        for tag in rec.get('tags') or []:
+            tags[tag].append(i)
+        if rec.get('date'):
+            months[rec['date'][:7]].append(i)
+
+    return {
+        "rows": row_html,
+        "tokens": {tok: sorted(ids) for tok, ids in sorted(tokens.items())},
+        "tags": dict(sorted(tags.items(), key=lambda kv: (-len(kv[1]), kv[0]))),
+        "months": dict(sorted(months.items())),
+        "monthWords": MONTHS,
+        "stop": sorted(STOPWORDS),
+        "initial": INITIAL_ROWS,
+        "chunk": CHUNK_ROWS,
+    }
+
+
+def embed_json(index):
+    """Index als <script type="application/json"> (ohne '</' im Inhalt)"""
+    data = json.dumps(index, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    return f'<script type="application/json" id="search-data">{data}</script>'
+
+
+SEARCH_FORM = """
+        <div class="search">
+            <input id="q" type="search" placeholder="Suche, z.B. Handball März" autocomplete="off">
+            <select id="tag"><option value="">Alle Tags</option></select>
+            <select id="month"><option value="">Alle Monate</option></select>
+            <span id="hits"></span>
+        </div>
+"""
+
+SEARCH_CSS = """
+        .search { display: flex; flex-wrap: wrap; gap: 8px; margin-bottom: 16px; align-items: center; }
+        .search input, .search select { font: inherit; padding: 6px 8px; border: 1px solid #000; background: #fff; }
+        .search input { flex: 1; min-width: 200px; }
+        #hits { font-size: 0.8em; color: #555; }
+"""
+
+# Bewusst ohne Framework/Build-Schritt: ein paar KB Vanilla-JS.
+SCRIPT = """<script>
+(function () {
+  var el = document.getElementById("search-data");
+  if (!el) return;
+  var d = JSON.parse(el.textContent);
+  var body = document.querySelector("tbody"), q = document.getElementById("q"),
+      tagSel = document.getElementById("tag"), monthSel = document.getElementById("month"),
+      hits = document.getElementById("hits"), sentinel = document.getElementById("more");
+  var all = d.rows.map(function (_, i) { return i; }), list = all, shown = Math.min(d.initial, all.length);
+  var keys = Object.keys(d.tokens), stop = {}, io = null;
+  d.stop.forEach(function (w) { stop[w] = 1; });
+  var monthNames = ["Jänner","Februar","März","April","Mai","Juni","Juli","August","September","Oktober","November","Dezember"];
+
+  Object.keys(d.tags).forEach(function (t) { tagSel.add(new Option(t + " (" + d.tags[t].length + ")", t)); });
+  Object.keys(d.months).forEach(function (m) {
+    monthSel.add(new Option(monthNames[+m.slice(5) - 1] + " " + m.slice(0, 4) + " (" + d.months[m].length + ")", m));
+  });
+
+  function norm(s) { return s.toLowerCase().normalize("NFKD").replace(/[\\u0300-\\u036f]/g, ""); }
+  function intersect(a, b) {
+    var set = {}, out = [];
+    b.forEach(function (i) { set[i] = 1; });
+    a.forEach(function (i) { if (set[i]) out.push(i); });
+    return out;
+  }
+  function union(lists) {
+    var set = {};
+    lists.forEach(function (l) { l.forEach(function (i) { set[i] = 1; }); });
+    return Object.keys(set).map(Number).sort(function (a, b) { return a - b; });
+  }
+  function monthIds(m) {
+    return union(Object.keys(d.months).filter(function (k) { return +k.slice(5) === m; })
+                 .map(function (k) { return d.months[k]; }));
+  }
+
+  function search() {
+    var ids = all;
+    (norm(q.value).match(/[a-z0-9ß]+/g) || []).forEach(function (w) {
+      if (w.length < 2 || stop[w]) return;
+      if (d.monthWords[w]) { ids = intersect(ids, monthIds(d.monthWords[w])); return; }
+      // Präfix-Suche: "hand" findet "handball"
+      ids = intersect(ids, union(keys.filter(function (k) { return k.lastIndexOf(w, 0) === 0; })
+                                     .map(function (k) { return d.tokens[k]; })));
+    });
+    if (tagSel.value) ids = intersect(ids, d.tags[tagSel.value]);
+    if (monthSel.value) ids = intersect(ids, d.months[monthSel.value]);
+    list = ids;
+    shown = 0;
+    body.innerHTML = "";
+    render(d.initial);
+    hits.textContent = ids === all ? "" : ids.length + " Treffer";
+  }
+
+  function render(n) {
+    var end = Math.min(list.length, shown + n), html = "";
+    for (var i = shown; i < end; i++) html += d.rows[list[i]];
+    if (html) body.insertAdjacentHTML("beforeend", html);
+    shown = end;
+    // Neu beobachten: ist der Sentinel noch sichtbar, kommt sofort der nächste Block
+    if (io && shown < list.length) { io.unobserve(sentinel); io.observe(sentinel); }
+  }
+
+  var timer;
+  q.addEventListener("input", function () { clearTimeout(timer); timer = setTimeout(search, 80); });
+  tagSel.addEventListener("change", search);
+  monthSel.addEventListener("change", search);
+
+  if ("IntersectionObserver" in window) {
+    io = new IntersectionObserver(function (entries) {
+      if (entries[0].isIntersecting) render(d.chunk);
+    }, { rootMargin: "600px" });
+    io.observe(sentinel);
+  } else {
+    render(list.length);
+  }
+
+  // Links auf ähnliche Events: Zeile ggf. erst rendern
+  function showHash() {
+    var id = location.hash.slice(1);
+    if (!id || document.getElementById(id)) return;
+    if (list !== all) { q.value = ""; tagSel.value = ""; monthSel.value = ""; search(); }
+    render(list.length);
+    var row = document.getElementById(id);
+    if (row) row.scrollIntoView();
+  }
+  window.addEventListener("hashchange", showHash);
+  showHash();
+})();
+</script>"""
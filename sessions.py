@@ -0,0 +1,155 @@
+import re
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import metrics
+import tokens
+import ai_client
+
+# --- KONFIGURATION ---
+# Gesprächs-Zustand für chat.py (eigene DB, evko.db bleibt reine Event-Datenbank):
+# pro Session der laufende Anfrage-Vektor, die Kandidaten der letzten vollen Suche,
+# eine Zusammenfassung älterer Runden und die Runden selbst.
+# Folgefragen ("und am Sonntag?") bewerten die bisherigen Kandidaten neu, statt von
+# vorne zu suchen. Folgefrage = Anschluss-Wort oder Datumsangabe UND inhaltlich nah am
+# laufenden Vektor. Fällt der beste verfeinerte Treffer deutlich hinter den Bestwert der
+# letzten vollen Suche zurück, sucht chat.py doch neu.
+# Alte Runden werden zusammengefasst -> Prompt bleibt beschränkt.
+SESSION_DB = "chat.db"
+FOLLOWUP_WEIGHT = 0.6      # Anteil der neuen Frage am laufenden Vektor
+FOLLOWUP_STARTS = ("und ", "auch ", "noch ", "dann ", "was ist mit ", "wie wäre es mit ", "gibt es auch ")
+FOLLOWUP_MIN_SIMILARITY = 0.3   # Kosinus neue Frage <-> laufender Vektor
+FOLLOWUP_SCORE_MARGIN = 0.1     # So weit darf der beste verfeinerte Score unter dem der vollen Suche liegen
+KEEP_TURNS = 2             # So viele letzte Runden (Frage + Antwort) bleiben wörtlich im Prompt
+HISTORY_TOKENS = 400       # Darüber wird zusammengefasst
+SUMMARY_TOKENS = 150
+WEEKDAYS = {"montag": 0, "dienstag": 1, "mittwoch": 2, "donnerstag": 3, "freitag": 4, "samstag": 5, "sonntag": 6}
+
+SUMMARY_PROMPT = """Fasse das bisherige Gespräch zwischen Nutzer und Event-Assistent in höchstens 3 Sätzen zusammen.
+Behalte: Wünsche des Nutzers (Art, Zeitraum, Ort, mit Kindern usw.) und bereits genannte Veranstaltungen."""
+
+
+def connect(path=SESSION_DB):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY, query_vector BLOB, candidates TEXT, summary TEXT,
+        created TIMESTAMP, updated TIMESTAMP
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, question TEXT, answer TEXT,
+        urls TEXT, tokens INTEGER, summarized INTEGER DEFAULT 0, created TIMESTAMP
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_session ON turns(session_id, summarized)")
+    try:
+        conn.execute("ALTER TABLE sessions ADD COLUMN best_score REAL")
+    except sqlite3.OperationalError: pass
+    conn.commit()
+    return conn
+
+
+def load(conn, session_id):
+    """Session als Dict (neu angelegt, falls unbekannt)"""
+    row = conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    if not row:
+        now = datetime.now().isoformat()
+        conn.execute("INSERT INTO sessions (id, candidates, summary, created, updated) VALUES (?, '[]', '', ?, ?)",
+                     (session_id, now, now))
+        conn.commit()
+        return {"id": session_id, "query_vector": None, "candidates": [], "summary": "", "best_score": None}
+    vector = np.frombuffer(row['query_vector'], dtype=np.float32) if row['query_vector'] else None
+    return {"id": session_id, "query_vector": vector, "candidates": json.loads(row['candidates'] or "[]"),
+            "summary": row['summary'] or "", "best_score": row['best_score']}
+
+
+def recent_turns(conn, session_id):
+    return conn.execute("SELECT id, question, answer, tokens FROM turns WHERE session_id = ? AND summarized = 0 ORDER BY id",
+                        (session_id,)).fetchall()
+
+
+def is_followup(session, question, query_vector):
+    """Anschluss-Wort oder Datumsangabe in der Frage und Kosinus zum laufenden Vektor >= FOLLOWUP_MIN_SIMILARITY"""
+    if session["query_vector"] is None or not session["candidates"]: return False
+    q = question.strip().lower()
+    if not q.startswith(FOLLOWUP_STARTS) and date_filter(q) is None: return False
+    v = np.asarray(query_vector, dtype=np.float32)
+    similarity = float(v @ session["query_vector"]) / ((np.linalg.norm(v) * np.linalg.norm(session["query_vector"])) or 1.0)
+    return similarity >= FOLLOWUP_MIN_SIMILARITY
+
+
+def refined_enough(session, best_score):
+    """Verfeinerte Treffer reichen, solange der beste nicht deutlich unter dem der letzten vollen Suche liegt"""
+    return session["best_score"] is None or best_score >= session["best_score"] - FOLLOWUP_SCORE_MARGIN
+
+
+def running_vector(session, query_vector, followup):
+    """Folgefrage: Mischung aus bisherigem und neuem Vektor (normalisiert), sonst nur die neue Frage"""
+    q = np.asarray(query_vector, dtype=np.float32)
+    if not followup: return q
+    mixed = FOLLOWUP_WEIGHT * q + (1 - FOLLOWUP_WEIGHT) * session["query_vector"]
+    return mixed / (np.linalg.norm(mixed) or 1.0)
+
+
+def date_filter(question, today=None):
+    """Erkennt Wochentage/heute/morgen/Wochenende in der Frage. Liefert eine Prüf-Funktion für start_iso oder None."""
+    today = today or datetime.now().date()
+    words = set(re.findall(r"\w+", question.lower()))
+    if "heute" in words:
+        day = today.isoformat()
+        return lambda iso: iso == day
+    if "morgen" in words:
+        day = (today + timedelta(days=1)).isoformat()
+        return lambda iso: iso == day
+    days = {WEEKDAYS[w] for w in words if w in WEEKDAYS}
+    if "wochenende" in words: days |= {5, 6}
+    if not days: return None
+    return lambda iso: bool(iso) and datetime.strptime(iso[:10], "%Y-%m-%d").weekday() in days
+
+
+def history_messages(session, turns):
+    """Zusammenfassung + letzte Runden als Chat-Nachrichten (kommen nach dem statischen System-Prompt)"""
+    messages = []
+    if session["summary"]:
+        messages.append({"role": "user", "content": f"Bisheriges Gespräch (Zusammenfassung): {session['summary']}"})
+        messages.append({"role": "assistant", "content": "Verstanden."})
+    for t in turns:
+        messages.append({"role": "user", "content": t['question']})
+        messages.append({"role": "assistant", "content": t['answer']})
+    return messages
+
+
+def save_turn(conn, session, question, answer, urls, query_vector, candidates=None, best_score=None):
+    """Runde speichern; `candidates` und `best_score` nur nach einer vollen Suche (Folgefragen verfeinern diese Menge)"""
+    now = datetime.now().isoformat()
+    conn.execute("INSERT INTO turns (session_id, question, answer, urls, tokens, created) VALUES (?, ?, ?, ?, ?, ?)",
+                 (session["id"], question, answer, json.dumps(urls), tokens.count_tokens(question) + tokens.count_tokens(answer), now))
+    if candidates is not None: session["candidates"], session["best_score"] = candidates, best_score
+    session["query_vector"] = np.asarray(query_vector, dtype=np.float32)
+    conn.execute("UPDATE sessions SET query_vector = ?, candidates = ?, best_score = ?, updated = ? WHERE id = ?",
+                 (session["query_vector"].tobytes(), json.dumps(session["candidates"]), session["best_score"], now, session["id"]))
+    conn.commit()
+
+
+def compact(conn, session):
+    """Fasst ältere Runden zusammen, sobald die wörtliche Historie HISTORY_TOKENS überschreitet"""
+    turns = recent_turns(conn, session["id"])
+    if len(turns) <= KEEP_TURNS or sum(t['tokens'] for t in turns) <= HISTORY_TOKENS: return False
+    old = turns[:-KEEP_TURNS]
+    text = "\n".join(f"Nutzer: {t['question']}\nAssistent: {t['answer']}" for t in old)
+    if session["summary"]: text = f"Bisherige Zusammenfassung: {session['summary']}\n\n{text}"
+    response = ai_client.chat_sync(
+        span="openai.summary",
+        model="gpt-4o-mini",
+        messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": text}],
+        max_tokens=SUMMARY_TOKENS,
+        temperature=0.2,
+    )
+    session["summary"] = response.choices[0].message.content.strip()
+    conn.execute("UPDATE sessions SET summary = ? WHERE id = ?", (session["summary"], session["id"]))
+    conn.executemany("UPDATE turns SET summarized = 1 WHERE id = ?", [(t['id'],) for t in old])
+    conn.commit()
+    metrics.inc("sessions.summarized", len(old))
+    return True
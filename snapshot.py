@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import argparse
+from datetime import datetime
+from collections import defaultdict
+
+import numpy as np
+
+import metrics
+import profiling
+import dedup
+import vector_store
+
+# --- KONFIGURATION ---
+# Lese-Snapshot für Abfragen (chat.py): nach jedem Pipeline-Lauf wird aus evko.db
+# eine unveränderliche, schlanke DB gebaut - nur kommende, kanonische Events,
+# nur die Spalten, die Abfragen brauchen, alle Vektoren eines Modells als EIN
+# zusammenhängender float32-Block (nach Datum sortiert), Indizes fertig.
+# Die Blöcke liegen als Vektor-Store-Dateien (vector_store.py) neben dem Snapshot und
+# werden per np.memmap geöffnet -> alle Chat-Prozesse teilen sich die Seiten im Page-Cache.
+# Die neue Datei ersetzt die alte per atomarem Rename: Leser sehen entweder den
+# alten oder den neuen Stand und warten nie auf einen Schreiber.
+DB_FILE = "evko.db"
+SNAPSHOT_FILE = "evko_read.db"
+VECTOR_SUFFIX = ".vec"     # <snapshot>_<modell-hash>_<zeitstempel>.vec, eine Datei pro Modell und Stand
+DESC_CHARS = 1000          # Beschreibung gekürzt (Chat nutzt ohnehin nur den Anfang)
+COLUMNS = ["url", "title", "tags", "date_str", "start_iso", "time_str", "location", "description",
+           "image_urls", "embedding_hash", "embedding_model"]
+
+
+def build(src=DB_FILE, dest=SNAPSHOT_FILE):
+    """Baut den Snapshot in eine temporäre Datei und tauscht ihn atomar aus. Liefert die Metadaten."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    source = sqlite3.connect(src)
+    dedup.init_column(source)
+    rows = source.execute(f"""SELECT {', '.join(COLUMNS)}, embedding FROM events
+                              WHERE start_iso >= ? AND {dedup.VISIBLE_CONDITION}
+                              ORDER BY start_iso, url""", (today,)).fetchall()
+    source.close()
+
+    # Vektoren pro Modell in Datums-Reihenfolge -> vec_row = Zeile im Block des Modells
+    blocks = defaultdict(list)
+    block_rows = defaultdict(list)
+    records = []
+    for row in rows:
+        rec = list(row[:len(COLUMNS)])
+        rec[COLUMNS.index("description")] = (rec[COLUMNS.index("description")] or "")[:DESC_CHARS]
+        model, vec_row = row[COLUMNS.index("embedding_model")], None
+        if row[-1] and model:
+            vec_row = len(blocks[model])
+            blocks[model].append(json.loads(row[-1]))
+            block_rows[model].append(rec)
+        records.append(rec + [vec_row])
+
+    tmp = dest + ".tmp"
+    if os.path.exists(tmp): os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    conn.execute(f"CREATE TABLE events ({', '.join(c + (' TEXT PRIMARY KEY' if c == 'url' else ' TEXT') for c in COLUMNS)}, vec_row INTEGER)")
+    conn.execute("CREATE TABLE vectors (model TEXT PRIMARY KEY, dim INTEGER, count INTEGER, start_iso TEXT, file TEXT)")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany(f"INSERT INTO events VALUES ({', '.join('?' * (len(COLUMNS) + 1))})", records)
+
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    files = set()
+    for model, vectors in blocks.items():
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # Block als eigene Datei (Name pro Stand, der alte Snapshot behält seine Datei)
+        name = f"{os.path.splitext(os.path.basename(dest))[0]}_{hashlib.md5(model.encode('utf-8')).hexdigest()[:8]}_{stamp}{VECTOR_SUFFIX}"
+        urls = [r[COLUMNS.index("url")] for r in block_rows[model]]
+        vector_store.write(os.path.join(os.path.dirname(dest) or ".", name), model, "float32", matrix.shape[1], [matrix],
+                           urls, [r[COLUMNS.index("embedding_hash")] for r in block_rows[model]])
+        files.add(name)
+        # Startdaten in Block-Reihenfolge (JSON) -> Leser filtert "ab heute" per Binärsuche
+        starts = [r[COLUMNS.index("start_iso")] for r in block_rows[model]]
+        conn.execute("INSERT INTO vectors VALUES (?, ?, ?, ?, ?)",
+                     (model, matrix.shape[1], matrix.shape[0], json.dumps(starts), name))
+
+    meta = {"built": datetime.now().isoformat(timespec="seconds"), "source": src, "today": today,
+            "events": len(records), "models": {m: len(v) for m, v in blocks.items()}}
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+    conn.execute("CREATE INDEX idx_events_start ON events(start_iso)")
+    conn.execute("CREATE INDEX idx_events_model_row ON events(embedding_model, vec_row)")
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.execute("VACUUM")
+    conn.close()
+    previous = _vector_files(dest) if os.path.exists(dest) else set()
+    os.replace(tmp, dest)
+    # Vektor-Dateien älterer Stände löschen; die des gerade ersetzten Snapshots bleibt für Leser,
+    # die ihn noch öffnen (offene memmaps bleiben auch nach dem Löschen gültig)
+    folder = os.path.dirname(dest) or "."
+    prefix = os.path.splitext(os.path.basename(dest))[0] + "_"
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith(VECTOR_SUFFIX) and name not in files | previous:
+            os.remove(os.path.join(folder, name))
+    return meta
+
+
+def _vector_files(path):
+    conn = connect(path)
+    try:
+        return {name for (name,) in conn.execute("SELECT file FROM vectors")}
+    except sqlite3.OperationalError:
+        return set()   # älteres Format (Matrix als BLOB)
+    finally:
+        conn.close()
+
+
+def connect(path=SNAPSHOT_FILE):
+    """
+    Nur-Lese-Verbindung. immutable=1: keine Sperren nötig, die Datei wird nie verändert, nur ersetzt.
+    Darf daher auch aus anderen Threads benutzt werden (Suche über mehrere Mandanten in chat.py).
+    """
+    return sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+
+
+class Snapshot:
+    """
+    Geöffneter Snapshot: Verbindung + Vektorblöcke (np.memmap). `current()` wechselt automatisch zur
+    neuen Datei; der alte Snapshot bleibt gültig, bis niemand mehr eine Referenz hält.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stamp = _stamp(path)
+        self.conn = connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.blocks = {}
+        folder = os.path.dirname(path) or "."
+        for model, starts, name in self.conn.execute("SELECT model, start_iso, file FROM vectors"):
+            self.blocks[model] = (vector_store.VectorStore(os.path.join(folder, name)).matrix, json.loads(starts))
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+_open = {}
+_lock = threading.Lock()
+
+
+def current(path=SNAPSHOT_FILE):
+    """
+    Aktueller Snapshot (oder None). Nach einem atomaren Austausch wird beim nächsten Aufruf neu geöffnet.
+    Der alte wird nicht geschlossen: andere Threads (Suche über mehrere Mandanten) können ihn noch benutzen.
+    """
+    if not path or not os.path.exists(path): return None
+    with _lock:
+        snap = _open.get(path)
+        if snap is None or snap.stamp != _stamp(path):
+            snap = _open[path] = Snapshot(path)
+            metrics.inc("snapshot.opened")
+        return snap
+
+
+@profiling.profiled("snapshot")
+@metrics.track_run("snapshot")
+def main():
+    parser = argparse.ArgumentParser(description="Lese-Snapshot für Abfragen bauen")
+    parser.add_argument("-out", default=SNAPSHOT_FILE, help="Zieldatei")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_FILE):
+        print(f"Datenbank {DB_FILE} nicht gefunden.")
+        return
+    with metrics.span("snapshot.build"):
+        meta = build(DB_FILE, args.out)
+    size = os.path.getsize(args.out)
+    print(f"✅ Snapshot {args.out}: {meta['events']} Events, Vektoren {meta['models']}, {size / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
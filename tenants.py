@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import profiling
+import scheduler
+import export
+
+# --- KONFIGURATION ---
+# Mandanten (Gemeinden): dieselbe Pipeline für viele Orte. Jeder Mandant ist ein Shard
+# mit eigenem Datenverzeichnis (evko.db, Lese-Snapshot, Vektor-Store, Website, Bilder).
+# Alle Skripte arbeiten mit relativen Pfaden -> sie laufen einfach im Verzeichnis des
+# Mandanten, EVKO_TENANT sagt ihnen, welche Konfiguration gilt.
+# Quellen sind konfigurierte Instanzen der Scraper: die Einträge überschreiben die
+# Konstanten des Scrapers (z.B. _SOURCE_START_B64, FIXED_LOCATION, HOME_TEAM_FILTER).
+# Fehlt eine Quelle beim Mandanten, überspringt der Scraper den Lauf.
+#
+#   tenants.json: {"default": id, "tenants": [{"id", "name", "dir", "sources": {quelle: {KONSTANTE: wert}}}]}
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TENANTS_FILE = os.getenv("EVKO_TENANTS", os.path.join(BASE_DIR, "tenants.json"))
+TENANT_ENV = "EVKO_TENANT"
+DEFAULT_TENANT = {"id": "korneuburg", "name": "Korneuburg", "dir": ".",
+                  "sources": {"evko": {}, "kinderwelt": {}, "handball": {}, "kicks": {}}}
+DEFAULT_WORKERS = int(os.getenv("EVKO_TENANT_WORKERS", "4"))
+LOG_FILE = "pipeline.log"
+# Gemeinsame Limits (ein OpenAI-Konto, ein Handball-Host): parallele Mandanten teilen sie sich,
+# jeder Kindprozess bekommt nur seinen Anteil. Standardwerte wie in ai_client.py / scraper_handball.py.
+SHARED_LIMITS = {
+    "EVKO_OPENAI_RPM": "500",
+    "EVKO_OPENAI_TPM": "200000",
+    "EVKO_OPENAI_CONCURRENCY": "8",
+    "EVKO_HANDBALL_RPS": "2.0",
+}
+
+# Pipeline pro Mandant: (Quelle oder None, Skript + Argumente). Quellen nur, wenn konfiguriert und fällig.
+PIPELINE = [
+    ("evko", ["scraper_evko.py", "-defer"]),
+    ("kinderwelt", ["scraper_kinderwelt.py", "-defer"]),
+    ("handball", ["scraper_handball.py"]),
+    ("kicks", ["scraper_kicks.py"]),
+    (None, ["images.py"]),
+    (None, ["ai_jobs.py"]),
+    (None, ["embedder.py"]),
+    (None, ["dedup.py"]),
+    (None, ["builder.py"]),
+    (None, ["snapshot.py"]),
+    (None, ["check_db.py", "-auto"]),
+    (None, ["export.py"]),
+]
+
+_config = None
+
+
+def load(path=TENANTS_FILE):
+    """(Standard-ID, {id: Mandant}). Ohne Datei: nur Korneuburg im Projektverzeichnis (wie bisher)."""
+    global _config
+    if _config is None:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            _config = (data.get("default"), {t["id"]: t for t in data["tenants"]})
+        else:
+            _config = (DEFAULT_TENANT["id"], {DEFAULT_TENANT["id"]: DEFAULT_TENANT})
+    return _config
+
+
+def get(tenant_id=None):
+    default, tenants = load()
+    tenant_id = tenant_id or default or next(iter(tenants))
+    if tenant_id not in tenants:
+        raise ValueError(f"Unbekannter Mandant: {tenant_id} (siehe {TENANTS_FILE})")
+    return tenants[tenant_id]
+
+
+def current():
+    """Mandant des laufenden Prozesses (EVKO_TENANT, sonst Standard)"""
+    return get(os.getenv(TENANT_ENV))
+
+
+def select(ids=None):
+    """Mandanten aus "a,b,c" (leer oder "all" = alle)"""
+    if not ids or ids == "all": return list(load()[1].values())
+    return [get(i.strip()) for i in ids.split(",") if i.strip()]
+
+
+def data_dir(tenant):
+    return os.path.normpath(os.path.join(BASE_DIR, tenant.get("dir") or os.path.join("tenants", tenant["id"])))
+
+
+def path(tenant, filename):
+    return os.path.join(data_dir(tenant), filename)
+
+
+def enabled(source, tenant=None):
+    return source in (tenant or current()).get("sources", {})
+
+
+def configure(namespace, source):
+    """
+    Überschreibt die Konstanten eines Scrapers (globals()) mit der Konfiguration der Quelle
+    beim aktuellen Mandanten. Unbekannte Schlüssel sind ein Fehler (Tippfehler fallen sofort auf).
+    """
+    tenant = current()
+    for key, value in (tenant.get("sources", {}).get(source) or {}).items():
+        if key not in namespace:
+            raise ValueError(f"Mandant {tenant['id']}: {source} kennt keine Einstellung {key}")
+        namespace[key] = value
+    return tenant
+
+
+def due_sources(tenant):
+    """Fällige Quellen laut Crawl-Scheduler (Datenbank des Mandanten)"""
+    db_file = path(tenant, scheduler.DB_FILE)
+    if not os.path.exists(db_file): return set(scheduler.SOURCES)
+    conn = sqlite3.connect(db_file)
+    scheduler.init_table(conn)
+    decisions = scheduler.plan(conn)
+    conn.close()
+    return {source for source, (due, _) in decisions.items() if due}
+
+
+def shared_env(parallel):
+    """Umgebung für Kindprozesse: gemeinsame Limits durch die Zahl gleichzeitiger Mandanten geteilt"""
+    env = dict(os.environ)
+    for name, default in SHARED_LIMITS.items():
+        value = float(env.get(name, default)) / max(1, parallel)
+        # Ganzzahlige Limits (RPM, TPM, Concurrency) bleiben ganzzahlig, mindestens 1
+        env[name] = str(max(1, int(value))) if "." not in default else f"{value:g}"
+    return env
+
+
+def run_tenant(tenant, full=False, parallel=1):
+    """Pipeline eines Mandanten nacheinander (eigene Prozesse im Datenverzeichnis). Liefert [(Schritt, Code, Sekunden)]."""
+    directory = data_dir(tenant)
+    os.makedirs(directory, exist_ok=True)
+    # Frischer Checkout: Datenbank aus dem Text-Export (data/) aufbauen
+    if not os.path.exists(os.path.join(directory, export.DB_FILE)) and os.path.exists(os.path.join(directory, export.DATA_DIR, "schema.sql")):
+        export.restore(os.path.join(directory, export.DATA_DIR), os.path.join(directory, export.DB_FILE))
+    due = set(scheduler.SOURCES) if full else due_sources(tenant)
+    env = dict(shared_env(parallel), **{TENANT_ENV: tenant["id"]})
+    results = []
+    with open(os.path.join(directory, LOG_FILE), "w", encoding="utf-8") as log:
+        for source, command in PIPELINE:
+            if source and (not enabled(source, tenant) or source not in due): continue
+            log.write(f"\n=== {' '.join(command)} ===\n")
+            log.flush()
+            t0 = time.perf_counter()
+            # Fehler eines Schritts stoppen den Mandanten nicht (wie always() im Workflow)
+            code = subprocess.call([sys.executable, os.path.join(BASE_DIR, command[0]), *command[1:]],
+                                   cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+            results.append((command[0], code, time.perf_counter() - t0))
+    return results
+
+
+def run(selected, workers=DEFAULT_WORKERS, full=False):
+    """Worker-Pool: Mandanten parallel, Schritte innerhalb eines Mandanten nacheinander"""
+    def _one(tenant):
+        t0 = time.perf_counter()
+        try:
+            results = run_tenant(tenant, full, parallel)
+        except Exception as e:
+            results = [("setup", str(e), 0.0)]
+        metrics.record_span(f"tenant.{tenant['id']}", time.perf_counter() - t0)
+        return tenant, results
+
+    parallel = max(1, min(workers, len(selected)))
+    failed = 0
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        for tenant, results in pool.map(_one, selected):
+            errors = [(step, code) for step, code, _ in results if code != 0]
+            failed += bool(errors)
+            metrics.inc("tenants.failed" if errors else "tenants.ok")
+            steps = ", ".join(f"{step[:-3] if step.endswith('.py') else step} {sec:.0f}s" for step, _, sec in results)
+            print(f"  {'❌' if errors else '✅'} {tenant['id']:<16} {steps}")
+            for step, code in errors:
+                print(f"      ⚠️ {step}: {code} (Log: {path(tenant, LOG_FILE)})")
+    return failed
+
+
+@profiling.profiled("tenants")
+@metrics.track_run("tenants")
+def main():
+    parser = argparse.ArgumentParser(description="Mandanten (Gemeinden): Übersicht und Pipeline-Lauf pro Shard")
+    parser.add_argument("-run", action="store_true", help="Pipeline für die Mandanten ausführen")
+    parser.add_argument("-tenants", help="Kommagetrennte Mandanten-IDs (Standard: alle, bei -run ohne den Standard-Mandanten)")
+    parser.add_argument("-workers", type=int, default=DEFAULT_WORKERS, help="So viele Mandanten gleichzeitig")
+    parser.add_argument("-full", action="store_true", help="Alle Quellen scrapen (Scheduler ignorieren)")
+    args = parser.parse_args()
+
+    selected = select(args.tenants)
+    if not args.run:
+        for tenant in selected:
+            print(f"  {tenant['id']:<16} {tenant['name']:<20} {data_dir(tenant):<40} {', '.join(tenant.get('sources', {}))}")
+        return
+
+    if not args.tenants:
+        # Der Standard-Mandant läuft über die Schritte im Workflow selbst, nicht ein zweites Mal hier
+        default = get()["id"]
+        selected = [t for t in selected if t["id"] != default]
+    if not selected:
+        print("Keine weiteren Mandanten - nichts zu tun.")
+        return
+    print(f"--- 🏘️  PIPELINE: {len(selected)} Mandanten, {args.workers} parallel ---")
+    failed = run(selected, args.workers, args.full)
+    if failed:
+        print(f"❌ {failed} Mandanten mit Fehlern.")
+        sys.exit(1)
+    print("✅ Alle Mandanten fertig.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import re
+
+# --- KONFIGURATION ---
+# Lokaler Tokenizer (gleiche Kodierung wie text-embedding-3-small / gpt-4o-mini Familie).
+# Ohne tiktoken wird grob geschätzt (ca. 4 Zeichen pro Token).
+ENCODING_NAME = "cl100k_base"
+CHARS_PER_TOKEN = 4
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(ENCODING_NAME)
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    if not text: return 0
+    if _encoding: return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text, max_tokens):
+    """Kürzt einen Text auf höchstens `max_tokens` Tokens (an einer Wortgrenze, falls geschätzt)"""
+    if not text or not max_tokens: return text
+    if _encoding:
+        ids = _encoding.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens: return text
+        return _encoding.decode(ids[:max_tokens])
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit: return text
+    cut = text[:limit]
+    m = re.search(r"\s\S*$", cut)
+    return cut[:m.start()] if m else cut
@@ -0,0 +1,133 @@
+import sqlite3
+import json
+import argparse
+
+import numpy as np
+
+# --- KONFIGURATION ---
+# Schnelle Vorauswahl über quantisierte (bei Matryoshka-Modellen zusätzlich gekürzte) Vektoren,
+# danach exakte Nachbewertung der Kandidaten mit den vollen Vektoren.
+DB_FILE = "evko.db"
+QUANT_DIMS = 256        # Kürzung nur für Matryoshka-trainierte Modelle (siehe MATRYOSHKA_MODELS)
+# Nur diese Modelle tragen die Information in den vorderen Dimensionen. Alle anderen
+# (z.B. lokale sentence-transformers) werden in voller Länge quantisiert.
+MATRYOSHKA_MODELS = ("openai/text-embedding-3-",)
+RERANK_FACTOR = 10      # Kandidaten pro gewünschtem Treffer
+MIN_CANDIDATES = 50
+BINARY_OVERSAMPLE = 10  # binary: Hamming-Vorauswahl x10, dann int8, dann exakt
+MODES = ("exact", "int8", "binary")
+HEADER_BYTES = 4        # float32 Skalierung
+
+# Aufbau eines Codes (Spalte embedding_q), dims = quant_dims(Modell, Dimension):
+#   [float32 Skalierung][dims x int8][dims / 8 Bytes Vorzeichen-Bits]
+# Beide Vorauswahl-Modi (int8 / binary) lesen damit dieselbe Spalte.
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def is_matryoshka(model):
+    return bool(model) and model.startswith(MATRYOSHKA_MODELS)
+
+
+def quant_dims(model, dim):
+    """Dimensionen im Code: gekürzt nur bei Matryoshka-Modellen, sonst der volle Vektor"""
+    return min(dim, QUANT_DIMS) if is_matryoshka(model) else dim
+
+
+def code_size(dims=QUANT_DIMS):
+    return HEADER_BYTES + dims + (dims + 7) // 8
+
+
+def encode(vector, model):
+    """Kürzt einen Vektor (nur Matryoshka-Modelle), normalisiert neu und quantisiert auf int8 + Vorzeichen-Bits"""
+    v = np.asarray(vector, dtype=np.float32)
+    v = v[:quant_dims(model, len(v))]
+    norm = np.linalg.norm(v)
+    if norm: v = v / norm
+    peak = float(np.max(np.abs(v))) if len(v) else 0.0
+    scale = np.float32(peak / 127 if peak else 1.0)
+    codes = np.round(v / scale).astype(np.int8)
+    bits = np.packbits(codes > 0)
+    return scale.tobytes() + codes.tobytes() + bits.tobytes()
+
+
+def load_codes(blobs, dims=QUANT_DIMS):
+    """Baut aus den Blobs Matrizen: (int8 Codes, Skalierungen, gepackte Bits)"""
+    buf = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), code_size(dims))
+    scales = buf[:, :HEADER_BYTES].copy().view(np.float32).ravel()
+    codes = buf[:, HEADER_BYTES:HEADER_BYTES + dims].view(np.int8)
+    bits = buf[:, HEADER_BYTES + dims:]
+    return codes, scales, bits
+
+
+def candidate_count(top_k, total):
+    return min(total, max(MIN_CANDIDATES, top_k * RERANK_FACTOR))
+
+
+def top_candidates(scores, n):
+    """Indizes der n besten Scores (unsortiert)"""
+    if n >= len(scores): return np.arange(len(scores))
+    return np.argpartition(-scores, n - 1)[:n]
+
+
+def select_candidates(query_vector, blobs, top_k, mode="int8", dims=QUANT_DIMS):
+    """Indizes (in `blobs`) der Kandidaten für die exakte Nachbewertung"""
+    codes, scales, bits = load_codes(blobs, dims)
+    q = np.asarray(query_vector, dtype=np.float32)[:dims]
+    q = q / (np.linalg.norm(q) or 1.0)
+    n = candidate_count(top_k, len(blobs))
+
+    pool = np.arange(len(blobs))
+    if mode == "binary":
+        # Hamming-Distanz der Vorzeichen (negiert, damit höher = ähnlicher)
+        hamming = _POPCOUNT[bits ^ np.packbits(q > 0)].sum(axis=1, dtype=np.int32)
+        pool = top_candidates(-hamming, n * BINARY_OVERSAMPLE)
+
+    scores = (codes[pool] @ q) * scales[pool]
+    return pool[top_candidates(scores, n)]
+
+
+def init_column(conn):
+    try:
+        conn.execute("ALTER TABLE events ADD COLUMN embedding_q BLOB")
+        print("✅ Spalte 'embedding_q' wurde hinzugefügt.")
+    except sqlite3.OperationalError: pass
+
+
+def _stale(model, size):
+    """Code fehlt, oder Kürzung passt nicht zum Modell (gekürzt ohne Matryoshka-Training / umgekehrt)"""
+    return size is None or (size == code_size()) != is_matryoshka(model)
+
+
+def backfill(conn, rebuild=False):
+    """Erzeugt fehlende oder unpassende (mit -rebuild alle) Codes aus den gespeicherten Vektoren"""
+    rows = conn.execute("SELECT url, embedding_model, length(embedding_q) FROM events WHERE embedding IS NOT NULL").fetchall()
+    urls = [url for url, model, size in rows if rebuild or _stale(model, size)]
+    if not urls: return 0
+    updates = []
+    for i in range(0, len(urls), 500):
+        part = urls[i:i + 500]
+        for url, emb, model in conn.execute(f"SELECT url, embedding, embedding_model FROM events WHERE url IN ({','.join('?' * len(part))})", part):
+            updates.append((encode(json.loads(emb), model), url))
+    conn.executemany("UPDATE events SET embedding_q = ? WHERE url = ?", updates)
+    conn.commit()
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantisierte Vektor-Codes für die Schnellsuche")
+    parser.add_argument("-rebuild", action="store_true", help="Alle Codes neu erzeugen (z.B. nach Änderung von QUANT_DIMS / MATRYOSHKA_MODELS)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    init_column(conn)
+    done = backfill(conn, rebuild=args.rebuild)
+    full, quant = conn.execute("SELECT COALESCE(SUM(length(embedding)), 0), COALESCE(SUM(length(embedding_q)), 0) FROM events").fetchone()
+    conn.close()
+    print(f"--- 🧮 VECTOR INDEX [{QUANT_DIMS} Dimensionen für {', '.join(MATRYOSHKA_MODELS)}*, sonst voll] ---")
+    print(f"   Codes erzeugt: {done}")
+    print(f"   Speicher: Vektoren {full / 1024:.0f} KB | Codes {quant / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+import json
+import struct
+import sqlite3
+import argparse
+
+import numpy as np
+
+import metrics
+import profiling
+
+# --- KONFIGURATION ---
+# Vektor-Store als eine Binärdatei, die Leser per np.memmap öffnen: mehrere Prozesse
+# (Chat-Worker, Builder) teilen sich dieselben Seiten im Page-Cache, nichts wird
+# geparst, der Start ist sofort. Geschrieben wird nur vom Embedder: neue/geänderte
+# Vektoren werden direkt hinter die Matrix geschrieben (alte Zeilen bleiben unberührt,
+# veraltete als Verschnitt), danach ID-Tabelle und zuletzt der Header. Offene Leser
+# sehen weiter ihre alten Zeilen. Zu viel Verschnitt (oder kaputte Datei nach einem
+# Abbruch) -> kompakt neu schreiben und per atomarem Rename ersetzen.
+#
+#   [Header 64 B][Matrix count x dim (float32/float16), ab Byte 64][ID-Tabelle JSON]
+#   ID-Tabelle: {"model": ..., "ids": [url, ...], "hashes": [embedding_hash, ...]}  (Zeile i)
+DB_FILE = "evko.db"
+STORE_FILE = "evko_vectors.bin"
+MAGIC = b"EVKOVEC1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIQQQQ")   # magic, version, dtype, dim, reserviert, count, matrix_off, ids_off, ids_len
+HEADER_SIZE = 64                        # Matrix beginnt 64-Byte-ausgerichtet
+DTYPES = {0: "float32", 1: "float16"}
+DEFAULT_DTYPE = os.getenv("EVKO_VECTOR_DTYPE", "float32")
+COMPACT_RATIO = 0.25                    # Anteil veralteter Zeilen, ab dem neu geschrieben wird
+COPY_ROWS = 4096
+
+
+class VectorStore:
+    """Nur-Lese-Sicht auf eine Store-Datei (Matrix als np.memmap)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stamp = _stamp(path)
+        with open(path, "rb") as f:
+            magic, version, dtype, dim, _, count, matrix_off, ids_off, ids_len = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: kein Vektor-Store (Version {VERSION})")
+            f.seek(ids_off)
+            table = json.loads(f.read(ids_len))
+        self.dtype = DTYPES[dtype]
+        self.dim = dim
+        self.model = table["model"]
+        self.ids = table["ids"]
+        self.hashes = table["hashes"]
+        self.matrix = (np.memmap(path, dtype=self.dtype, mode="r", offset=matrix_off, shape=(count, dim))
+                       if count else np.empty((0, dim), dtype=self.dtype))
+        # Angehängte Zeilen überschreiben frühere Zeilen derselben URL
+        self.index = {url: i for i, url in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, url, embedding_hash=None):
+        """Zeile der URL oder None (auch wenn der Hash nicht mehr zum Text passt)"""
+        i = self.index.get(url)
+        if i is None or (embedding_hash is not None and self.hashes[i] != embedding_hash): return None
+        return i
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+_open = {}
+
+
+def current(path=STORE_FILE):
+    """Geöffneter Store (oder None); nach einem Austausch der Datei wird neu geöffnet"""
+    if not path or not os.path.exists(path): return None
+    store = _open.get(path)
+    if store is None or store.stamp != _stamp(path):
+        try:
+            store = _open[path] = VectorStore(path)
+        except (ValueError, KeyError, struct.error):
+            # Anhängen läuft gerade (Header noch alt): bisherige Sicht bleibt gültig
+            metrics.inc("vector_store.open_failed")
+            return store
+        metrics.inc("vector_store.opened")
+    return store
+
+
+def write(path, model, dtype, dim, blocks, ids, hashes):
+    """Schreibt eine komplette Store-Datei (blocks: Folge von Matrizen) und ersetzt `path` atomar"""
+    code = {v: k for k, v in DTYPES.items()}[dtype]
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * HEADER_SIZE)
+        count = 0
+        for block in blocks:
+            if len(block):
+                f.write(np.ascontiguousarray(block, dtype=dtype).tobytes())
+                count += len(block)
+        ids_off = f.tell()
+        table = json.dumps({"model": model, "ids": ids, "hashes": hashes}, ensure_ascii=False).encode('utf-8')
+        f.write(table)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, code, dim, 0, count, HEADER_SIZE, ids_off, len(table)))
+        f.flush()
+        os.fsync(f.fileno())
+    if count != len(ids): raise ValueError("Anzahl Vektoren passt nicht zur ID-Tabelle")
+    os.replace(tmp, path)
+
+
+def append(path, rows, model, ids, hashes):
+    """
+    Hängt Zeilen an die Matrix an, ohne die vorhandenen zu kopieren: neue Zeilen ab dem Ende
+    der Matrix (über die alte ID-Tabelle), dann die neue ID-Tabelle, zuletzt der Header.
+    """
+    with open(path, "r+b") as f:
+        magic, version, code, dim, _, count, matrix_off, ids_off, _ = HEADER.unpack(f.read(HEADER.size))
+        f.seek(ids_off)
+        f.write(np.ascontiguousarray(rows, dtype=DTYPES[code]).tobytes())
+        new_ids_off = f.tell()
+        table = json.dumps({"model": model, "ids": ids, "hashes": hashes}, ensure_ascii=False).encode('utf-8')
+        f.write(table)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        # Header erst, wenn Zeilen und Tabelle auf der Platte sind
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, code, dim, 0, count + len(rows), matrix_off, new_ids_off, len(table)))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _chunks(matrix, rows=None):
+    """Zeilen einer (memmap-)Matrix blockweise, damit nie alles gleichzeitig im Speicher liegt"""
+    rows = np.arange(len(matrix)) if rows is None else np.asarray(rows, dtype=np.int64)
+    for i in range(0, len(rows), COPY_ROWS):
+        yield matrix[rows[i:i + COPY_ROWS]]
+
+
+def _parse(conn, urls):
+    """Vektoren als JSON aus der DB (nur für die übergebenen URLs)"""
+    out = {}
+    for i in range(0, len(urls), 500):
+        part = urls[i:i + 500]
+        for url, emb in conn.execute(f"SELECT url, embedding FROM events WHERE url IN ({','.join('?' * len(part))})", part):
+            if emb: out[url] = json.loads(emb)
+    return out
+
+
+def sync(conn, model, path=STORE_FILE, dtype=DEFAULT_DTYPE):
+    """
+    Gleicht den Store mit den Vektoren des Modells in der DB ab. Neue/geänderte Vektoren
+    werden angehängt; bei viel Verschnitt (oder anderem Modell/dtype, kaputter Datei) wird
+    kompakt neu geschrieben. Liefert (angehängt, kompaktiert).
+    """
+    current_rows = dict(conn.execute("SELECT url, embedding_hash FROM events WHERE embedding IS NOT NULL AND embedding_model = ?",
+                                     (model,)).fetchall())
+    try:
+        store = VectorStore(path) if os.path.exists(path) else None
+    except (ValueError, KeyError, struct.error):
+        store = None   # z.B. Abbruch mitten im Anhängen -> aus der DB neu aufbauen
+    if store and (store.model != model or store.dtype != dtype): store = None
+
+    todo = [url for url, h in current_rows.items() if store is None or store.row(url, h) is None]
+    parsed = _parse(conn, todo)
+    todo = [url for url in todo if url in parsed]
+    new = np.asarray([parsed[u] for u in todo], dtype=np.float32)
+    dim = store.dim if store else (new.shape[1] if len(new) else 0)
+    if not dim: return 0, False
+
+    total = (len(store) if store else 0) + len(todo)
+    dead = total - len(current_rows)
+    if store and not todo and dead <= COMPACT_RATIO * total: return 0, False
+
+    if store and dead <= COMPACT_RATIO * total:
+        # Anhängen: alte Zeilen bleiben, wo sie sind
+        append(path, new, model, store.ids + todo, store.hashes + [current_rows[u] for u in todo])
+        return len(todo), False
+
+    # Kompaktieren: nur noch gültige Zeilen
+    fresh = set(todo)
+    keep = [(url, store.row(url, h)) for url, h in current_rows.items() if url not in fresh] if store else []
+    keep = [(url, i) for url, i in keep if i is not None]
+    old = _chunks(store.matrix, [i for _, i in keep]) if keep else []
+    write(path, model, dtype, dim, [*old, new],
+          [u for u, _ in keep] + todo, [current_rows[u] for u, _ in keep] + [current_rows[u] for u in todo])
+    return len(todo), True
+
+
+def _lookup(conn, urls, hashes, path, model):
+    store = current(path)
+    if store and model and store.model != model: store = None   # Vektoren anderer Modelle nie mischen
+    rows = [store.row(u, h) if store else None for u, h in zip(urls, hashes)]
+    missing = [i for i, r in enumerate(rows) if r is None]
+    parsed = _parse(conn, [urls[i] for i in missing]) if missing else {}
+    metrics.inc("vector_store.hits", len(urls) - len(missing))
+    metrics.inc("vector_store.misses", len(missing))
+    return store, rows, missing, parsed
+
+
+def load(conn, urls, hashes, model=None, path=STORE_FILE):
+    """float32-Matrix zu (url, embedding_hash): aus dem Store, Fehlendes/Veraltetes als JSON aus der DB"""
+    store, rows, missing, parsed = _lookup(conn, urls, hashes, path, model)
+    dim = store.dim if store else len(next(iter(parsed.values()), []))
+    out = np.zeros((len(urls), dim), dtype=np.float32)
+    hit = [i for i, r in enumerate(rows) if r is not None]
+    if hit: out[hit] = store.matrix[[rows[i] for i in hit]]
+    for i in missing:
+        if urls[i] in parsed: out[i] = parsed[urls[i]]
+    return out
+
+
+def scores(conn, urls, hashes, query_vector, model=None, path=STORE_FILE):
+    """Skalarprodukte mit dem Anfrage-Vektor. Ein Matrix-Produkt über den ganzen Store, ohne Kopie der Zeilen."""
+    store, rows, missing, parsed = _lookup(conn, urls, hashes, path, model)
+    q = np.asarray(query_vector, dtype=np.float32)
+    out = np.full(len(urls), -np.inf, dtype=np.float32)
+    hit = [i for i, r in enumerate(rows) if r is not None]
+    if hit:
+        all_scores = np.concatenate([block @ q for block in _chunks(store.matrix)]) if store.dtype != "float32" else store.matrix @ q
+        out[hit] = all_scores[[rows[i] for i in hit]]
+    for i in missing:
+        if urls[i] in parsed: out[i] = np.dot(parsed[urls[i]], q)
+    return out
+
+
+@profiling.profiled("vector_store")
+@metrics.track_run("vector_store")
+def main():
+    parser = argparse.ArgumentParser(description="Vektor-Store (memmap) aus evko.db aufbauen/abgleichen")
+    parser.add_argument("-model", help="Modell-Kennung (Standard: häufigstes Modell in der DB)")
+    parser.add_argument("-dtype", default=DEFAULT_DTYPE, choices=list(DTYPES.values()))
+    parser.add_argument("-rebuild", action="store_true", help="Store komplett neu schreiben")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    model = args.model or (conn.execute("""SELECT embedding_model FROM events WHERE embedding IS NOT NULL
+                                           GROUP BY embedding_model ORDER BY COUNT(*) DESC LIMIT 1""").fetchone() or [None])[0]
+    if not model:
+        print("Keine Vektoren in der DB.")
+        return
+    if args.rebuild and os.path.exists(STORE_FILE): os.remove(STORE_FILE)
+    with metrics.span("vector_store.sync"):
+        appended, compacted = sync(conn, model, STORE_FILE, args.dtype)
+    conn.close()
+    store = current(STORE_FILE)
+    print(f"✅ {STORE_FILE}: {len(store.index) if store else 0} Events, {len(store) if store else 0} Zeilen "
+          f"({args.dtype}), +{appended}{' (kompaktiert)' if compacted else ''}")
+
+
+if __name__ == "__main__":
+    main()